@@ -4,12 +4,42 @@
 # 时间单位：年
 # =========================================================
 
+import io
+import os
+import time
+import uuid
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import joblib
-import os
+
+from rsf import core
+from rsf.cache import PredictionCache, combined_stats
+from rsf.engine import FlatForest, compile_forest
+from rsf.explain import TreeExplainer, cohort_importance
+from rsf.incremental import IncrementalPredictor, TreeIndex
+from rsf.metrics import METRICS
+from rsf.plot import (SurvivalCurveRenderer, calibration_plot_spec, importance_bar_spec, sensitivity_curve_spec,
+                      sensitivity_heatmap_spec, shap_waterfall_spec, survival_curve_spec)
+from rsf.progressive import predict_progressive
+from rsf.registry import ModelRegistry
+from rsf.sensitivity import SWEEP_POINTS, continuous_features, sensitivity_sweep
+from rsf.startup import warm_up
+from rsf.surrogate import LatencyGuard, load_surrogate
+from rsf.survival import SurvivalMatrix
+from rsf.validation import (VALIDATION_BOOTSTRAP, bootstrap, calibration_table, metrics_table,
+                            validation_set_from_cohort)
+from rsf.core import (
+    FEATURE_CONFIG,
+    FEATURE_LABEL_MAP,
+    SURVIVAL_HORIZONS,
+    build_input_frame,
+    input_summary,
+    read_cohort_file,
+    score_cohort,
+    survival_bands,
+    validate_cohort,
+)
 
 # =========================================================
 # 🎨 页面配置
@@ -180,131 +210,104 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # =========================================================
-# 📋 特征标签映射
+# 🔧 模型加载
 # =========================================================
-FEATURE_LABEL_MAP = {
-    "post_dm_acarbose_Yes": "α-glucosidase inhibitors",
-    "post_htn_raas_Yes": "RAAS inhibitors",
-    "post_dm_metformin_Yes": "Metformin",
-    "入院年龄": "Age",
-    "尿素氮": "Blood urea nitrogen",
-    "肌酸激酶": "Creatine Kinase",
-    "渗透压": "Serum Osmolality",
-    "葡萄糖": "Glucose",
-    "CCI_score": "CCI score",
-    "纤维蛋白原": "Fibrinogen"
-}
-
-LABEL_FEATURE_MAP = {v: k for k, v in FEATURE_LABEL_MAP.items()}
+def compile_engine(model):
+    """编译为展平数组引擎；无法编译时退回 sksurv 模型"""
+    try:
+        return compile_forest(model)
+    except (AttributeError, ValueError):
+        return model
+
+
+@st.cache_resource
+def load_registry():
+    """所有会话共享的模型注册表：各版本按需加载、按内存上限淘汰，模型目录改变时自动重新扫描"""
+    registry = ModelRegistry(compile_model=compile_engine)
+    
+    # 缓存指标按当前已加载的各版本合计；只引用注册表，不持有任何版本的缓存，被淘汰的版本可以释放
+    def cache_gauge(field):
+        return lambda: combined_stats([
+            cache for cache in (loaded.cached_resource("prediction_cache") for loaded in registry.loaded())
+            if cache is not None])[field]
+    
+    for field in ("hit_rate", "hits", "misses", "entries"):
+        METRICS.register_gauge(f"prediction_cache_{field}", cache_gauge(field))
+    return registry
+
+
+def load_session_model():
+    """当前会话使用的模型版本（LoadedModel）与 A/B 分组；没有可用模型时为 (None, None)
+    
+    每次运行只解析一次：新版本上线后，已打开的会话在下一次交互时切换，不需要重启。
+    """
+    if "session_key" not in st.session_state:
+        st.session_state["session_key"] = uuid.uuid4().hex
+    try:
+        return load_registry().model_for_session(st.session_state["session_key"])
+    except Exception as e:
+        st.error(f"Model loading error: {e}")
+        return None, None
+
+
+def load_prediction_cache(loaded):
+    """该模型版本的所有会话共享的预测缓存（只缓存落在界面步长网格上的输入）"""
+    return loaded.resource("prediction_cache",
+                           lambda: PredictionCache(loaded.engine, model_digest=loaded.version.digest))
+
+
+def load_tree_index(loaded):
+    """该模型版本的所有会话共享的特征 → 树索引（增量重新预测用）"""
+    model = loaded.engine
+    return loaded.resource("tree_index", lambda: TreeIndex(model) if isinstance(model, FlatForest) else None)
+
+
+def session_predictor(loaded):
+    """当前会话的增量预测器：保存上一次输入在各树中的叶节点，只重新遍历受影响的树"""
+    predictor = st.session_state.get("incremental_predictor")
+    if predictor is None or predictor.forest is not loaded.engine:
+        predictor = IncrementalPredictor(loaded.engine, load_tree_index(loaded))
+        st.session_state["incremental_predictor"] = predictor
+    return predictor
+
+
+def load_explainer(loaded):
+    """该模型版本的所有会话共享的 TreeSHAP 解释器；模型缺少节点样本数时为 None"""
+    def build():
+        try:
+            return TreeExplainer(loaded.engine)
+        except (AttributeError, ValueError):
+            return None
+    
+    return loaded.resource("explainer", build)
+
+
+@st.cache_resource
+def load_surrogate_model():
+    """所有会话共享的蒸馏代理模型（python -m rsf distill 生成）；没有时为 None"""
+    try:
+        return load_surrogate()
+    except Exception as e:
+        st.error(f"Surrogate model loading error: {e}")
+        return None
+
+
+def load_latency_guard(loaded):
+    """该模型版本的所有会话共享的延迟预算判断"""
+    return loaded.resource("latency_guard", LatencyGuard)
 
-# =========================================================
-# 📊 特征配置
-# =========================================================
-FEATURE_CONFIG = {
-    "Age": {
-        "type": "number",
-        "min": 18.0,
-        "max": 100.0,
-        "default": 65.0,
-        "step": 1.0,
-        "unit": "years",
-        "description": "Patient age at admission"
-    },
-    "Blood urea nitrogen": {
-        "type": "number",
-        "min": 0.0,
-        "max": 50.0,
-        "default": 6.0,
-        "step": 0.1,
-        "unit": "mmol/L",
-        "description": "Blood urea nitrogen level"
-    },
-    "Creatine Kinase": {
-        "type": "number",
-        "min": 0.0,
-        "max": 5000.0,
-        "default": 100.0,
-        "step": 1.0,
-        "unit": "U/L",
-        "description": "Creatine kinase level"
-    },
-    "Serum Osmolality": {
-        "type": "number",
-        "min": 250.0,
-        "max": 350.0,
-        "default": 290.0,
-        "step": 1.0,
-        "unit": "mOsm/kg",
-        "description": "Serum osmolality"
-    },
-    "Glucose": {
-        "type": "number",
-        "min": 2.0,
-        "max": 40.0,
-        "default": 6.0,
-        "step": 0.1,
-        "unit": "mmol/L",
-        "description": "Blood glucose level"
-    },
-    "CCI score": {
-        "type": "number",
-        "min": 0.0,
-        "max": 20.0,
-        "default": 2.0,
-        "step": 1.0,
-        "unit": "",
-        "description": "Charlson Comorbidity Index"
-    },
-    "Fibrinogen": {
-        "type": "number",
-        "min": 0.0,
-        "max": 10.0,
-        "default": 3.0,
-        "step": 0.1,
-        "unit": "g/L",
-        "description": "Fibrinogen level"
-    },
-    "α-glucosidase inhibitors": {
-        "type": "select",
-        "options": ["No", "Yes"],
-        "default": "No",
-        "description": "α-glucosidase inhibitors use"
-    },
-    "RAAS inhibitors": {
-        "type": "select",
-        "options": ["No", "Yes"],
-        "default": "No",
-        "description": "RAAS inhibitors use"
-    },
-    "Metformin": {
-        "type": "select",
-        "options": ["No", "Yes"],
-        "default": "No",
-        "description": "Metformin use"
-    }
-}
 
-# =========================================================
-# 🔧 模型加载
-# =========================================================
 @st.cache_resource
-def load_model():
-    """加载 RSF 模型"""
-    possible_paths = [
-        "rsf_model.joblib",
-        "rsf_model_compressed.joblib",
-        r"C:\Users\Serendipity\Desktop\cjj\rsf_model.joblib",
-        r"C:\Users\Serendipity\Desktop\cjj\rsf_model_compressed.joblib",
-    ]
-    
-    for path in possible_paths:
-        if os.path.exists(path):
-            try:
-                return joblib.load(path)
-            except Exception as e:
-                st.error(f"Model loading error: {e}")
-                return None
-    return None
+def load_curve_renderer():
+    """所有会话共享的生存曲线渲染器（坐标轴与样式只构建一次）"""
+    return SurvivalCurveRenderer()
+
+
+def warm_up_app(loaded):
+    """每个模型版本只做一次：导入延迟的依赖、一次假预测与一次绘图，返回启动报告"""
+    with st.spinner("Warming up the model..."):
+        return loaded.resource(
+            "startup", lambda: warm_up(loaded.engine, loaded.feature_list, renderer=load_curve_renderer()).mark_ready())
 
 # =========================================================
 # 🔧 特征列表加载
@@ -312,145 +315,355 @@ def load_model():
 @st.cache_data
 def load_feature_list():
     """加载特征列表"""
-    possible_paths = [
-        "selected_features.txt",
-        r"C:\Users\Serendipity\Desktop\cjj\selected_features.txt",
-    ]
-    
-    for path in possible_paths:
-        if os.path.exists(path):
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    features = [line.strip() for line in f if line.strip()]
-                if features:
-                    return features
-            except:
-                pass
-    
-    # 默认特征列表
-    return [
-        "入院年龄", "尿素氮", "肌酸激酶", "渗透压", "葡萄糖",
-        "CCI_score", "纤维蛋白原", "post_dm_acarbose_Yes",
-        "post_htn_raas_Yes", "post_dm_metformin_Yes"
-    ]
+    return core.load_feature_list()
 
 # =========================================================
-# 🔧 获取生存概率（正确的阶梯函数插值）
+# 📂 队列批量评分页面
 # =========================================================
-def get_survival_probability(surv_func, target_time):
-    """从生存函数获取指定时间点的生存概率"""
-    times = surv_func.x
-    probs = surv_func.y
+def render_cohort_tab(loaded, feature_list, demo_mode):
+    """队列文件上传、校验、分块评分与结果下载"""
+    st.markdown("### 📂 Cohort Scoring")
+    st.markdown(
+        "Upload a CSV or Parquet file with one patient per row and the columns: "
+        + ", ".join(f"`{f}`" for f in feature_list)
+        + ". Binary variables accept `Yes`/`No` or `1`/`0`."
+    )
+    
+    uploaded_file = st.file_uploader("Cohort file", type=["csv", "parquet", "pq"])
+    if uploaded_file is None:
+        return
     
-    if target_time <= times[0]:
-        return 1.0
-    if target_time >= times[-1]:
-        return probs[-1]
+    if demo_mode:
+        st.error("Cohort scoring requires the model file `rsf_model.joblib`.")
+        return
+    model = loaded.engine
+    
+    try:
+        cohort_df = read_cohort_file(uploaded_file)
+        features, issues = validate_cohort(cohort_df, feature_list)
+    except Exception as e:
+        st.error(f"Could not read cohort file: {e}")
+        return
+    
+    st.markdown(f"**{len(cohort_df):,}** rows loaded, **{len(features):,}** valid, "
+                f"**{len(cohort_df) - len(features):,}** rejected.")
+    if len(issues):
+        with st.expander(f"⚠️ {len(issues):,} validation issues"):
+            st.dataframe(issues.head(1000), use_container_width=True, hide_index=True)
+    
+    explain = st.checkbox(
+        "🧭 Feature importance (TreeSHAP)",
+        value=False,
+        help="Also compute exact TreeSHAP values for every patient and summarize the mean absolute contribution of each feature"
+    )
+    full_curves = st.checkbox(
+        "📈 Full survival curves",
+        value=False,
+        help="Also offer every patient's survival curve at all model time points as a Parquet file (one column per time point)"
+    )
+    if len(features) == 0 or not st.button("🚀 Score Cohort", use_container_width=True):
+        return
+    
+    progress = st.progress(0.0, text="Scoring...")
+    
+    def update_progress(done, total):
+        progress.progress(done / total, text=f"Scored {done:,} / {total:,} patients")
+    
+    if full_curves:
+        results, curves = score_cohort(model, features, progress_callback=update_progress, return_curves=True)
+    else:
+        results, curves = score_cohort(model, features, progress_callback=update_progress), None
+    output = cohort_df.loc[results.index].join(results)
+    output["model_version"] = loaded.version.version
+    
+    st.success(f"Scored {len(results):,} patients.")
+    st.dataframe(output.head(1000), use_container_width=True)
+    st.download_button(
+        "⬇️ Download Results (CSV)",
+        data=output.to_csv(index_label="row").encode('utf-8-sig'),
+        file_name="cohort_predictions.csv",
+        mime="text/csv",
+        use_container_width=True,
+    )
+    if curves is not None:
+        try:
+            buffer = io.BytesIO()
+            curves.to_parquet(buffer)
+            st.download_button(
+                "⬇️ Download Survival Curves (Parquet)",
+                data=buffer.getvalue(),
+                file_name="cohort_survival_curves.parquet",
+                mime="application/octet-stream",
+                use_container_width=True,
+            )
+        except ImportError:
+            st.warning("Writing survival curves as Parquet requires `pyarrow`.")
+    
+    explainer = load_explainer(loaded) if explain else None
+    if explain and explainer is None:
+        st.warning("Feature importance needs node sample counts, which this model file does not include.")
+    if explainer is not None:
+        render_cohort_importance(explainer, features)
+
+
+def render_validation_tab(loaded, feature_list, demo_mode):
+    """带随访数据的队列上的模型验证：区分度、Brier 评分、bootstrap 置信区间与校准图"""
+    st.markdown("### ✅ Model Validation")
+    st.markdown(
+        "Upload a cohort with the model columns plus the observed follow-up time (years) and event indicator "
+        "(`Yes`/`No` or `1`/`0`). The cohort is scored once; Harrell's and Uno's C, time-dependent AUC and "
+        "Brier scores at 1–4 years are computed with bootstrap confidence intervals."
+    )
+    
+    uploaded_file = st.file_uploader("Validation cohort file", type=["csv", "parquet", "pq"], key="validation_file")
+    if uploaded_file is None:
+        return
     
-    # 阶梯函数：取左边界值
-    idx = np.searchsorted(times, target_time, side='right') - 1
-    return probs[max(0, idx)]
+    if demo_mode:
+        st.error("Validation requires the model file `rsf_model.joblib`.")
+        return
+    
+    try:
+        cohort_df = read_cohort_file(uploaded_file)
+    except Exception as e:
+        st.error(f"Could not read cohort file: {e}")
+        return
+    
+    columns = [str(c) for c in cohort_df.columns]
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        time_column = st.selectbox("Follow-up time column", columns,
+                                   index=columns.index("time") if "time" in columns else 0)
+    with col2:
+        event_column = st.selectbox("Event column", columns,
+                                    index=columns.index("event") if "event" in columns else 0)
+    with col3:
+        n_replicates = st.number_input("Bootstrap replicates", min_value=0, max_value=10000,
+                                       value=VALIDATION_BOOTSTRAP, step=100)
+    if not st.button("✅ Validate Model", use_container_width=True):
+        return
+    
+    try:
+        validation, issues = validation_set_from_cohort(loaded.engine, cohort_df, feature_list,
+                                                        time_column, event_column)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    
+    summary = validation.summary()
+    st.markdown(f"**{summary['patients']:,}** patients, **{summary['events']:,}** events, "
+                f"**{issues['Row'].nunique():,}** rows rejected, "
+                f"median follow-up **{summary['median_follow_up']:.2f}** years.")
+    if len(issues):
+        with st.expander(f"⚠️ {len(issues):,} validation issues"):
+            st.dataframe(issues.head(1000), use_container_width=True, hide_index=True)
+    skipped = [h for h in summary["horizons"] if h not in summary["evaluated_horizons"]]
+    if skipped:
+        st.warning("Not evaluated (outside the observed follow-up): "
+                   + ", ".join(f"{h}-year" for h in skipped))
+    
+    replicates = None
+    if n_replicates > 0:
+        progress = st.progress(0.0, text="Bootstrapping...")
+        
+        def update_progress(done, total):
+            progress.progress(done / total, text=f"Bootstrap {done:,} / {total:,} replicates")
+        
+        # 在当前进程中计算：共享的 Streamlit 服务不为每次点击启动整机大小的进程池
+        replicates = bootstrap(validation, int(n_replicates), workers=1, progress_callback=update_progress)
+    metrics = metrics_table(validation, replicates)
+    calibration = calibration_table(validation)
+    
+    display = pd.DataFrame({
+        "Metric": metrics["metric"],
+        "Horizon": [f"{h:g}-Year" if pd.notna(h) else "—" for h in metrics["horizon"]],
+        "Estimate": [f"{v:.3f}" for v in metrics["estimate"]],
+        "95% CI": [f"{lo:.3f} – {hi:.3f}" if pd.notna(lo) else "—"
+                   for lo, hi in zip(metrics["ci_low"], metrics["ci_high"])],
+    })
+    st.dataframe(display, use_container_width=True, hide_index=True)
+    if len(calibration):
+        st.vega_lite_chart(calibration_plot_spec(calibration), use_container_width=True)
+        with st.expander("📋 Calibration table"):
+            st.dataframe(calibration, use_container_width=True, hide_index=True)
+    st.download_button(
+        "⬇️ Download Metrics (CSV)",
+        data=metrics.to_csv(index=False).encode('utf-8-sig'),
+        file_name="validation_metrics.csv",
+        mime="text/csv",
+        use_container_width=True,
+    )
+
+
+def render_cohort_importance(explainer, features, block_rows=2000):
+    """队列层面的特征重要性：各特征 |SHAP| 的平均值（分块计算以显示进度）"""
+    progress = st.progress(0.0, text="Explaining...")
+    blocks = []
+    for start in range(0, len(features), block_rows):
+        blocks.append(explainer.shap_values(features.iloc[start:start + block_rows]))
+        done = min(start + block_rows, len(features))
+        progress.progress(done / len(features), text=f"Explained {done:,} / {len(features):,} patients")
+    
+    display_names = [FEATURE_LABEL_MAP.get(f, f) for f in explainer.feature_names]
+    importance = cohort_importance(np.concatenate(blocks), display_names, explainer.outputs)
+    
+    st.markdown("#### 🧭 Feature Importance")
+    for k, tab in enumerate(st.tabs(explainer.outputs)):
+        with tab:
+            output = explainer.outputs[k]
+            st.vega_lite_chart(importance_bar_spec(importance[output], output, percent=k > 0),
+                               use_container_width=True)
+    st.dataframe(importance.round(4), use_container_width=True)
+    st.download_button(
+        "⬇️ Download Feature Importance (CSV)",
+        data=importance.to_csv(index_label="feature").encode('utf-8-sig'),
+        file_name="cohort_feature_importance.csv",
+        mime="text/csv",
+        use_container_width=True,
+    )
 
 # =========================================================
-# 🔧 预测函数
+# 🧭 预测解释
 # =========================================================
-def predict_survival(model, input_data):
-    """RSF 模型预测"""
-    risk_score = model.predict(input_data)
-    surv_funcs = model.predict_survival_function(input_data)
-    return risk_score[0], surv_funcs[0]
+def feature_value_label(feature_name, value):
+    """瀑布图的纵轴文本，例如 Glucose = 6.0 mmol/L"""
+    display_name = FEATURE_LABEL_MAP.get(feature_name, feature_name)
+    config = FEATURE_CONFIG.get(display_name, {})
+    if feature_name.endswith("_Yes") or config.get("type") == "select":
+        return f"{display_name} = {'Yes' if value >= 0.5 else 'No'}"
+    unit = config.get("unit", "")
+    return f"{display_name} = {value:g}" + (f" {unit}" if unit else "")
+
+
+def render_explanation(explainer, input_df, user_inputs):
+    """各特征对风险评分与 1-4 年生存率的贡献（TreeSHAP 瀑布图）"""
+    shap_values = explainer.shap_values(input_df)[0]
+    predictions = explainer.predictions(input_df)[0]
+    labels = [feature_value_label(f, user_inputs[f]) for f in explainer.feature_names]
+    
+    st.markdown("### 🧭 What Drives This Prediction")
+    st.caption("Exact TreeSHAP contributions. Starting from the model's expected value for an average "
+               "patient, each bar shows how far this patient's value of a feature moves the prediction.")
+    for k, tab in enumerate(st.tabs(explainer.outputs)):
+        with tab:
+            spec = shap_waterfall_spec(labels, shap_values[:, k], explainer.base_values[k], predictions[k],
+                                       explainer.outputs[k], percent=k > 0, higher_is_better=k > 0)
+            st.vega_lite_chart(spec, use_container_width=True)
 
 # =========================================================
-# 🎨 绘制专业生存曲线（适合发表）
+# 🔍 敏感性分析页面
 # =========================================================
-def plot_survival_curve_professional(surv_func):
-    """绘制适合论文发表的生存曲线"""
-    
-    # 设置专业绘图风格
-    plt.rcParams['font.family'] = 'DejaVu Sans'
-    plt.rcParams['font.size'] = 11
-    plt.rcParams['axes.linewidth'] = 1.2
-    
-    fig, ax = plt.subplots(figsize=(10, 6.5), dpi=150)
+def render_sensitivity_tab(model, feature_list, user_inputs, demo_mode):
+    """固定侧边栏的其余输入，扫描一个或两个连续特征"""
+    st.markdown("### 🔍 Sensitivity Analysis")
+    st.markdown("Vary one or two inputs across their allowed range while holding the other "
+                "sidebar values fixed. Pick two features for a heatmap.")
     
-    # 白色背景
-    ax.set_facecolor('white')
-    fig.patch.set_facecolor('white')
-    
-    time_points = surv_func.x
-    surv_probs = surv_func.y
-    
-    # 主曲线 - 使用深蓝色，更粗的线条
-    ax.step(time_points, surv_probs, where='post', 
-            color='#1e3a5f', linewidth=2.5, label='Survival Probability')
-    
-    # 淡色填充
-    ax.fill_between(time_points, surv_probs, step='post', 
-                    color='#3b82f6', alpha=0.15)
-    
-    # 标记 1、2、3、4 年的点
-    colors = ['#10b981', '#3b82f6', '#8b5cf6', '#f59e0b']
-    years = [1, 2, 3, 4]
-    labels = ['1-Year', '2-Year', '3-Year', '4-Year']
+    if demo_mode:
+        st.error("Sensitivity analysis requires the model file `rsf_model.joblib`.")
+        return
+    
+    def display_name(feature_name):
+        return FEATURE_LABEL_MAP.get(feature_name, feature_name)
+    
+    options = continuous_features(feature_list)
+    default = [f for f in options if display_name(f) == "Glucose"][:1]
+    selected = st.multiselect("Features to vary", options, default=default, max_selections=2,
+                              format_func=display_name)
+    if not selected:
+        return
+    
+    col_points, col_horizon = st.columns(2)
+    with col_points:
+        n_points = st.slider("Grid points per feature", min_value=10, max_value=SWEEP_POINTS,
+                             value=SWEEP_POINTS, step=10)
+    with col_horizon:
+        horizon = st.selectbox("Heatmap horizon", [1, 2, 3, 4], index=2,
+                               format_func=lambda year: f"{year}-Year survival",
+                               disabled=len(selected) < 2)
+    
+    input_df = build_input_frame(user_inputs, feature_list)
+    sweep = sensitivity_sweep(model, input_df, selected, n_points)
+    labels = [display_name(f) for f in selected]
+    current = [user_inputs[f] for f in selected]
+    
+    if len(selected) == 1:
+        spec = sensitivity_curve_spec(sweep, labels[0], current[0])
+    else:
+        spec = sensitivity_heatmap_spec(sweep, labels, horizon, current)
+    st.vega_lite_chart(spec, use_container_width=True)
+    st.caption(f"{sweep['grid_points']:,} grid points scored as {sweep['rows_scored']:,} distinct "
+               f"predictions (points between the same split thresholds share one prediction).")
+
+# =========================================================
+# 📊 结果卡片
+# =========================================================
+def render_result_cards(risk_score, survival_rates, approximate=False):
+    """风险评分与 1-4 年生存率卡片；approximate=True 时数值前加 ≈，标签注明为近似值"""
+    # 使用5列布局
+    col1, *year_cols = st.columns(5)
+    prefix = "≈ " if approximate else ""
+    
+    with col1:
+        st.markdown(f"""
+        <div class="survival-card risk-card">
+            <div class="card-year">Risk Score</div>
+            <div class="card-value">{prefix}{risk_score:.1f}</div>
+            <div class="card-label">{"Approximate" if approximate else "Relative Risk"}</div>
+        </div>
+        """, unsafe_allow_html=True)
     
-    for i, (year, color, label) in enumerate(zip(years, colors, labels)):
-        if year <= time_points[-1]:
-            prob = get_survival_probability(surv_func, year)
-            
-            # 绘制点
-            ax.scatter([year], [prob], color=color, s=120, zorder=5, 
-                      edgecolors='white', linewidths=2)
-            
-            # 绘制虚线到坐标轴
-            ax.plot([year, year], [0, prob], color=color, linestyle='--', 
-                   linewidth=1, alpha=0.6)
-            ax.plot([0, year], [prob, prob], color=color, linestyle='--', 
-                   linewidth=1, alpha=0.6)
-            
-            # 标注文字
-            offset_y = 0.06 if i % 2 == 0 else -0.08
-            va = 'bottom' if i % 2 == 0 else 'top'
-            ax.annotate(f'{label}: {prob:.1%}', 
-                       xy=(year, prob),
-                       xytext=(year + 0.15, prob + offset_y),
-                       fontsize=11,
-                       fontweight='bold',
-                       color=color,
-                       va=va,
-                       bbox=dict(boxstyle='round,pad=0.3', facecolor='white', 
-                                edgecolor=color, alpha=0.9))
-    
-    # 设置标题和标签
-    ax.set_title('Predicted Survival Curve', fontsize=16, fontweight='bold', 
-                 color='#1e293b', pad=20)
-    ax.set_xlabel('Time (Years)', fontsize=13, fontweight='600', color='#374151')
-    ax.set_ylabel('Survival Probability', fontsize=13, fontweight='600', color='#374151')
-    
-    # 坐标轴范围
-    ax.set_xlim(0, min(5, max(time_points) * 1.05))
-    ax.set_ylim(0, 1.02)
-    
-    # 刻度设置
-    ax.set_xticks([0, 1, 2, 3, 4, 5])
-    ax.set_yticks([0, 0.2, 0.4, 0.6, 0.8, 1.0])
-    ax.set_yticklabels(['0%', '20%', '40%', '60%', '80%', '100%'])
-    
-    # 网格
-    ax.grid(True, linestyle='-', alpha=0.2, color='#94a3b8')
-    ax.set_axisbelow(True)
-    
-    # 边框
-    for spine in ['top', 'right']:
-        ax.spines[spine].set_visible(False)
-    for spine in ['left', 'bottom']:
-        ax.spines[spine].set_color('#cbd5e1')
-        ax.spines[spine].set_linewidth(1.2)
-    
-    # 刻度颜色
-    ax.tick_params(colors='#4b5563', labelsize=11)
-    
-    plt.tight_layout()
-    return fig
+    for year, (col, rate) in enumerate(zip(year_cols, survival_rates), start=1):
+        with col:
+            st.markdown(f"""
+            <div class="survival-card year-{year}">
+                <div class="card-year">{year}-Year</div>
+                <div class="card-value">{prefix}{rate:.1%}</div>
+                <div class="card-label">{"Approximate" if approximate else "Survival Rate"}</div>
+            </div>
+            """, unsafe_allow_html=True)
+
+# =========================================================
+# 🛠️ 调试面板（?debug=1 或 RSF_DEBUG_PANEL=1 时显示）
+# =========================================================
+def debug_panel_enabled():
+    return st.query_params.get("debug") == "1" or os.environ.get("RSF_DEBUG_PANEL") == "1"
+
+
+def render_debug_panel(loaded):
+    """各阶段耗时分布、缓存命中率与进程内存"""
+    snapshot = METRICS.snapshot()
+    gauges = snapshot["gauges"]
+    
+    with st.expander("🛠️ Performance Metrics", expanded=False):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Process RSS", f"{gauges.get('process_resident_memory_bytes', 0) / 2**20:.0f} MiB")
+        col2.metric("Prediction cache hit rate", f"{gauges.get('prediction_cache_hit_rate', 0):.1%}")
+        col3.metric("Uptime", f"{snapshot['uptime_s'] / 60:.1f} min")
+        
+        startup = None if loaded is None else warm_up_app(loaded)
+        if startup is not None and startup.ready_age is not None:
+            phases = ", ".join(f"{name} {ms:.0f} ms" for name, ms in startup.phases.items())
+            st.caption(f"Warm-up finished {startup.ready_age:.1f} s after the process started ({phases}).")
+        
+        predictor = st.session_state.get("incremental_predictor")
+        if predictor is not None and predictor.leaves is not None:
+            st.caption(f"Last prediction re-walked {predictor.last_trees_walked} of "
+                       f"{predictor.forest.n_trees} trees ({predictor.last_trees_checked} use the changed inputs).")
+        
+        if snapshot["stages"]:
+            stages = pd.DataFrame.from_dict(snapshot["stages"], orient="index")
+            stages = stages[["count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"]]
+            st.dataframe(stages.round(3), use_container_width=True)
+        else:
+            st.caption("No measurements yet." if METRICS.enabled else "Metrics are disabled (RSF_METRICS=0).")
+        
+        st.download_button(
+            "⬇️ Prometheus Metrics",
+            data=METRICS.to_prometheus(),
+            file_name="rsf_metrics.txt",
+            mime="text/plain",
+        )
 
 # =========================================================
 # 🏠 主函数
@@ -462,12 +675,22 @@ def main():
     st.markdown('<p class="sub-title">Random Survival Forest Model-Based Clinical Decision Support Tool</p>', 
                 unsafe_allow_html=True)
     
-    # 加载模型
-    model = load_model()
-    feature_list = load_feature_list()
-    demo_mode = model is None
-    
-    if demo_mode:
+    # 加载模型：本会话分到的版本（模型目录中的 production 或 A/B 分流的 candidate）
+    loaded, arm = load_session_model()
+    demo_mode = loaded is None
+    model = None if demo_mode else loaded.engine
+    feature_list = load_feature_list() if demo_mode else loaded.feature_list
+    
+    # 蒸馏代理模型：森林不可用或超出延迟预算时使用，结果标注为近似值
+    surrogate = load_surrogate_model()
+    if surrogate is not None and not set(surrogate.feature_names) <= set(feature_list):
+        # 代理模型由另一组特征的模型蒸馏而来，不能代替当前模型
+        surrogate = None
+    
+    if demo_mode and surrogate is not None:
+        st.warning("⚠️ **Approximate Mode**: Model file not found. Single-patient results come from the distilled "
+                   f"surrogate `{surrogate.path}` and approximate the full model.")
+    elif demo_mode:
         st.warning("⚠️ **Demo Mode**: Model file not found. Please ensure `rsf_model.joblib` is in the app directory.")
     
     # ----------------------
@@ -508,161 +731,198 @@ def main():
         
         st.markdown("---")
         predict_button = st.button("🔮 Calculate Survival Probability", use_container_width=True)
-    
-    # ----------------------
-    # 主内容区
-    # ----------------------
-    st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
-    
-    if predict_button:
-        input_df = pd.DataFrame([user_inputs])
-        input_df = input_df[feature_list]
-        
-        with st.spinner('Calculating...'):
-            if demo_mode:
-                # 演示模式
-                risk_score = np.random.uniform(20, 80)
-                times = np.linspace(0, 5, 100)
-                base_rate = 0.15 + (risk_score / 100) * 0.3
-                surv_probs = np.exp(-base_rate * times)
-                
-                class MockSurvFunc:
-                    def __init__(self, x, y):
-                        self.x = x
-                        self.y = y
-                
-                surv_func = MockSurvFunc(times, surv_probs)
-            else:
-                risk_score, surv_func = predict_survival(model, input_df)
         
-        # 计算 1-4 年生存率
-        surv_1y = get_survival_probability(surv_func, 1)
-        surv_2y = get_survival_probability(surv_func, 2)
-        surv_3y = get_survival_probability(surv_func, 3)
-        surv_4y = get_survival_probability(surv_func, 4)
+        st.markdown("---")
+        chart_mode = st.radio(
+            "📈 Survival Curve Display",
+            options=["Static image", "Interactive (vector)"],
+            index=0,
+            help="Static image renders a 150-dpi PNG on the server; interactive mode draws a vector chart in the browser"
+        )
+        show_bands = st.checkbox(
+            "🌳 Tree agreement band",
+            value=True,
+            help="Shade the 10th-90th percentile of the individual trees' survival curves"
+        )
+        progressive_mode = st.checkbox(
+            "⚡ Progressive results",
+            value=False,
+            help="Show an estimate from a subset of trees at once and refine it until the 1-4 year survival is stable"
+        )
         
+        if not demo_mode:
+            st.markdown("---")
+            st.caption(f"Model `{loaded.version.stem}` · version `{loaded.version.version}`"
+                       + (" · candidate" if arm == "candidate" else ""))
+    
+    # 侧边栏已显示，用户填写参数时完成预热，第一次点击不再付出导入与绘图初始化的开销
+    if not demo_mode:
+        warm_up_app(loaded)
+    
+    tab_single, tab_sensitivity, tab_cohort, tab_validation = st.tabs(
+        ["🧑‍⚕️ Single Patient", "🔍 Sensitivity", "📂 Cohort Scoring", "✅ Validation"])
+    
+    with tab_single:
         # ----------------------
-        # 显示结果卡片
+        # 主内容区
         # ----------------------
-        st.markdown("### 📊 Prediction Results")
-        
-        # 使用5列布局
-        col1, col2, col3, col4, col5 = st.columns(5)
-        
-        with col1:
-            st.markdown(f"""
-            <div class="survival-card risk-card">
-                <div class="card-year">Risk Score</div>
-                <div class="card-value">{risk_score:.1f}</div>
-                <div class="card-label">Relative Risk</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown(f"""
-            <div class="survival-card year-1">
-                <div class="card-year">1-Year</div>
-                <div class="card-value">{surv_1y:.1%}</div>
-                <div class="card-label">Survival Rate</div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col3:
-            st.markdown(f"""
-            <div class="survival-card year-2">
-                <div class="card-year">2-Year</div>
-                <div class="card-value">{surv_2y:.1%}</div>
-                <div class="card-label">Survival Rate</div>
-            </div>
-            """, unsafe_allow_html=True)
+        st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
         
-        with col4:
-            st.markdown(f"""
-            <div class="survival-card year-3">
-                <div class="card-year">3-Year</div>
-                <div class="card-value">{surv_3y:.1%}</div>
-                <div class="card-label">Survival Rate</div>
-            </div>
-            """, unsafe_allow_html=True)
+        if predict_button:
+            input_df = build_input_frame(user_inputs, feature_list)
+            
+            st.markdown("### 📊 Prediction Results")
+            cards = st.empty()
+            
+            # 代理模型：森林不可用，或森林最近的预测耗时超出预算（超出期间仍定期让一次请求走森林）
+            use_surrogate = surrogate is not None and (
+                demo_mode or load_latency_guard(loaded).should_use_surrogate())
+            approximate_note = None
+            started = time.perf_counter()
+            
+            with st.spinner('Calculating...'):
+                if use_surrogate:
+                    risk_score, surv_func = surrogate.predict_survival(input_df)
+                    reason = ("the full model is unavailable" if demo_mode
+                              else "the full model is over its latency budget")
+                    difference = surrogate.mean_abs_diff
+                    approximate_note = (f"≈ Approximate result from a distilled surrogate model because {reason}"
+                                        + (f"; it differs from the full model by {difference:.1%} on average "
+                                           f"for 1-4 year survival." if difference is not None else "."))
+                    progressive_note = None
+                    bands = None
+                elif demo_mode:
+                    # 演示模式
+                    risk_score = np.random.uniform(20, 80)
+                    times = np.linspace(0, 5, 100)
+                    base_rate = 0.15 + (risk_score / 100) * 0.3
+                    surv_probs = np.exp(-base_rate * times)
+                    
+                    surv_func = SurvivalMatrix(times, surv_probs)
+                    progressive_note = None
+                    bands = None
+                elif progressive_mode and isinstance(model, FlatForest):
+                    # 渐进式：先显示少量树的估计，随后原地刷新
+                    def show_partial(partial):
+                        with cards.container():
+                            render_result_cards(partial.risk_score, partial.horizon_surv[0])
+                            st.caption(f"⏳ Refining: {partial.n_trees}/{partial.total_trees} trees, "
+                                       f"±{partial.max_margin:.1%}")
+                    
+                    result = predict_progressive(model, input_df, callback=show_partial)
+                    risk_score, surv_func = result.risk_score, result.surv_func
+                    bands = survival_bands(model, result.leaves[0]) if show_bands else None
+                    if result.stopped_by == "all_trees":
+                        progressive_note = f"⚡ Used all {result.total_trees} trees."
+                    else:
+                        progressive_note = (f"⚡ Used {result.n_trees} of {result.total_trees} trees; "
+                                            f"1-4 year survival within ±{result.max_margin:.1%} (95%) "
+                                            f"of the full-forest estimate.")
+                elif show_bands and isinstance(model, FlatForest):
+                    # 共享缓存连同各树叶节点一起保存，命中时分位数带直接取自缓存的叶节点；
+                    # 未命中时由会话的增量预测器只重新遍历受影响的树
+                    risk_score, surv_func, leaves = load_prediction_cache(loaded).predict_with_leaves(
+                        input_df, predictor=session_predictor(loaded))
+                    bands = survival_bands(model, leaves)
+                    progressive_note = None
+                else:
+                    risk_score, surv_func = load_prediction_cache(loaded).predict_survival(input_df)
+                    progressive_note = None
+                    bands = None
+            if not demo_mode and not use_surrogate:
+                load_latency_guard(loaded).record(time.perf_counter() - started)
+            
+            # 计算 1-4 年生存率：单行生存曲线矩阵，一次查询全部时间点
+            curve = SurvivalMatrix.from_curve(surv_func)
+            surv_1y, surv_2y, surv_3y, surv_4y = curve.at(SURVIVAL_HORIZONS)[0]
+            
+            # ----------------------
+            # 显示结果卡片
+            # ----------------------
+            with cards.container():
+                render_result_cards(risk_score, [surv_1y, surv_2y, surv_3y, surv_4y], approximate=use_surrogate)
+                if approximate_note:
+                    st.warning(approximate_note)
+                if progressive_note:
+                    st.caption(progressive_note)
+            
+            # SHAP 解释的是完整森林，代理模型的近似结果不附带解释
+            explainer = None if demo_mode or use_surrogate else load_explainer(loaded)
+            if explainer is not None:
+                render_explanation(explainer, input_df, user_inputs)
+            
+            # ----------------------
+            # 生存曲线
+            # ----------------------
+            st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+            st.markdown("### 📈 Survival Curve" + (" (approximate)" if use_surrogate else ""))
+            
+            if chart_mode == "Interactive (vector)":
+                st.vega_lite_chart(survival_curve_spec(curve, bands), use_container_width=True)
+            else:
+                st.image(load_curve_renderer().render_png(curve, bands), use_container_width=True)
+            
+            # ----------------------
+            # 预测摘要表格
+            # ----------------------
+            st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+            st.markdown("### 📋 Prediction Summary")
+            
+            col_table1, col_table2 = st.columns(2)
+            
+            with col_table1:
+                st.markdown("**Survival Probabilities**")
+                surv_df = pd.DataFrame({
+                    "Time Point": ["1-Year", "2-Year", "3-Year", "4-Year"],
+                    "Survival Probability": [f"{surv_1y:.1%}", f"{surv_2y:.1%}", 
+                                             f"{surv_3y:.1%}", f"{surv_4y:.1%}"]
+                })
+                if bands is not None:
+                    surv_df["Tree SD"] = [f"{sd:.1%}" for sd in bands["horizon_sd"]]
+                    surv_df["± SE"] = [f"{se:.1%}" for se in bands["horizon_se"]]
+                st.dataframe(surv_df, use_container_width=True, hide_index=True)
+            
+            with col_table2:
+                st.markdown("**Input Parameters**")
+                st.dataframe(pd.DataFrame(input_summary(user_inputs)), use_container_width=True, hide_index=True)
         
-        with col5:
-            st.markdown(f"""
-            <div class="survival-card year-4">
-                <div class="card-year">4-Year</div>
-                <div class="card-value">{surv_4y:.1%}</div>
-                <div class="card-label">Survival Rate</div>
+        else:
+            # 未点击按钮时的提示
+            st.markdown("""
+            <div class="info-box">
+                <h4 style="margin-top: 0; color: #0c4a6e;">👈 Please enter patient parameters in the sidebar</h4>
+                <p style="margin-bottom: 0;">
+                    Input all required clinical parameters and click <strong>"Calculate Survival Probability"</strong> 
+                    to obtain the 1-4 year survival prediction results.
+                </p>
             </div>
             """, unsafe_allow_html=True)
-        
-        # ----------------------
-        # 生存曲线
-        # ----------------------
-        st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
-        st.markdown("### 📈 Survival Curve")
-        
-        fig = plot_survival_curve_professional(surv_func)
-        st.pyplot(fig)
-        plt.close()
-        
-        # ----------------------
-        # 预测摘要表格
-        # ----------------------
-        st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
-        st.markdown("### 📋 Prediction Summary")
-        
-        col_table1, col_table2 = st.columns(2)
-        
-        with col_table1:
-            st.markdown("**Survival Probabilities**")
-            surv_df = pd.DataFrame({
-                "Time Point": ["1-Year", "2-Year", "3-Year", "4-Year"],
-                "Survival Probability": [f"{surv_1y:.1%}", f"{surv_2y:.1%}", 
-                                         f"{surv_3y:.1%}", f"{surv_4y:.1%}"]
-            })
-            st.dataframe(surv_df, use_container_width=True, hide_index=True)
-        
-        with col_table2:
-            st.markdown("**Input Parameters**")
-            input_summary = []
-            for feature_name, value in user_inputs.items():
-                display_name = FEATURE_LABEL_MAP.get(feature_name, feature_name)
-                config = FEATURE_CONFIG.get(display_name, {})
-                
-                if feature_name.endswith("_Yes") or config.get("type") == "select":
-                    display_value = "Yes" if value == 1 else "No"
-                else:
-                    unit = config.get("unit", "")
-                    display_value = f"{value:.2f}" + (f" {unit}" if unit else "")
-                
-                input_summary.append({"Parameter": display_name, "Value": display_value})
             
-            st.dataframe(pd.DataFrame(input_summary), use_container_width=True, hide_index=True)
+            # 显示模型说明
+            st.markdown("### 📌 Model Features")
+            features_display = [FEATURE_LABEL_MAP.get(f, f) for f in feature_list]
+            
+            cols = st.columns(2)
+            mid = len(features_display) // 2 + len(features_display) % 2
+            
+            with cols[0]:
+                for f in features_display[:mid]:
+                    st.markdown(f"• {f}")
+            with cols[1]:
+                for f in features_display[mid:]:
+                    st.markdown(f"• {f}")
     
-    else:
-        # 未点击按钮时的提示
-        st.markdown("""
-        <div class="info-box">
-            <h4 style="margin-top: 0; color: #0c4a6e;">👈 Please enter patient parameters in the sidebar</h4>
-            <p style="margin-bottom: 0;">
-                Input all required clinical parameters and click <strong>"Calculate Survival Probability"</strong> 
-                to obtain the 1-4 year survival prediction results.
-            </p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # 显示模型说明
-        st.markdown("### 📌 Model Features")
-        features_display = [FEATURE_LABEL_MAP.get(f, f) for f in feature_list]
-        
-        cols = st.columns(2)
-        mid = len(features_display) // 2 + len(features_display) % 2
-        
-        with cols[0]:
-            for f in features_display[:mid]:
-                st.markdown(f"• {f}")
-        with cols[1]:
-            for f in features_display[mid:]:
-                st.markdown(f"• {f}")
+    with tab_sensitivity:
+        render_sensitivity_tab(model, feature_list, user_inputs, demo_mode)
+    
+    with tab_cohort:
+        render_cohort_tab(loaded, feature_list, demo_mode)
+    
+    with tab_validation:
+        render_validation_tab(loaded, feature_list, demo_mode)
+    
+    if debug_panel_enabled():
+        render_debug_panel(loaded)
     
     # 页脚
     st.markdown("""
@@ -677,4 +937,5 @@ def main():
 # 🚀 运行
 # =========================================================
 if __name__ == "__main__":
-    main()
+    with METRICS.timer("streamlit_rerun"):
+        main()
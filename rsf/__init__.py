@@ -0,0 +1 @@
+"""RSF 生存预测工具包：预测核心与命令行工具（不依赖 Streamlit）"""
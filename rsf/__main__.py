@@ -0,0 +1,5 @@
+import sys
+
+from rsf.cli import main
+
+sys.exit(main())
@@ -0,0 +1,129 @@
+# =========================================================
+# 💾 内存映射模型文件
+# 目录格式：meta.json（小型元数据）+ 每个数组一个 .npy 文件。
+# 加载时用 mmap 映射数组，只读取元数据，冷启动时间与模型大小无关；
+# 同一主机上的多个进程共享页缓存，而不是各自保存一份副本
+# =========================================================
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from rsf.engine import FlatForest
+
+FLAT_FORMAT = "rsf-flat-forest"
+FLAT_FORMAT_VERSION = 1
+FLAT_SUFFIX = ".flat"
+META_FILE = "meta.json"
+
+ARRAY_NAMES = (
+    "feature", "threshold", "left", "right", "missing_left", "leaf_index",
+    "roots", "leaf_values", "unique_times_", "is_event_time_",
+)
+# 可选数组：模型没有时不写出，旧的模型目录中没有时加载为 None
+OPTIONAL_ARRAY_NAMES = ("node_cover",)
+
+
+def is_flat_artifact(path):
+    """判断路径是否为展平模型目录"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def path_size(path):
+    """模型文件或 .flat 目录（目录内各文件之和）的字节数"""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def save_flat_forest(forest, path, source=None, metadata=None):
+    """把 FlatForest 写成内存映射目录；先写入临时目录再改名，避免读到半成品
+    
+    metadata 为附加信息（可 JSON 序列化的字典），原样写入 meta.json，用 read_flat_metadata 读取。
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=parent)
+    try:
+        # mkdtemp 默认只允许当前用户访问，改为与普通目录一致，便于其他服务进程读取
+        os.chmod(tmp_dir, 0o755)
+        arrays = {}
+        for name in ARRAY_NAMES + OPTIONAL_ARRAY_NAMES:
+            if getattr(forest, name, None) is None:
+                continue
+            array = np.ascontiguousarray(getattr(forest, name))
+            file_name = name.rstrip("_") + ".npy"
+            np.save(os.path.join(tmp_dir, file_name), array)
+            arrays[name] = {"file": file_name, "dtype": array.dtype.str, "shape": list(array.shape)}
+        
+        feature_names = getattr(forest, "feature_names_in_", None)
+        meta = {
+            "format": FLAT_FORMAT,
+            "version": FLAT_FORMAT_VERSION,
+            "n_features": int(forest.n_features_in_),
+            "feature_names": None if feature_names is None else [str(f) for f in feature_names],
+            "max_depth": int(forest.max_depth),
+            "n_trees": int(forest.n_trees),
+            "source": source,
+            "arrays": arrays,
+        }
+        if metadata is not None:
+            meta["metadata"] = metadata
+        with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_dir, path)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return path
+
+
+def read_flat_metadata(path):
+    """展平模型目录中 save_flat_forest 写入的附加信息，没有时为空字典"""
+    with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+        return json.load(f).get("metadata") or {}
+
+
+def load_flat_forest(path, mmap=True):
+    """加载展平模型目录；mmap=True 时数组按需从页缓存读取"""
+    with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FLAT_FORMAT:
+        raise ValueError(f"{path} is not a flat forest artifact")
+    if meta.get("version") != FLAT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported flat forest version {meta.get('version')} in {path}")
+    
+    mmap_mode = "r" if mmap else None
+    arrays = {}
+    for name in ARRAY_NAMES + OPTIONAL_ARRAY_NAMES:
+        if name not in meta["arrays"]:
+            continue
+        spec = meta["arrays"][name]
+        array = np.load(os.path.join(path, spec["file"]), mmap_mode=mmap_mode, allow_pickle=False)
+        if array.dtype.str != spec["dtype"] or list(array.shape) != spec["shape"]:
+            raise ValueError(f"{spec['file']} in {path} does not match {META_FILE}")
+        # 去掉 np.memmap 子类，数据仍指向映射内存
+        arrays[name] = np.asarray(array)
+    
+    feature_names = meta.get("feature_names")
+    return FlatForest(
+        feature=arrays["feature"],
+        threshold=arrays["threshold"],
+        left=arrays["left"],
+        right=arrays["right"],
+        missing_left=arrays["missing_left"],
+        leaf_index=arrays["leaf_index"],
+        roots=arrays["roots"],
+        leaf_values=arrays["leaf_values"],
+        unique_times=arrays["unique_times_"],
+        is_event_time=arrays["is_event_time_"],
+        n_features=meta["n_features"],
+        feature_names=None if feature_names is None else np.asarray(feature_names, dtype=object),
+        max_depth=meta["max_depth"],
+        node_cover=arrays.get("node_cover"),
+    )
@@ -0,0 +1,252 @@
+# =========================================================
+# ⏱️ 预测链路基准测试
+# 用法：python -m rsf bench --output bench_results.json --baseline benchmarks/baseline.json
+#
+# 覆盖 load_model（冷/热）、load_feature_list、构建输入 DataFrame、predict_survival、
+# get_survival_probability、生存曲线绘制与队列批量评分；队列为 FEATURE_CONFIG 范围内的
+# 随机数据，规模 1 到 1,000,000 行。结果写为 JSON，并与保存的基线逐项对比
+# =========================================================
+
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from rsf import core
+from rsf.engine import compile_forest
+
+BENCH_FORMAT_VERSION = 1
+DEFAULT_SIZES = [1, 100, 10_000, 1_000_000]
+DEFAULT_ENGINES = ["flat", "sksurv"]
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+
+# 单项计时：至少运行 MIN_TIME 秒或 MIN_REPEATS 次，最多 MAX_REPEATS 次
+MIN_TIME = 0.2
+MIN_REPEATS = 3
+MAX_REPEATS = 200
+
+# 对比基线时低于该耗时（毫秒）的差异视为噪声
+NOISE_FLOOR_MS = 0.05
+
+# 冷启动子进程：只计时 load_model 本身，峰值内存取进程最大 RSS
+_COLD_LOAD_SCRIPT = """
+import json, resource, sys, time
+from rsf import core
+started = time.perf_counter()
+core.load_model(sys.argv[1])
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+
+def case_key(stage, rows=None, engine=None):
+    """结果字典中的键，例如 predict_survival[rows=1,engine=flat]"""
+    params = [f"{name}={value}" for name, value in (("rows", rows), ("engine", engine)) if value is not None]
+    return f"{stage}[{','.join(params)}]" if params else stage
+
+
+def time_call(fn, min_time=MIN_TIME, min_repeats=MIN_REPEATS, max_repeats=MAX_REPEATS):
+    """重复调用 fn 计时，返回各次耗时（秒）"""
+    timings = []
+    total = 0.0
+    while len(timings) < max_repeats and (len(timings) < min_repeats or total < min_time):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        timings.append(elapsed)
+        total += elapsed
+    return timings
+
+
+def peak_memory(fn):
+    """用 tracemalloc 单独运行一次 fn，返回 Python / NumPy 分配的峰值字节数（不计入计时）"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(timings, peak_bytes, **extra):
+    timings_ms = np.asarray(timings) * 1000
+    result = {
+        "repeats": len(timings),
+        "min_ms": float(timings_ms.min()),
+        "median_ms": float(np.median(timings_ms)),
+        "mean_ms": float(timings_ms.mean()),
+        "peak_bytes": int(peak_bytes),
+    }
+    result.update(extra)
+    return result
+
+
+def measure(fn, max_repeats=MAX_REPEATS, **extra):
+    """先热身一次，再计时，最后单独测峰值内存；max_repeats 为 1 时不热身（用于大队列）"""
+    if max_repeats > 1:
+        fn()
+    timings = time_call(fn, min_repeats=min(MIN_REPEATS, max_repeats), max_repeats=max_repeats)
+    return summarize(timings, peak_memory(fn), **extra)
+
+
+def cold_load(model_path, repeats=3):
+    """在全新的子进程中计时 load_model（文件可能已在页缓存中，不包括解释器与模块导入）"""
+    env = dict(os.environ)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    
+    timings, max_rss = [], 0
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", _COLD_LOAD_SCRIPT, model_path], env=env,
+                                check=True, capture_output=True, text=True).stdout
+        run = json.loads(output.strip().splitlines()[-1])
+        timings.append(run["seconds"])
+        max_rss = max(max_rss, run["max_rss_kb"] * 1024)
+    return summarize(timings, max_rss, memory="max_rss")
+
+
+def environment():
+    """记录运行环境，对比基线时环境不同会给出提示"""
+    import sklearn
+    import sksurv
+    
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "scikit-learn": sklearn.__version__,
+        "scikit-survival": sksurv.__version__,
+    }
+
+# =========================================================
+# 🏃 运行全部基准
+# =========================================================
+def run_benchmarks(model_path="rsf_model.joblib", sizes=DEFAULT_SIZES, engines=DEFAULT_ENGINES,
+                   feature_path=None, seed=0, cold_repeats=3, log=print):
+    """运行全部基准，返回可写为 JSON 的结果字典"""
+    import matplotlib.pyplot as plt
+    
+    from rsf.plot import SurvivalCurveRenderer, plot_survival_curve_professional
+    
+    results = {}
+    
+    def record(key, result):
+        results[key] = result
+        log(f"{key:<52} median {result['median_ms']:10.3f} ms   peak {result['peak_bytes'] / 2**20:8.1f} MiB")
+    
+    # 加载
+    record(case_key("load_model_cold"), cold_load(model_path, cold_repeats))
+    record(case_key("load_model_warm"), measure(lambda: core.load_model(model_path), max_repeats=5))
+    record(case_key("load_feature_list"), measure(lambda: core.load_feature_list(feature_path)))
+    
+    model = core.load_model(model_path)
+    feature_list = core.load_feature_list(feature_path)
+    models = {"sksurv": model}
+    if "flat" in engines:
+        models["flat"] = compile_forest(model)
+    cohort = core.synthetic_cohort(max(sizes), feature_list, seed=seed)
+    
+    # 单个患者：与界面一次点击的路径相同
+    user_inputs = cohort.iloc[0].to_dict()
+    input_df = core.build_input_frame(user_inputs, feature_list)
+    for engine in engines:
+        record(case_key("predict_survival", 1, engine),
+               measure(lambda: core.predict_survival(models[engine], input_df)))
+    _, surv_func = core.predict_survival(models[engines[0]], input_df)
+    record(case_key("get_survival_probability", 1),
+           measure(lambda: [core.get_survival_probability(surv_func, year) for year in core.SURVIVAL_HORIZONS]))
+    
+    def legacy_plot():
+        fig = plot_survival_curve_professional(surv_func)
+        fig.savefig(io.BytesIO(), format="png")
+        plt.close(fig)
+    
+    renderer = SurvivalCurveRenderer()
+    record(case_key("plot_survival_curve_professional", 1), measure(legacy_plot, max_repeats=10))
+    record(case_key("render_survival_curve", 1), measure(lambda: renderer.render_png(surv_func), max_repeats=10))
+    
+    # 不同规模的队列
+    for n_rows in sizes:
+        subset = cohort.iloc[:n_rows]
+        records = subset.to_dict("records")
+        repeats = MAX_REPEATS if n_rows <= 10_000 else 1
+        record(case_key("build_input_frame", n_rows),
+               measure(lambda: core.build_input_frame(records, feature_list), max_repeats=repeats))
+        del records
+        
+        for engine in engines:
+            record(case_key("score_cohort", n_rows, engine),
+                   measure(lambda: core.score_cohort(models[engine], subset), max_repeats=repeats))
+    
+    return {
+        "format_version": BENCH_FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model": os.path.basename(model_path),
+        "environment": environment(),
+        "results": results,
+    }
+
+# =========================================================
+# 📊 与基线对比
+# =========================================================
+def compare_results(current, baseline, tolerance=0.25, memory_tolerance=0.25):
+    """逐项对比中位耗时与峰值内存，返回 (对比行列表, 是否有回退)
+    
+    中位耗时超过基线 (1 + tolerance) 倍且差值大于 NOISE_FLOOR_MS，
+    或峰值内存超过基线 (1 + memory_tolerance) 倍，记为回退。
+    """
+    rows = []
+    regressed = False
+    for key, result in current["results"].items():
+        base = baseline["results"].get(key)
+        if base is None:
+            rows.append({"case": key, "status": "new"})
+            continue
+        time_ratio = result["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        memory_ratio = result["peak_bytes"] / base["peak_bytes"] if base["peak_bytes"] else 1.0
+        slower = (time_ratio > 1 + tolerance
+                  and result["median_ms"] - base["median_ms"] > NOISE_FLOOR_MS)
+        larger = memory_ratio > 1 + memory_tolerance
+        status = "REGRESSION" if slower or larger else "ok"
+        regressed |= status == "REGRESSION"
+        rows.append({"case": key, "status": status, "median_ms": result["median_ms"],
+                     "baseline_ms": base["median_ms"], "time_ratio": time_ratio, "memory_ratio": memory_ratio})
+    for key in baseline["results"]:
+        if key not in current["results"]:
+            rows.append({"case": key, "status": "missing"})
+    return rows, regressed
+
+
+def format_comparison(rows):
+    lines = [f"{'case':<52} {'median ms':>11} {'baseline':>11} {'time':>7} {'memory':>7}  status"]
+    for row in rows:
+        if "median_ms" not in row:
+            lines.append(f"{row['case']:<52} {'':>11} {'':>11} {'':>7} {'':>7}  {row['status']}")
+            continue
+        lines.append(f"{row['case']:<52} {row['median_ms']:11.3f} {row['baseline_ms']:11.3f} "
+                     f"{row['time_ratio']:6.2f}x {row['memory_ratio']:6.2f}x  {row['status']}")
+    return "\n".join(lines)
+
+
+def write_results(results, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+
+
+def read_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
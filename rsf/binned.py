@@ -0,0 +1,158 @@
+# =========================================================
+# 🔢 阈值分箱查找表
+# 随机森林是分段常数函数：每个特征只有树中实际用到的分裂阈值才有意义。
+# 收集每个特征在全部树中的阈值，用 searchsorted 把输入映射为分箱编号，
+# 再用每棵树的 “分箱组合 → 叶节点” 查找表直接得到叶节点，完全不需要遍历树。
+# 查找表过大的树退回展平数组遍历
+# =========================================================
+
+import numpy as np
+
+from rsf.engine import FlatForest, compile_forest
+
+# 单棵树查找表的默认单元数上限
+MAX_TABLE_SIZE = 1 << 16
+
+
+class BinnedForest(FlatForest):
+    """带阈值分箱查找表的 FlatForest
+    
+    thresholds           每个特征在全森林中用到的阈值（升序、去重）
+    table_offsets        每棵树查找表在 tables 中的起始位置，退回遍历的树为 -1
+    tables               所有树查找表拼接成的叶节点（叶矩阵行号）数组
+    bin_offsets          (n_features, max_bins, n_indexed)：全局分箱编号在各查表树中对应的偏移量，
+                         已乘上该树内各特征的步长；树未使用的特征为 0
+    indexed_trees        使用查找表的树
+    fallback_trees       查找表过大、需要遍历的树
+    
+    bin_offsets 参数按 (n_trees, n_features, max_bins) 传入，构造时转为按特征排列，
+    查表时按分箱编号整行取出。
+    """
+    
+    def __init__(self, forest, thresholds, bin_offsets, table_offsets, tables):
+        super().__init__(
+            feature=forest.feature, threshold=forest.threshold, left=forest.left,
+            right=forest.right, missing_left=forest.missing_left, leaf_index=forest.leaf_index,
+            roots=forest.roots, leaf_values=forest.leaf_values, unique_times=forest.unique_times_,
+            is_event_time=forest.is_event_time_, n_features=forest.n_features_in_,
+            feature_names=getattr(forest, "feature_names_in_", None), max_depth=forest.max_depth,
+            node_cover=forest.node_cover,
+        )
+        self.thresholds = thresholds
+        self.table_offsets = table_offsets
+        self.tables = tables
+        self.indexed_trees = np.flatnonzero(table_offsets >= 0)
+        self.fallback_trees = np.flatnonzero(table_offsets < 0)
+        self.bin_offsets = np.ascontiguousarray(bin_offsets[self.indexed_trees].transpose(1, 2, 0))
+    
+    def index_nbytes(self):
+        """查找索引的内存占用（字节），不含 FlatForest 自身的数组"""
+        return {
+            "thresholds": sum(t.nbytes for t in self.thresholds),
+            "bin_offsets": self.bin_offsets.nbytes,
+            "tables": self.tables.nbytes,
+            "total": (sum(t.nbytes for t in self.thresholds) + self.bin_offsets.nbytes
+                      + self.table_offsets.nbytes + self.tables.nbytes),
+        }
+    
+    def memory_report(self):
+        """查找索引的规模与内存占用"""
+        return {
+            "indexed_trees": len(self.indexed_trees),
+            "fallback_trees": len(self.fallback_trees),
+            "table_cells": int(len(self.tables)),
+            "bins_per_feature": [len(t) + 1 for t in self.thresholds],
+            "index_bytes": self.index_nbytes(),
+            "forest_bytes": self.nbytes,
+        }
+    
+    def bin_indices(self, X):
+        """每个样本在每个特征上的全局分箱编号：该特征阈值中严格小于 x 的个数"""
+        bins = np.empty(X.shape, dtype=np.intp)
+        for f, thresholds in enumerate(self.thresholds):
+            bins[:, f] = np.searchsorted(thresholds, X[:, f].astype(np.float64), side="left")
+        return bins
+    
+    def apply(self, X, trees=None):
+        """返回每个样本在每棵树中的叶节点（叶矩阵行号），形状 (n, n_trees)"""
+        if trees is not None:
+            trees = np.asarray(trees)
+            if trees.dtype == bool:
+                trees = np.flatnonzero(trees)
+            return self.apply(X)[:, trees]
+        
+        missing_rows = np.isnan(X).any(axis=1)
+        if missing_rows.any():
+            # 含缺失值的样本走常规遍历
+            leaves = np.empty((X.shape[0], self.n_trees), dtype=np.int32)
+            leaves[missing_rows] = super().apply(X[missing_rows])
+            if (~missing_rows).any():
+                leaves[~missing_rows] = self.apply(X[~missing_rows])
+            return leaves
+        
+        leaves = np.empty((X.shape[0], self.n_trees), dtype=np.int32)
+        if len(self.indexed_trees):
+            bins = self.bin_indices(X)
+            cell = np.repeat(self.table_offsets[self.indexed_trees][np.newaxis, :], X.shape[0], axis=0)
+            for f in range(self.n_features_in_):
+                cell += self.bin_offsets[f].take(bins[:, f], axis=0)
+            leaves[:, self.indexed_trees] = self.tables.take(cell)
+        if len(self.fallback_trees):
+            leaves[:, self.fallback_trees] = super().apply(X, trees=self.fallback_trees)
+        return leaves
+
+
+def build_binned_forest(model, max_table_size=MAX_TABLE_SIZE):
+    """为 sksurv 模型或 FlatForest 构建阈值分箱查找表"""
+    forest = compile_forest(model)
+    n_features = forest.n_features_in_
+    is_internal = forest.leaf_index < 0
+    
+    # 每个特征在全森林中的阈值
+    thresholds = [
+        np.unique(forest.threshold[is_internal & (forest.feature == f)])
+        for f in range(n_features)
+    ]
+    max_bins = max(len(t) for t in thresholds) + 1
+    bin_offsets = np.zeros((forest.n_trees, n_features, max_bins), dtype=np.int32)
+    table_offsets = np.full(forest.n_trees, -1, dtype=np.int64)
+    tables = []
+    table_size_total = 0
+    node_end = np.append(forest.roots[1:], forest.n_nodes)
+    
+    for t in range(forest.n_trees):
+        nodes = np.arange(forest.roots[t], node_end[t])
+        split_nodes = nodes[is_internal[nodes]]
+        used = np.unique(forest.feature[split_nodes])
+        local_thresholds = [np.unique(forest.threshold[split_nodes[forest.feature[split_nodes] == f]])
+                            for f in used]
+        sizes = [len(lt) + 1 for lt in local_thresholds]
+        table_size = int(np.prod(sizes, dtype=np.int64)) if len(sizes) else 1
+        if table_size > max_table_size:
+            continue
+        
+        # 混合进制：最后一个特征步长为 1
+        strides = np.ones(len(used), dtype=np.int64)
+        for k in range(len(used) - 2, -1, -1):
+            strides[k] = strides[k + 1] * sizes[k + 1]
+        
+        # 全局分箱 g 对应 x ∈ (T[g-1], T[g]]，其局部分箱为局部阈值中 <= T[g-1] 的个数
+        for k, f in enumerate(used):
+            global_t = thresholds[f]
+            local_bins = np.concatenate([[0], np.searchsorted(local_thresholds[k], global_t, side="right")])
+            bin_offsets[t, f, :len(local_bins)] = local_bins * strides[k]
+        
+        # 每个单元取一个代表值（局部分箱 b 取第 b 个局部阈值，最后一箱取 +inf）遍历一次得到叶节点
+        cells = np.zeros((table_size, n_features), dtype=np.float64)
+        grid = np.indices(sizes).reshape(len(sizes), -1) if len(sizes) else np.zeros((0, 1), dtype=np.intp)
+        for k, f in enumerate(used):
+            representatives = np.append(local_thresholds[k], np.inf)
+            cells[:, f] = representatives[grid[k]]
+        leaves = forest.leaf_index.take(forest._apply_nodes(cells, forest.roots[[t]]))[:, 0]
+        
+        table_offsets[t] = table_size_total
+        tables.append(leaves.astype(np.int32))
+        table_size_total += table_size
+    
+    tables = np.concatenate(tables) if tables else np.zeros(0, dtype=np.int32)
+    return BinnedForest(forest, thresholds, bin_offsets, table_offsets, tables)
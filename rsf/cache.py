@@ -0,0 +1,198 @@
+# =========================================================
+# 🗂️ 预测结果缓存
+# 放在 predict_survival 前面的 LRU 缓存，键为模型摘要加上输入的原始字节，命中时与重新预测逐位相同。
+# 只缓存落在 FEATURE_CONFIG 步长网格上的输入（滑块与按步长调整的取值），
+# 网格之外的输入（手动键入的小数、队列数据）照常预测但不写入缓存，避免挤掉常用的网格点
+# =========================================================
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from rsf.core import FEATURE_CONFIG, FEATURE_LABEL_MAP, predict_forest, step_function
+from rsf.engine import FlatForest, prepare_features
+from rsf.metrics import METRICS
+
+
+def quantization_steps(feature_names):
+    """每个特征的量化步长：二分类为 1，数值型取 FEATURE_CONFIG 的 step，未配置为 NaN（不量化）"""
+    steps = []
+    for feature_name in feature_names:
+        display_name = FEATURE_LABEL_MAP.get(feature_name, feature_name)
+        config = FEATURE_CONFIG.get(display_name)
+        if feature_name.endswith("_Yes") or (config and config.get("type") == "select"):
+            steps.append(1.0)
+        elif config and config.get("step"):
+            steps.append(float(config["step"]))
+        else:
+            steps.append(np.nan)
+    return np.asarray(steps, dtype=np.float64)
+
+
+def combined_stats(caches):
+    """多个缓存（如各个已加载模型版本的缓存）的合计命中数、未命中数、缓存项数与命中率"""
+    hits = sum(cache.hits for cache in caches)
+    misses = sum(cache.misses for cache in caches)
+    return {"hits": hits, "misses": misses, "entries": sum(len(cache) for cache in caches),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+
+
+class PredictionCache:
+    """线程安全的 LRU 预测缓存（Streamlit 的各个会话共享同一个实例）
+    
+    缓存值为 (风险评分, 只读的生存概率数组, 只读的各树叶节点)，时间轴为 model.unique_times_；
+    叶节点供生存曲线分位数带使用，sksurv 模型时为 None。
+    model_digest 为模型文件的摘要（如 ModelVersion.digest），写入每个键，换模型后旧的缓存项不会再命中；
+    grid_only=False 时缓存所有输入。
+    """
+    
+    def __init__(self, model, model_digest="", maxsize=4096, grid_only=True):
+        self.model = model
+        self.model_digest = model_digest
+        self.maxsize = maxsize
+        self.grid_only = grid_only
+        self._key_prefix = str(model_digest).encode("utf-8") + b"\0"
+        self.feature_names = [str(f) for f in getattr(model, "feature_names_in_", [])]
+        self.steps = quantization_steps(self.feature_names) if self.feature_names else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncached = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+    
+    def stats(self):
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions, "uncached": self.uncached,
+                "hit_rate": self.hit_rate}
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def on_grid(self, X):
+        """每行是否落在步长网格上（与 float32 输入逐位比较；未配置步长的特征不限制）"""
+        if not self.grid_only or self.steps is None:
+            return np.ones(X.shape[0], dtype=bool)
+        stepped = ~np.isnan(self.steps)
+        values = X[:, stepped].astype(np.float64)
+        grid = (np.round(values / self.steps[stepped]) * self.steps[stepped]).astype(X.dtype)
+        return (grid == X[:, stepped]).all(axis=1)
+    
+    def _keys(self, X):
+        """每行的缓存键：模型摘要 + prepare_features 得到的 float32 行的原始字节"""
+        return [self._key_prefix + row.tobytes() for row in X]
+    
+    def _lookup(self, keys):
+        """返回各键的缓存项（未命中为 None），并更新命中统计与 LRU 顺序"""
+        with self._lock:
+            entries = [self._entries.get(key) for key in keys]
+            for key, entry in zip(keys, entries):
+                if entry is not None:
+                    self._entries.move_to_end(key)
+            missed = sum(entry is None for entry in entries)
+            self.hits += len(keys) - missed
+            self.misses += missed
+        return entries
+    
+    def _store(self, keys, X, risk_scores, surv, leaves):
+        """写入落在网格上的行；leaves 为各树叶节点 (n, n_trees)，sksurv 模型时为 None"""
+        cacheable = self.on_grid(X)
+        with self._lock:
+            self.uncached += int((~cacheable).sum())
+            for j, key in enumerate(keys):
+                if not cacheable[j]:
+                    continue
+                # 每行单独复制，避免缓存项引用整块预测结果
+                row = surv[j].copy()
+                row.flags.writeable = False
+                leaf_row = None
+                if leaves is not None:
+                    leaf_row = leaves[j].copy()
+                    leaf_row.flags.writeable = False
+                self._entries[key] = (float(risk_scores[j]), row, leaf_row)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def _predict(self, X):
+        """未命中的行：FlatForest 先定位叶节点再聚合（与 predict_forest 相同），叶节点一起缓存"""
+        if isinstance(self.model, FlatForest):
+            leaves = self.model.apply(X)
+            risk_scores, surv, _ = self.model.aggregate(leaves)
+            return risk_scores, surv, leaves
+        risk_scores, surv, _ = predict_forest(self.model, X)
+        return risk_scores, surv, None
+    
+    def predict_arrays(self, input_data, return_leaves=False):
+        """批量查询：命中的行直接返回，未命中的行合并为一次森林预测
+        
+        返回 (risk_scores, surv)，形状分别为 (n,) 与 (n, n_times)；
+        return_leaves=True 时再加上各树叶节点 (n, n_trees)（sksurv 模型时为 None）。
+        """
+        X = prepare_features(self.model, input_data)
+        keys = self._keys(X)
+        risk_scores = np.empty(len(keys), dtype=np.float64)
+        surv = np.empty((len(keys), len(self.model.unique_times_)), dtype=np.float64)
+        has_leaves = isinstance(self.model, FlatForest)
+        leaves = np.empty((len(keys), self.model.n_trees), dtype=np.int32) if has_leaves else None
+        
+        missing = []
+        for i, entry in enumerate(self._lookup(keys)):
+            if entry is None:
+                missing.append(i)
+                continue
+            risk_scores[i], surv[i] = entry[0], entry[1]
+            if has_leaves:
+                leaves[i] = entry[2]
+        
+        if missing:
+            risk_new, surv_new, leaves_new = self._predict(X[missing])
+            risk_scores[missing] = risk_new
+            surv[missing] = surv_new
+            if has_leaves:
+                leaves[missing] = leaves_new
+            self._store([keys[i] for i in missing], X[missing], risk_new, surv_new, leaves_new)
+        
+        if return_leaves:
+            return risk_scores, surv, leaves
+        return risk_scores, surv
+    
+    @METRICS.timed("predict_survival")
+    def predict_survival(self, input_data):
+        """带缓存的 predict_survival：返回第一行的 (风险评分, 生存函数)"""
+        risk_scores, surv = self.predict_arrays(input_data)
+        return risk_scores[0], step_function(self.model.unique_times_, surv[0])
+    
+    @METRICS.timed("predict_survival")
+    def predict_with_leaves(self, input_data, predictor=None):
+        """单个患者：返回 (风险评分, 生存函数, 各树叶节点)，叶节点用于 core.survival_bands
+        
+        未命中时若给出会话的 IncrementalPredictor，则用它增量预测（结果逐位相同）再写入缓存。
+        模型须为 FlatForest。
+        """
+        X = prepare_features(self.model, input_data)[:1]
+        keys = self._keys(X)
+        entry = self._lookup(keys)[0]
+        if entry is not None:
+            risk_score, surv, leaves = entry
+        elif predictor is not None:
+            predictor.update(X)
+            risk_score, surv, _ = predictor.predict_arrays()
+            leaves = predictor.leaves.copy()
+            self._store(keys, X, [risk_score], surv[np.newaxis], leaves[np.newaxis])
+        else:
+            risk_scores, surv, leaves = self._predict(X)
+            self._store(keys, X, risk_scores, surv, leaves)
+            risk_score, surv, leaves = risk_scores[0], surv[0], leaves[0]
+        return risk_score, step_function(self.model.unique_times_, surv), leaves
@@ -0,0 +1,926 @@
+# =========================================================
+# 🖥️ 命令行入口（无需 Streamlit）
+# 用法：python -m rsf score cohort.csv predictions.csv --workers 8
+# =========================================================
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from rsf import core
+from rsf.artifact import save_flat_forest
+from rsf.binned import build_binned_forest
+from rsf.engine import FlatForest, compare_with_sksurv, compile_forest
+
+# =========================================================
+# 📂 分块读写
+# =========================================================
+def iter_input_chunks(path, chunk_size):
+    """分块读取 CSV / Parquet，每块的索引为其在文件中的行号"""
+    if path.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+        
+        offset = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            chunk = batch.to_pandas()
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            yield chunk
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, encoding='utf-8-sig')
+
+
+class ChunkWriter:
+    """按块追加写出 CSV / Parquet，内存中只保留当前块"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.is_parquet = path.lower().endswith((".parquet", ".pq"))
+        self._parquet_writer = None
+        self._wrote_header = False
+    
+    def write(self, frame):
+        if self.is_parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode='a' if self._wrote_header else 'w',
+                         header=not self._wrote_header, index=False, encoding='utf-8')
+            self._wrote_header = True
+    
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        elif not self._wrote_header:
+            # 没有任何有效行时也写出表头
+            columns = ["row", "risk_score"] + [f"survival_{y}y" for y in core.SURVIVAL_HORIZONS]
+            pd.DataFrame(columns=columns).to_csv(self.path, index=False)
+
+# =========================================================
+# ⚙️ 工作进程
+# =========================================================
+ENGINES = ("flat", "binned", "sksurv")
+
+_worker_state = {}
+
+
+def _load_engine(model, engine):
+    """按 --engine 选择预测引擎：flat（展平数组）、binned（分箱查找表）或 sksurv"""
+    if engine == "sksurv":
+        return model
+    if engine == "binned":
+        return build_binned_forest(model)
+    return compile_forest(model)
+
+
+def _init_worker(model_path, feature_path, engine="flat"):
+    """每个工作进程只加载一次模型和特征列表"""
+    model = core.load_model(model_path)
+    if model is None:
+        raise FileNotFoundError("Model file not found")
+    _worker_state["model"] = _load_engine(model, engine)
+    _worker_state["features"] = core.load_feature_list(feature_path)
+
+
+def _score_chunk(chunk, id_columns, curves=False):
+    """校验并评分一块数据，返回 (结果, 问题记录, 完整生存曲线或 None)"""
+    features, issues = core.validate_cohort(chunk, _worker_state["features"])
+    if curves:
+        results, matrix = core.score_cohort(_worker_state["model"], features, return_curves=True)
+    else:
+        results, matrix = core.score_cohort(_worker_state["model"], features), None
+    results.insert(0, "row", results.index)
+    for column in reversed(id_columns):
+        results.insert(1, column, chunk.loc[results.index, column])
+    return results, issues, matrix
+
+# =========================================================
+# 🚀 score 子命令
+# =========================================================
+def run_score(args):
+    """分块读取输入，在进程池中评分，并按输入顺序边算边写"""
+    model_path = args.model or core.find_model_path()
+    if model_path is None or not os.path.exists(model_path):
+        print("error: model file not found", file=sys.stderr)
+        return 2
+    
+    workers = args.workers or os.cpu_count() or 1
+    max_pending = args.max_pending or 2 * workers
+    writer = ChunkWriter(args.output)
+    curve_writer = None
+    if args.curves is not None:
+        from rsf.survival import SurvivalMatrixWriter
+        
+        curve_writer = SurvivalMatrixWriter(args.curves)
+    n_scored = n_rejected = 0
+    rejects = []
+    started = time.perf_counter()
+    
+    def collect(result):
+        nonlocal n_scored, n_rejected
+        results, issues, matrix = result
+        writer.write(results)
+        if curve_writer is not None:
+            curve_writer.write(matrix)
+        n_scored += len(results)
+        n_rejected += issues["Row"].nunique()
+        if args.rejects is not None and len(issues):
+            rejects.append(issues)
+        if not args.quiet:
+            print(f"scored {n_scored:,} rows ({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+    
+    chunks = iter_input_chunks(args.input, args.chunk_size)
+    try:
+        if workers == 1:
+            _init_worker(model_path, args.features, args.engine)
+            for chunk in chunks:
+                collect(_score_chunk(chunk, args.id_column, curve_writer is not None))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(model_path, args.features, args.engine)) as pool:
+                # 在途块数有上限，最早提交的块一完成就写出，内存与文件大小无关
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(_score_chunk, chunk, args.id_column, curve_writer is not None))
+                    if len(pending) >= max_pending:
+                        collect(pending.popleft().result())
+                while pending:
+                    collect(pending.popleft().result())
+    finally:
+        writer.close()
+        if curve_writer is not None:
+            curve_writer.close()
+    
+    if rejects:
+        pd.concat(rejects).to_csv(args.rejects, index=False, encoding='utf-8-sig')
+    
+    elapsed = time.perf_counter() - started
+    print(f"done: {n_scored:,} scored, {n_rejected:,} rejected in {elapsed:.1f}s "
+          f"({n_scored / max(elapsed, 1e-9):,.0f} rows/s, {workers} workers)", file=sys.stderr)
+    return 0
+
+
+# =========================================================
+# ✅ check-engine 子命令
+# =========================================================
+def run_check_engine(args):
+    """在随机队列上核对展平引擎与 sksurv 原生预测是否一致"""
+    # 参照必须是 sksurv 原模型：默认跳过 .flat 目录，否则引擎只是在和自己比较
+    model_path = args.model or core.find_model_path(include_flat=False)
+    model = core.load_model(model_path) if model_path is not None else None
+    if model is None:
+        print("error: scikit-survival model file not found", file=sys.stderr)
+        return 2
+    if isinstance(model, FlatForest):
+        print(f"error: {model_path} is a compiled FlatForest; check-engine needs the scikit-survival "
+              f"RandomSurvivalForest (.joblib) as the reference", file=sys.stderr)
+        return 2
+    
+    forest = _load_engine(model, args.engine)
+    cohort = core.synthetic_cohort(args.rows, core.load_feature_list(args.features), seed=args.seed)
+    # 每 50 行中有一行约 20% 的取值为缺失值，同时核对缺失值的走向（binned 引擎对这些行退回遍历）
+    missing = np.random.default_rng(args.seed).random(cohort.shape) < 0.2
+    missing[np.arange(len(cohort)) % 50 != 0] = False
+    cohort = cohort.mask(missing)
+    differences = compare_with_sksurv(model, forest, cohort)
+    
+    print(f"{forest.n_trees} trees, {forest.n_nodes:,} nodes, {forest.n_leaves:,} leaves, "
+          f"{forest.nbytes / 2**20:.1f} MiB")
+    print(f"{len(cohort):,} patients, {int(missing.any(axis=1).sum()):,} with missing values")
+    if args.engine == "binned":
+        report = forest.memory_report()
+        print(f"binned index: {report['indexed_trees']} trees by lookup table, "
+              f"{report['fallback_trees']} by traversal, {report['table_cells']:,} table cells, "
+              f"{report['index_bytes']['total'] / 2**20:.1f} MiB")
+    for name, difference in differences.items():
+        print(f"max |difference| {name:<18} {difference:.3e}")
+    
+    if max(differences.values()) > args.tolerance:
+        print(f"FAILED: difference exceeds {args.tolerance:g}", file=sys.stderr)
+        return 1
+    print("OK")
+    return 0
+
+
+# =========================================================
+# 💾 export 子命令
+# =========================================================
+def run_export(args):
+    """把模型编译并导出为内存映射目录"""
+    model_path = args.model or core.find_model_path()
+    model = core.load_model(model_path)
+    if model is None:
+        print("error: model file not found", file=sys.stderr)
+        return 2
+    
+    forest = compile_forest(model)
+    save_flat_forest(forest, args.output, source=os.path.basename(model_path))
+    
+    started = time.perf_counter()
+    core.load_model(args.output)
+    print(f"wrote {args.output}: {forest.n_trees} trees, {forest.nbytes / 2**20:.1f} MiB of arrays, "
+          f"loads in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return 0
+
+
+# =========================================================
+# 🗜️ compact 子命令
+# =========================================================
+def run_compact(args):
+    """压缩模型并与原模型对比；一致性低于阈值时不写出压缩模型并返回 1"""
+    import json
+    
+    from rsf import compact
+    
+    # 默认以 sksurv 原模型为基准（跳过 .flat 目录），文件大小与加载时间的对比才有意义
+    model_path = args.model or core.find_model_path(include_flat=False)
+    model = core.load_model(model_path) if model_path is not None else None
+    if model is None:
+        print("error: model file not found", file=sys.stderr)
+        return 2
+    
+    feature_names = [str(f) for f in getattr(model, "feature_names_in_", core.load_feature_list(args.features))]
+    reference = core.synthetic_cohort(args.rows, feature_names, seed=args.seed).to_numpy(dtype=np.float32)
+    forest, summary = compact.compact_forest(model, dtype=args.dtype, time_tolerance=args.time_tolerance,
+                                             node_tolerance=args.node_tolerance, n_trees=args.trees,
+                                             reference=reference)
+    # 一致性在另一个队列上评估：--trees 的选树用过 reference，在同一队列上评估会偏乐观
+    X = core.synthetic_cohort(args.rows, feature_names, seed=args.seed + 1).to_numpy(dtype=np.float32)
+    
+    # 先写入临时文件，通过检查后再替换目标文件
+    tmp_path = args.output + ".tmp"
+    compact.save_compact(forest, tmp_path, dtype=args.dtype, compress=args.compress)
+    try:
+        report = compact.compaction_report(model, forest, X, model_path, tmp_path, summary)
+        failures = compact.check_agreement(report, args.min_concordance, args.max_survival_diff)
+        report["passed"] = not failures
+        report["failures"] = failures
+        if not failures:
+            os.replace(tmp_path, args.output)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    
+    size = report["size"]
+    agreement = report["agreement"]
+    print(f"trees {summary['trees_before']} -> {summary['trees_after']}, "
+          f"nodes {summary['nodes_before']:,} -> {summary['nodes_after']:,}, "
+          f"leaves {summary['leaves_before']:,} -> {summary['leaves_after']:,}, "
+          f"time points {summary['times_before']} -> {summary['times_after']}, "
+          f"merged splits {summary['merged_splits']}, leaf dtype {summary['dtype']}")
+    print(f"file size {size['original_bytes'] / 2**20:.2f} MiB -> {size['compact_bytes'] / 2**20:.2f} MiB, "
+          f"load time {size['original_load_s'] * 1000:.0f} ms -> {size['compact_load_s'] * 1000:.0f} ms")
+    for year in core.SURVIVAL_HORIZONS:
+        difference = agreement[f"survival_{year}y"]
+        print(f"{year}-year survival  max |difference| {difference['max_abs_diff']:.2e}  "
+              f"mean {difference['mean_abs_diff']:.2e}")
+    print(f"risk concordance with original ranking {agreement['concordance']:.6f}")
+    
+    if failures:
+        for failure in failures:
+            print(f"FAILED: {failure}", file=sys.stderr)
+        print(f"{args.output} was not written", file=sys.stderr)
+        return 1
+    print(f"wrote {args.output}")
+    return 0
+
+
+# =========================================================
+# 🪶 distill 子命令
+# =========================================================
+def run_distill(args):
+    """蒸馏单棵树的代理模型并与完整森林对比；平均差异超过阈值时不写出并返回 1"""
+    import json
+    
+    from rsf import surrogate as distill
+    
+    model_path = args.model or core.find_model_path()
+    model = core.load_model(model_path)
+    if model is None:
+        print("error: model file not found", file=sys.stderr)
+        return 2
+    
+    forest = compile_forest(model)
+    feature_names = [str(f) for f in getattr(forest, "feature_names_in_", core.load_feature_list(args.features))]
+    surrogate, summary = distill.distill_forest(forest, n_samples=args.samples, max_depth=args.max_depth,
+                                                min_samples_leaf=args.min_leaf, dtype=args.dtype, seed=args.seed,
+                                                feature_list=feature_names)
+    # 参考队列与蒸馏样本使用不同的随机种子
+    reference = core.synthetic_cohort(args.rows, feature_names, seed=args.seed + 1).to_numpy(dtype=np.float32)
+    report = distill.agreement_report(forest, surrogate, reference)
+    report["summary"] = summary
+    report["source"] = os.path.basename(model_path)
+    agreement = report["agreement"]
+    failures = []
+    if agreement["mean_abs_diff"] > args.max_mean_diff:
+        failures.append(f"mean 1-4 year survival difference {agreement['mean_abs_diff']:.4f} > {args.max_mean_diff}")
+    if agreement["concordance"] < args.min_concordance:
+        failures.append(f"risk concordance {agreement['concordance']:.4f} < {args.min_concordance}")
+    report["passed"] = not failures
+    report["failures"] = failures
+    
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    
+    latency = report["latency"]
+    print(f"distilled {summary['samples']:,} samples in {summary['label_s'] + summary['fit_s']:.1f}s: "
+          f"depth {summary['max_depth']}, {summary['leaves']:,} leaves, "
+          f"{surrogate.nbytes / 2**20:.1f} MiB of arrays ({summary['dtype']})")
+    for year in core.SURVIVAL_HORIZONS:
+        difference = agreement[f"survival_{year}y"]
+        print(f"{year}-year survival  mean |difference| {difference['mean_abs_diff']:.4f}  "
+              f"p95 {difference['p95_abs_diff']:.4f}  max {difference['max_abs_diff']:.4f}")
+    print(f"risk concordance with the forest {agreement['concordance']:.4f}")
+    print(f"single patient {latency['forest_single_s'] * 1000:.3f} ms -> {latency['surrogate_single_s'] * 1000:.3f} ms, "
+          f"per patient in a batch {latency['forest_per_patient_s'] * 1e6:.1f} us -> "
+          f"{latency['surrogate_per_patient_s'] * 1e6:.2f} us (forest -> surrogate)")
+    
+    if failures:
+        for failure in failures:
+            print(f"FAILED: {failure}", file=sys.stderr)
+        print(f"{args.output} was not written", file=sys.stderr)
+        return 1
+    save_flat_forest(surrogate, args.output, source=report["source"],
+                     metadata={key: report[key] for key in ("summary", "agreement", "source")})
+    print(f"wrote {args.output}")
+    return 0
+
+
+# =========================================================
+# 🌐 serve 子命令
+# =========================================================
+def run_serve(args):
+    """启动本地异步 HTTP 推理服务：加载、编译并预热完成后才开始监听"""
+    from rsf.service import run_server
+    from rsf.startup import load_and_warm_up
+    
+    # 原始 sksurv 模型编译后即被释放，预派生时只有编译后的数组进入工作进程
+    engine, feature_list, report = load_and_warm_up(
+        args.model, args.features, compile_model=lambda model: _load_engine(model, args.engine), curves=False)
+    if engine is None:
+        print("error: model file not found", file=sys.stderr)
+        return 2
+    print(report.format(), flush=True)
+    
+    options = dict(window_ms=args.window_ms, max_batch_rows=args.max_batch_rows, max_queue=args.max_queue)
+    if args.workers > 1:
+        from rsf.prefork import serve_prefork
+        
+        serve_prefork(engine, feature_list, host=args.host, port=args.port, workers=args.workers, **options)
+    else:
+        run_server(engine, feature_list, host=args.host, port=args.port, **options)
+    return 0
+
+
+# =========================================================
+# 🗂️ models 子命令
+# =========================================================
+def run_models(args):
+    """列出模型目录中的各版本、别名与 A/B 分流比例"""
+    import datetime
+    
+    from rsf.registry import MODEL_DIR, ModelRegistry
+    
+    registry = ModelRegistry(args.dir or MODEL_DIR)
+    if not registry.uses_directory:
+        print(f"{registry.directory} does not exist; using the first model found in core.MODEL_PATHS")
+    production, candidate = registry.production, registry.candidate
+    for version in registry.versions:
+        role = ("production" if version is production
+                else f"candidate ({registry.candidate_share:.0%})" if version is candidate else "")
+        modified = datetime.datetime.fromtimestamp(version.modified).strftime("%Y-%m-%d %H:%M")
+        print(f"{version.version}  {version.name:<32} {modified}  {role:<18} "
+              f"features: {version.feature_path or 'default list'}")
+    for name, error in registry.errors.items():
+        print(f"error: {name}: {error}", file=sys.stderr)
+    return 0 if registry.versions else 2
+
+
+# =========================================================
+# 🚀 warmup 子命令
+# =========================================================
+def run_warmup(args):
+    """加载模型并预热一次，逐阶段报告导入与启动耗时
+    
+    也可在构建容器镜像时运行，预先生成字节码与 matplotlib 字体缓存。
+    """
+    import json
+    
+    from rsf.startup import load_and_warm_up
+    
+    engine, _, report = load_and_warm_up(
+        args.model, args.features, compile_model=lambda model: _load_engine(model, args.engine),
+        render=not args.no_render)
+    if engine is None:
+        print("error: model file not found", file=sys.stderr)
+        return 2
+    print(json.dumps(report.as_dict(), indent=2) if args.json else report.format())
+    return 0
+
+
+# =========================================================
+# 🧭 explain 子命令
+# =========================================================
+def _init_explain_worker(model_path, feature_path):
+    """每个工作进程只构建一次 TreeSHAP 解释器"""
+    from rsf.explain import TreeExplainer
+    
+    _init_worker(model_path, feature_path)
+    _worker_state["explainer"] = TreeExplainer(_worker_state["model"])
+
+
+def _explain_chunk(chunk, id_columns):
+    """校验并解释一块数据，返回 (每行的 SHAP 值, 各特征 |SHAP| 之和, 问题记录)"""
+    from rsf.explain import shap_frame
+    
+    explainer = _worker_state["explainer"]
+    features, issues = core.validate_cohort(chunk, _worker_state["features"])
+    shap_values = explainer.shap_values(features)
+    results = shap_frame(explainer, shap_values, features.index)
+    results.insert(0, "row", results.index)
+    for column in reversed(id_columns):
+        results.insert(1, column, chunk.loc[results.index, column])
+    return results, np.abs(shap_values).sum(axis=0), issues
+
+
+def run_explain(args):
+    """分块计算每个患者的 TreeSHAP 值并按输入顺序写出，同时汇总队列层面的特征重要性"""
+    from rsf.explain import EXPLAIN_OUTPUTS, importance_frame
+    
+    model_path = args.model or core.find_model_path()
+    if model_path is None or not os.path.exists(model_path):
+        print("error: model file not found", file=sys.stderr)
+        return 2
+    
+    workers = args.workers or os.cpu_count() or 1
+    writer = ChunkWriter(args.output)
+    n_explained = n_rejected = 0
+    abs_sum = None
+    feature_names = None
+    started = time.perf_counter()
+    
+    def collect(result):
+        nonlocal n_explained, n_rejected, abs_sum
+        results, chunk_abs_sum, issues = result
+        writer.write(results)
+        n_explained += len(results)
+        n_rejected += issues["Row"].nunique()
+        abs_sum = chunk_abs_sum if abs_sum is None else abs_sum + chunk_abs_sum
+        if not args.quiet:
+            print(f"explained {n_explained:,} rows ({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+    
+    chunks = iter_input_chunks(args.input, args.chunk_size)
+    try:
+        if workers == 1:
+            _init_explain_worker(model_path, args.features)
+            feature_names = _worker_state["explainer"].feature_names
+            for chunk in chunks:
+                collect(_explain_chunk(chunk, args.id_column))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_explain_worker,
+                                     initargs=(model_path, args.features)) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(_explain_chunk, chunk, args.id_column))
+                    if len(pending) >= 2 * workers:
+                        collect(pending.popleft().result())
+                while pending:
+                    collect(pending.popleft().result())
+    finally:
+        writer.close()
+    
+    elapsed = time.perf_counter() - started
+    print(f"done: {n_explained:,} explained, {n_rejected:,} rejected in {elapsed:.1f}s "
+          f"({n_explained / max(elapsed, 1e-9):,.0f} rows/s, {workers} workers)", file=sys.stderr)
+    if not n_explained:
+        return 0
+    
+    if feature_names is None:
+        feature_names = [str(f) for f in core.load_model(model_path).feature_names_in_]
+    importance = importance_frame(abs_sum / n_explained, feature_names, EXPLAIN_OUTPUTS)
+    importance.insert(0, "label", [core.FEATURE_LABEL_MAP.get(f, f) for f in importance.index])
+    print("mean |SHAP| per feature:")
+    print(importance.to_string(float_format=lambda value: f"{value:.4f}"))
+    if args.importance:
+        importance.to_csv(args.importance, index_label="feature", encoding='utf-8-sig')
+        print(f"wrote {args.importance}")
+    return 0
+
+
+# =========================================================
+# 🎨 render-timing 子命令
+# =========================================================
+def run_render_timing(args):
+    """对比生存曲线的逐次重绘、复用渲染器与浏览器端矢量图规格的耗时"""
+    from rsf.plot import measure_render_time
+    
+    model = core.load_model(args.model)
+    if model is None:
+        print("error: model file not found", file=sys.stderr)
+        return 2
+    
+    cohort = core.synthetic_cohort(1, core.load_feature_list(args.features), seed=args.seed)
+    _, surv_func = core.predict_survival(compile_forest(model), cohort)
+    for name, ms in measure_render_time(surv_func, repeats=args.repeats).items():
+        print(f"{name:<18} {ms:8.1f} ms")
+    return 0
+
+
+# =========================================================
+# 🖨️ report 子命令
+# =========================================================
+def run_report(args):
+    """为队列中每位患者生成一页报告：一次预测全部患者，在进程池中渲染，按输入顺序写入 ZIP 或多页 PDF"""
+    from rsf.report import generate_reports, report_footer
+    
+    model_path = args.model or core.find_model_path()
+    model = core.load_model(model_path)
+    if model is None:
+        print("error: model file not found", file=sys.stderr)
+        return 2
+    if not args.output.lower().endswith((".zip", ".pdf")):
+        print("error: output must be a .zip or .pdf file", file=sys.stderr)
+        return 2
+    
+    cohort = pd.concat(iter_input_chunks(args.input, core.BATCH_CHUNK_SIZE))
+    if args.id_column is not None and args.id_column not in cohort.columns:
+        print(f"error: id column not found: {args.id_column}", file=sys.stderr)
+        return 2
+    started = time.perf_counter()
+    
+    def progress(done):
+        if not args.quiet:
+            print(f"rendered {done:,} reports ({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+    
+    try:
+        summary, issues = generate_reports(compile_forest(model), cohort, args.output,
+                                           core.load_feature_list(args.features), fmt=args.format,
+                                           workers=args.workers, dpi=args.dpi, id_column=args.id_column,
+                                           chunk_size=args.chunk_size, footer=report_footer(model_path),
+                                           progress_callback=progress)
+    except ValueError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+    
+    if args.rejects is not None and len(issues):
+        issues.to_csv(args.rejects, index=False, encoding='utf-8-sig')
+    print(f"done: {summary['reports']:,} reports ({summary['format']}), {summary['rejected']:,} rejected "
+          f"in {summary['seconds']:.1f}s ({summary['pages_per_s']:,.1f} pages/s, {summary['workers']} workers); "
+          f"wrote {args.output} ({summary['bytes'] / 2**20:.1f} MiB)", file=sys.stderr)
+    return 0
+
+
+# =========================================================
+# ✅ validate 子命令
+# =========================================================
+def run_validate(args):
+    """在带随访数据的队列上评估模型：一次预测，指标点估计、bootstrap 置信区间与校准，写出 JSON 报告"""
+    import json
+    
+    from rsf.validation import bootstrap, calibration_table, metrics_table, validation_set_from_cohort
+    
+    model = core.load_model(args.model)
+    if model is None:
+        print("error: model file not found", file=sys.stderr)
+        return 2
+    
+    cohort = pd.concat(iter_input_chunks(args.input, core.BATCH_CHUNK_SIZE))
+    started = time.perf_counter()
+    try:
+        validation, issues = validation_set_from_cohort(compile_forest(model), cohort,
+                                                        core.load_feature_list(args.features),
+                                                        args.time_column, args.event_column)
+    except ValueError as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+    if args.rejects is not None and len(issues):
+        issues.to_csv(args.rejects, index=False, encoding='utf-8-sig')
+    summary = validation.summary()
+    print(f"{summary['patients']:,} patients, {summary['events']:,} events, "
+          f"{issues['Row'].nunique():,} rows rejected, median follow-up {summary['median_follow_up']:.2f} years")
+    
+    def progress(done, total):
+        if not args.quiet:
+            print(f"bootstrap {done:,} / {total:,} ({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+    
+    replicates = None
+    if args.bootstrap > 0:
+        replicates = bootstrap(validation, args.bootstrap, workers=args.workers, seed=args.seed,
+                               chunk_size=args.chunk_size, progress_callback=progress)
+    metrics = metrics_table(validation, replicates, level=args.confidence)
+    calibration = calibration_table(validation, groups=args.groups, level=args.confidence)
+    
+    for row in metrics.itertuples():
+        horizon = f"{row.horizon:g}y" if pd.notna(row.horizon) else ""
+        interval = f"  [{row.ci_low:.4f}, {row.ci_high:.4f}]" if pd.notna(row.ci_low) else ""
+        print(f"{row.metric:<24} {horizon:<4} {row.estimate:.4f}{interval}")
+    
+    report = {"input": args.input, "model": args.model or core.find_model_path(), "cohort": summary,
+              "bootstrap": args.bootstrap, "confidence": args.confidence, "seed": args.seed,
+              "seconds": round(time.perf_counter() - started, 2),
+              "metrics": json.loads(metrics.to_json(orient="records")),
+              "calibration": json.loads(calibration.to_json(orient="records"))}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output} ({report['seconds']:.1f}s)")
+    return 0
+
+
+# =========================================================
+# ⏱️ bench 子命令
+# =========================================================
+def run_bench(args):
+    """运行预测链路基准测试，写出 JSON 结果并与基线对比；有回退时返回 1"""
+    from rsf import bench
+    
+    if not os.path.exists(args.model):
+        print(f"error: model file not found: {args.model}", file=sys.stderr)
+        return 2
+    
+    sizes = [int(size) for size in args.sizes.split(",")]
+    engines = [engine for engine in args.engines.split(",") if engine]
+    results = bench.run_benchmarks(args.model, sizes=sizes, engines=engines, feature_path=args.features,
+                                   seed=args.seed, cold_repeats=args.cold_repeats)
+    bench.write_results(results, args.output)
+    print(f"wrote {args.output}")
+    
+    if args.update_baseline:
+        bench.write_results(results, args.baseline)
+        print(f"updated baseline {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+    
+    baseline = bench.read_results(args.baseline)
+    if baseline.get("environment") != results["environment"]:
+        print("note: baseline was recorded in a different environment; timings may not be comparable")
+    rows, regressed = bench.compare_results(results, baseline, args.tolerance, args.memory_tolerance)
+    print(bench.format_comparison(rows))
+    if regressed:
+        print("FAILED: performance regression against baseline", file=sys.stderr)
+        return 1
+    return 0
+
+
+# =========================================================
+# 🧑‍🤝‍🧑 loadtest 子命令
+# =========================================================
+def run_loadtest(args):
+    """并发模拟多个会话点击预测，写出 JSON 报告并与基线对比；有回退或错误时返回 1"""
+    from rsf import bench, loadtest
+    
+    if not os.path.exists(args.app):
+        print(f"error: app file not found: {args.app}", file=sys.stderr)
+        return 2
+    
+    report = loadtest.run_load_test(args.app, sessions=args.sessions, clicks=args.clicks,
+                                    concurrency=args.concurrency, feature_path=args.features, seed=args.seed)
+    print(loadtest.format_report(report))
+    bench.write_results(report, args.output)
+    print(f"wrote {args.output}")
+    failed = report["results"]["errors"]["count"] > 0
+    
+    if args.update_baseline:
+        bench.write_results(report, args.baseline)
+        print(f"updated baseline {args.baseline}")
+        return 1 if failed else 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --update-baseline to create one")
+        return 1 if failed else 0
+    
+    baseline = bench.read_results(args.baseline)
+    if baseline.get("environment") != report["environment"] or baseline.get("config") != report["config"]:
+        print("note: baseline was recorded with a different environment or load; results may not be comparable")
+    rows, regressed = loadtest.compare_reports(report, baseline, args.tolerance, args.memory_tolerance)
+    print(loadtest.format_comparison(rows))
+    if regressed:
+        print("FAILED: load-test regression against baseline", file=sys.stderr)
+        return 1
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m rsf", description="RSF survival prediction tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    score = subparsers.add_parser("score", help="score a cohort file without the web app")
+    score.add_argument("input", help="input CSV or Parquet file")
+    score.add_argument("output", help="output CSV or Parquet file")
+    score.add_argument("--model", help="model file (default: first of core.MODEL_PATHS found)")
+    score.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    score.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    score.add_argument("--chunk-size", type=int, default=core.BATCH_CHUNK_SIZE, help="rows per chunk")
+    score.add_argument("--max-pending", type=int, default=None,
+                       help="chunks in flight at once (default: 2 x workers)")
+    score.add_argument("--id-column", action="append", default=[],
+                       help="input column copied to the output (repeatable)")
+    score.add_argument("--rejects", help="write rows that failed validation to this CSV")
+    score.add_argument("--curves", help="also write every patient's full survival curve to this .parquet "
+                                        "(one float32 column per time point) or .npz file")
+    score.add_argument("--quiet", action="store_true", help="only print the final summary")
+    score.add_argument("--engine", choices=ENGINES, default="flat",
+                       help="prediction engine (default: flat)")
+    score.set_defaults(func=run_score)
+    
+    check = subparsers.add_parser("check-engine",
+                                  help="check the flat-array engine against sksurv predictions")
+    check.add_argument("--model", help="scikit-survival model file (default: first .joblib of core.MODEL_PATHS found)")
+    check.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    check.add_argument("--rows", type=int, default=2000, help="synthetic patients to compare")
+    check.add_argument("--seed", type=int, default=0)
+    check.add_argument("--engine", choices=ENGINES[:2], default="flat", help="engine to check (default: flat)")
+    check.add_argument("--tolerance", type=float, default=1e-10, help="largest allowed absolute difference")
+    check.set_defaults(func=run_check_engine)
+    
+    export = subparsers.add_parser("export", help="export the model as a memory-mapped .flat directory")
+    export.add_argument("--model", help="model file (default: first of core.MODEL_PATHS found)")
+    export.add_argument("--output", default="rsf_model.flat", help="output directory (default: rsf_model.flat)")
+    export.set_defaults(func=run_export)
+    
+    compact = subparsers.add_parser("compact", help="write a smaller model with bounded accuracy loss")
+    compact.add_argument("--model", help="model file (default: first .joblib of core.MODEL_PATHS found)")
+    compact.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    compact.add_argument("--output", default="rsf_model_compressed.joblib",
+                         help="output file (default: rsf_model_compressed.joblib)")
+    compact.add_argument("--dtype", choices=["float64", "float32", "float16"], default="float32",
+                         help="storage type of leaf curves (default: float32)")
+    compact.add_argument("--time-tolerance", type=float, default=0.001,
+                         help="drop time points that change no leaf's survival by more than this (default: 0.001)")
+    compact.add_argument("--node-tolerance", type=float, default=0.0,
+                         help="merge sibling leaves whose values differ by at most this (default: 0, identical only)")
+    compact.add_argument("--trees", type=int, default=None, help="keep this many trees (default: all)")
+    compact.add_argument("--rows", type=int, default=5000,
+                         help="synthetic patients for tree selection and, separately, for the agreement check "
+                              "(default: 5000)")
+    compact.add_argument("--seed", type=int, default=0)
+    compact.add_argument("--compress", type=int, default=3, help="joblib compression level (default: 3)")
+    compact.add_argument("--min-concordance", type=float, default=0.995,
+                         help="lowest allowed risk-ranking concordance with the original (default: 0.995)")
+    compact.add_argument("--max-survival-diff", type=float, default=0.01,
+                         help="largest allowed 1-4 year survival difference (default: 0.01)")
+    compact.add_argument("--report", help="also write the comparison report as JSON")
+    compact.set_defaults(func=run_compact)
+    
+    distill = subparsers.add_parser("distill", help="fit a one-tree surrogate for fallback and demo mode")
+    distill.add_argument("--model", help="model file (default: first of core.MODEL_PATHS found)")
+    distill.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    distill.add_argument("--output", default="rsf_surrogate.flat", help="output directory (default: rsf_surrogate.flat)")
+    distill.add_argument("--samples", type=int, default=200000,
+                         help="synthetic patients labelled by the forest (default: 200000)")
+    distill.add_argument("--max-depth", type=int, default=14, help="depth of the surrogate tree (default: 14)")
+    distill.add_argument("--min-leaf", type=int, default=20, help="samples per leaf at least (default: 20)")
+    distill.add_argument("--dtype", choices=["float64", "float32"], default="float32",
+                         help="storage type of leaf curves (default: float32)")
+    distill.add_argument("--rows", type=int, default=5000, help="synthetic reference patients (default: 5000)")
+    distill.add_argument("--seed", type=int, default=0)
+    distill.add_argument("--max-mean-diff", type=float, default=0.02,
+                         help="largest allowed mean 1-4 year survival difference (default: 0.02)")
+    distill.add_argument("--min-concordance", type=float, default=0.9,
+                         help="lowest allowed risk-ranking concordance with the forest (default: 0.9)")
+    distill.add_argument("--report", help="also write the comparison report as JSON")
+    distill.set_defaults(func=run_distill)
+    
+    serve = subparsers.add_parser("serve", help="run the async HTTP inference service")
+    serve.add_argument("--model", help="model file (default: first of core.MODEL_PATHS found)")
+    serve.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    serve.add_argument("--engine", choices=ENGINES, default="flat", help="prediction engine (default: flat)")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8600)
+    serve.add_argument("--window-ms", type=float, default=5.0,
+                       help="how long to collect concurrent requests into one batch (default: 5)")
+    serve.add_argument("--max-batch-rows", type=int, default=1024, help="patients per model call (default: 1024)")
+    serve.add_argument("--max-queue", type=int, default=1000,
+                       help="request slices allowed to wait; more are rejected with 503 (default: 1000)")
+    serve.add_argument("--workers", type=int, default=1,
+                       help="pre-forked worker processes sharing one copy of the model (default: 1)")
+    serve.set_defaults(func=run_serve)
+    
+    models = subparsers.add_parser("models", help="list model versions in the model directory")
+    models.add_argument("--dir", default=None,
+                        help="model directory (default: $RSF_MODEL_DIR or models/)")
+    models.set_defaults(func=run_models)
+    
+    warmup = subparsers.add_parser("warmup", help="load the model, warm it up and report start-up time")
+    warmup.add_argument("--model", help="model file (default: first of core.MODEL_PATHS found)")
+    warmup.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    warmup.add_argument("--engine", choices=ENGINES, default="flat", help="prediction engine (default: flat)")
+    warmup.add_argument("--no-render", action="store_true", help="skip the survival-curve render")
+    warmup.add_argument("--json", action="store_true", help="print the report as JSON")
+    warmup.set_defaults(func=run_warmup)
+    
+    explain = subparsers.add_parser("explain", help="compute TreeSHAP values and cohort feature importance")
+    explain.add_argument("input", help="input CSV or Parquet file")
+    explain.add_argument("output", help="per-patient SHAP values (CSV or Parquet)")
+    explain.add_argument("--model", help="model file (default: first of core.MODEL_PATHS found)")
+    explain.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    explain.add_argument("--importance", help="also write the mean |SHAP| per feature to this CSV")
+    explain.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    explain.add_argument("--chunk-size", type=int, default=5000, help="rows per chunk (default: 5000)")
+    explain.add_argument("--id-column", action="append", default=[],
+                         help="input column copied to the output (repeatable)")
+    explain.add_argument("--quiet", action="store_true", help="only print the final summary")
+    explain.set_defaults(func=run_explain)
+    
+    render = subparsers.add_parser("render-timing", help="time survival-curve rendering in the web app")
+    render.add_argument("--model", help="model file (default: first of core.MODEL_PATHS found)")
+    render.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    render.add_argument("--repeats", type=int, default=10, help="renders per method (default: 10)")
+    render.add_argument("--seed", type=int, default=0)
+    render.set_defaults(func=run_render_timing)
+    
+    report = subparsers.add_parser("report", help="write a one-page report for every patient in a cohort file")
+    report.add_argument("input", help="input CSV or Parquet file")
+    report.add_argument("output", help="output .zip (one file per patient) or .pdf (one multi-page document)")
+    report.add_argument("--model", help="model file (default: first of core.MODEL_PATHS found)")
+    report.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    report.add_argument("--format", choices=("png", "pdf"), default="png",
+                        help="file format inside a .zip output (default: png; pdf is vector)")
+    report.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    report.add_argument("--dpi", type=int, default=150, help="page resolution (default: 150)")
+    report.add_argument("--chunk-size", type=int, default=16,
+                        help="pages per worker task (default: 16)")
+    report.add_argument("--id-column", help="input column shown as the patient id and used in file names "
+                                            "(default: row number)")
+    report.add_argument("--rejects", help="write rows that failed validation to this CSV")
+    report.add_argument("--quiet", action="store_true", help="only print the final summary")
+    report.set_defaults(func=run_report)
+    
+    validate = subparsers.add_parser("validate", help="validate the model on a cohort with observed follow-up")
+    validate.add_argument("input", help="input CSV or Parquet file with the features plus follow-up columns")
+    validate.add_argument("--time-column", default="time", help="follow-up time in years (default: time)")
+    validate.add_argument("--event-column", default="event", help="event indicator, 1/0 or Yes/No (default: event)")
+    validate.add_argument("--model", help="model file (default: first of core.MODEL_PATHS found)")
+    validate.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    validate.add_argument("--bootstrap", type=int, default=1000,
+                          help="bootstrap replicates for confidence intervals, 0 for none (default: 1000)")
+    validate.add_argument("--confidence", type=float, default=0.95, help="confidence level (default: 0.95)")
+    validate.add_argument("--groups", type=int, default=10, help="calibration groups per horizon (default: 10)")
+    validate.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    validate.add_argument("--chunk-size", type=int, default=50, help="replicates per worker task (default: 50)")
+    validate.add_argument("--seed", type=int, default=0)
+    validate.add_argument("--output", default="validation_report.json",
+                          help="report file (default: validation_report.json)")
+    validate.add_argument("--rejects", help="write rows that failed validation to this CSV")
+    validate.add_argument("--quiet", action="store_true", help="do not print bootstrap progress")
+    validate.set_defaults(func=run_validate)
+    
+    bench_parser = subparsers.add_parser("bench", help="benchmark every stage of the prediction path")
+    bench_parser.add_argument("--model", default="rsf_model.joblib", help="model file (default: rsf_model.joblib)")
+    bench_parser.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    bench_parser.add_argument("--sizes", default="1,100,10000,1000000",
+                              help="comma-separated cohort sizes (default: 1,100,10000,1000000)")
+    bench_parser.add_argument("--engines", default="flat,sksurv", help="engines to benchmark (default: flat,sksurv)")
+    bench_parser.add_argument("--seed", type=int, default=0)
+    bench_parser.add_argument("--cold-repeats", type=int, default=3, help="fresh processes for cold load_model")
+    bench_parser.add_argument("--output", default="bench_results.json", help="results file (default: bench_results.json)")
+    bench_parser.add_argument("--baseline", default=os.path.join("benchmarks", "baseline.json"),
+                              help="baseline to compare against (default: benchmarks/baseline.json)")
+    bench_parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    bench_parser.add_argument("--tolerance", type=float, default=0.25,
+                              help="allowed relative slowdown of the median time (default: 0.25)")
+    bench_parser.add_argument("--memory-tolerance", type=float, default=0.25,
+                              help="allowed relative growth of peak memory (default: 0.25)")
+    bench_parser.set_defaults(func=run_bench)
+    
+    loadtest = subparsers.add_parser("loadtest", help="drive the web app with many concurrent simulated sessions")
+    loadtest.add_argument("--app", default="app.py", help="Streamlit script (default: app.py)")
+    loadtest.add_argument("--features", help="feature list file (default: selected_features.txt)")
+    loadtest.add_argument("--sessions", type=int, default=24, help="simulated sessions (default: 24)")
+    loadtest.add_argument("--clicks", type=int, default=5, help="predictions per session (default: 5)")
+    loadtest.add_argument("--concurrency", type=int, default=None,
+                          help="sessions active at the same time (default: all)")
+    loadtest.add_argument("--seed", type=int, default=0)
+    loadtest.add_argument("--output", default="loadtest_results.json",
+                          help="report file (default: loadtest_results.json)")
+    loadtest.add_argument("--baseline", default=os.path.join("benchmarks", "loadtest_baseline.json"),
+                          help="baseline to compare against (default: benchmarks/loadtest_baseline.json)")
+    loadtest.add_argument("--update-baseline", action="store_true", help="store this report as the baseline")
+    loadtest.add_argument("--tolerance", type=float, default=0.5,
+                          help="allowed relative slowdown of latency and throughput (default: 0.5)")
+    loadtest.add_argument("--memory-tolerance", type=float, default=0.5,
+                          help="allowed relative growth of memory per session (default: 0.5)")
+    loadtest.set_defaults(func=run_loadtest)
+    
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,275 @@
+# =========================================================
+# 🗜️ 模型压缩
+# 用法：python -m rsf compact --dtype float32 --time-tolerance 0.001 [--trees 100]
+#
+# 生成 rsf_model_compressed.joblib（FlatForest），步骤依次为：
+#   1. 可选：按对完整森林预测的贴合程度贪心挑选部分树
+#   2. 去掉生存曲线几乎不变的时间列（保留首末列与 1-4 年对应的列）
+#   3. 叶节点累积风险 / 生存概率降为 float32 或 float16
+#   4. 合并两个子节点都是取值相同叶节点的分裂，并去重相同的叶节点
+# 风险评分列始终来自完整时间轴，不受时间列删减影响。
+# 压缩后在参考队列上与原模型对比 1-4 年生存率与风险排序，低于阈值时不写出文件
+# =========================================================
+
+import copy
+import time
+
+import joblib
+import numpy as np
+from scipy import stats
+
+from rsf import core
+from rsf.artifact import path_size
+from rsf.engine import FlatForest, compile_forest
+
+COMPACT_DTYPES = ("float64", "float32", "float16")
+
+
+def _tree_ranges(forest):
+    """每棵树的节点编号范围（compile_forest 按树连续编号）"""
+    ends = np.append(forest.roots[1:], forest.n_nodes)
+    return list(zip(forest.roots, ends))
+
+# =========================================================
+# 🌲 树的挑选
+# =========================================================
+def select_trees(forest, X, n_trees):
+    """贪心前向选择 n_trees 棵树，使其平均预测（风险评分与 1-4 年生存率）最接近完整森林
+    
+    各列先按完整森林预测的标准差归一化，返回按入选顺序排列的树编号。
+    """
+    columns = core.get_horizon_columns(forest.unique_times_, core.SURVIVAL_HORIZONS)
+    value_columns = np.concatenate([[0], 1 + forest.n_times + columns[columns >= 0]])
+    
+    leaves = forest.apply(X)
+    per_tree = forest.leaf_values[:, value_columns][leaves].astype(np.float64)  # (n, n_trees, 列数)
+    target = per_tree.mean(axis=1)
+    scale = target.std(axis=0)
+    scale[scale == 0] = 1.0
+    per_tree /= scale
+    target /= scale
+    
+    selected = []
+    remaining = np.ones(forest.n_trees, dtype=bool)
+    total = np.zeros_like(target)
+    for k in range(1, n_trees + 1):
+        candidates = np.flatnonzero(remaining)
+        errors = (((total[:, np.newaxis, :] + per_tree[:, candidates]) / k
+                   - target[:, np.newaxis, :]) ** 2).mean(axis=(0, 2))
+        best = candidates[np.argmin(errors)]
+        selected.append(int(best))
+        remaining[best] = False
+        total += per_tree[:, best]
+    return np.asarray(selected)
+
+# =========================================================
+# 🕒 时间列删减
+# =========================================================
+def select_time_columns(surv, tolerance, keep=()):
+    """从左到右扫描时间列：与上一个保留列相比，任一叶节点生存概率变化超过 tolerance 时保留
+    
+    删去的时间点按阶梯函数取上一个保留列的值，因此每个叶节点的曲线误差不超过 tolerance。
+    首列、末列与 keep 中的列始终保留。
+    """
+    n_times = surv.shape[1]
+    must_keep = np.zeros(n_times, dtype=bool)
+    must_keep[[0, n_times - 1]] = True
+    must_keep[[k for k in keep if k >= 0]] = True
+    
+    kept = [0]
+    for j in range(1, n_times):
+        if must_keep[j] or np.max(np.abs(surv[:, j] - surv[:, kept[-1]])) > tolerance:
+            kept.append(j)
+    return np.asarray(kept)
+
+# =========================================================
+# 🔗 冗余节点合并与重新组装
+# =========================================================
+def merge_redundant_nodes(forest, leaf_row, leaf_values, tolerance=0.0):
+    """两个子节点都是叶节点且取值最大差不超过 tolerance 时，把父节点改为叶节点
+    
+    leaf_row 为每个节点对应的叶矩阵行（内部节点为 -1），原地更新；
+    tolerance > 0 时合并后的取值为两子节点的平均，追加到叶矩阵末尾。
+    返回 (leaf_values, 合并的分裂数)。
+    """
+    merged = 0
+    while True:
+        internal = np.flatnonzero(leaf_row < 0)
+        left = forest.left[internal]
+        both_leaves = (leaf_row[left] >= 0) & (leaf_row[left + 1] >= 0)
+        parents, left = internal[both_leaves], left[both_leaves]
+        rows_left, rows_right = leaf_row[left], leaf_row[left + 1]
+        difference = np.abs(leaf_values[rows_left].astype(np.float64)
+                            - leaf_values[rows_right]).max(axis=1)
+        mergeable = difference <= tolerance
+        if not mergeable.any():
+            return leaf_values, merged
+        
+        parents, rows_left, rows_right = parents[mergeable], rows_left[mergeable], rows_right[mergeable]
+        identical = difference[mergeable] == 0
+        leaf_row[parents[identical]] = rows_left[identical]
+        if (~identical).any():
+            averaged = (leaf_values[rows_left[~identical]].astype(np.float64)
+                        + leaf_values[rows_right[~identical]]) / 2
+            leaf_row[parents[~identical]] = len(leaf_values) + np.arange(len(averaged))
+            leaf_values = np.concatenate([leaf_values, averaged.astype(leaf_values.dtype)])
+        merged += len(parents)
+
+
+def assemble_forest(forest, trees, leaf_row, leaf_values, unique_times, is_event_time):
+    """只保留 trees 中从根可达的节点重新编号（兄弟节点相邻），相同的叶节点行去重"""
+    ranges = _tree_ranges(forest)
+    orders = []
+    for t in trees:
+        order = [int(ranges[t][0])]
+        for node in order:
+            if leaf_row[node] < 0:
+                order.extend((int(forest.left[node]), int(forest.left[node]) + 1))
+        orders.append(order)
+    
+    old = np.concatenate(orders)
+    roots = np.cumsum([0] + [len(order) for order in orders[:-1]]).astype(np.int32)
+    new_id = np.full(forest.n_nodes, -1, dtype=np.int32)
+    new_id[old] = np.arange(len(old), dtype=np.int32)
+    
+    is_leaf = leaf_row[old] >= 0
+    internal = ~is_leaf
+    ids = np.arange(len(old), dtype=np.int32)
+    
+    feature = np.where(internal, forest.feature[old], 0).astype(np.int32)
+    threshold = np.where(internal, forest.threshold[old], np.inf)
+    left = np.where(internal, new_id[np.where(internal, forest.left[old], old)], ids).astype(np.int32)
+    right = np.where(internal, left + 1, ids).astype(np.int32)
+    missing_left = np.where(internal, forest.missing_left[old], False)
+    
+    unique_rows, inverse = np.unique(leaf_values[leaf_row[old[is_leaf]]], axis=0, return_inverse=True)
+    leaf_index = np.full(len(old), -1, dtype=np.int32)
+    leaf_index[is_leaf] = inverse.ravel()
+    
+    return FlatForest(
+        feature=feature,
+        threshold=threshold,
+        left=left,
+        right=right,
+        missing_left=missing_left,
+        leaf_index=leaf_index,
+        roots=roots,
+        leaf_values=unique_rows,
+        unique_times=unique_times,
+        is_event_time=is_event_time,
+        n_features=forest.n_features_in_,
+        feature_names=getattr(forest, "feature_names_in_", None),
+        # 合并后的父节点保留原来的样本数
+        node_cover=None if forest.node_cover is None else forest.node_cover[old],
+    )
+
+# =========================================================
+# 🗜️ 压缩
+# =========================================================
+def compact_forest(model, dtype="float32", time_tolerance=0.001, node_tolerance=0.0, n_trees=None,
+                   reference=None):
+    """压缩 sksurv 模型或 FlatForest，返回 (压缩后的 FlatForest, 各步骤统计)
+    
+    reference 为挑选树时使用的参考队列（特征数组），n_trees 为 None 时保留全部树。
+    """
+    if dtype not in COMPACT_DTYPES:
+        raise ValueError(f"dtype must be one of {COMPACT_DTYPES}")
+    forest = compile_forest(model)
+    summary = {"trees_before": forest.n_trees, "nodes_before": forest.n_nodes,
+               "leaves_before": forest.n_leaves, "times_before": forest.n_times}
+    
+    trees = np.arange(forest.n_trees)
+    if n_trees is not None and n_trees < forest.n_trees:
+        if reference is None:
+            raise ValueError("Selecting trees needs a reference cohort")
+        trees = np.sort(select_trees(forest, reference, n_trees))
+    
+    horizon_columns = core.get_horizon_columns(forest.unique_times_, core.SURVIVAL_HORIZONS)
+    times = select_time_columns(forest.leaf_surv, time_tolerance, keep=horizon_columns)
+    leaf_values = forest.leaf_values[:, forest.value_columns(times)].astype(dtype)
+    
+    leaf_row = forest.leaf_index.copy()
+    leaf_values, merged = merge_redundant_nodes(forest, leaf_row, leaf_values, node_tolerance)
+    compact = assemble_forest(forest, trees, leaf_row, leaf_values,
+                              unique_times=forest.unique_times_[times],
+                              is_event_time=forest.is_event_time_[times])
+    
+    summary.update({"trees_after": compact.n_trees, "nodes_after": compact.n_nodes,
+                    "leaves_after": compact.n_leaves, "times_after": compact.n_times,
+                    "merged_splits": merged, "dtype": dtype})
+    return compact, summary
+
+
+def save_compact(forest, path, dtype="float32", compress=3):
+    """写出压缩模型：叶矩阵按 dtype 存储（float16 在加载时转为 float32 计算）"""
+    stored = copy.copy(forest)
+    stored.leaf_values = forest.leaf_values.astype(dtype, copy=False)
+    joblib.dump(stored, path, compress=compress)
+
+# =========================================================
+# 📊 与原模型对比
+# =========================================================
+def _load_time(path, repeats=3):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        core.load_model(path)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def compare_predictions(original, compact, X):
+    """在参考队列上对比原模型与压缩模型
+    
+    survival_{y}y     1-4 年生存率的最大 / 平均绝对差
+    curve             在原时间轴上整条生存曲线的最大绝对差
+    concordance       风险评分排序一致性（以原模型风险排序为参照的 C-index，即 (1 + Kendall τ) / 2）
+    """
+    risk_original, surv_original, _ = core.predict_forest(original, X)
+    risk_compact, surv_compact, _ = core.predict_forest(compact, X)
+    
+    horizons_original = core.get_survival_probabilities(original.unique_times_, surv_original,
+                                                        core.SURVIVAL_HORIZONS)
+    horizons_compact = core.get_survival_probabilities(compact.unique_times_, surv_compact,
+                                                       core.SURVIVAL_HORIZONS)
+    # 压缩模型的时间轴是原时间轴的子集且包含首列，按阶梯函数映射到原时间点
+    mapping = np.searchsorted(compact.unique_times_, original.unique_times_, side="right") - 1
+    
+    result = {}
+    for j, year in enumerate(core.SURVIVAL_HORIZONS):
+        difference = np.abs(horizons_original[:, j] - horizons_compact[:, j])
+        result[f"survival_{year}y"] = {"max_abs_diff": float(difference.max()),
+                                       "mean_abs_diff": float(difference.mean())}
+    result["curve_max_abs_diff"] = float(np.abs(surv_original - surv_compact[:, mapping]).max())
+    result["risk_max_abs_diff"] = float(np.abs(risk_original - risk_compact).max())
+    tau = stats.kendalltau(risk_original, risk_compact).statistic
+    result["concordance"] = float((1 + tau) / 2)
+    return result
+
+
+def compaction_report(original, compact, X, original_path, compact_path, summary):
+    """对比预测、文件大小与加载时间"""
+    report = {"summary": summary, "reference_rows": int(len(X)),
+              "agreement": compare_predictions(original, compact, X)}
+    report["size"] = {
+        "original_bytes": path_size(original_path),
+        "compact_bytes": path_size(compact_path),
+        "original_load_s": _load_time(original_path),
+        "compact_load_s": _load_time(compact_path),
+        "original_leaf_bytes": int(compile_forest(original).leaf_values.nbytes),
+        "compact_leaf_bytes": int(compact.leaf_values.size * np.dtype(summary["dtype"]).itemsize),
+    }
+    return report
+
+
+def check_agreement(report, min_concordance, max_survival_diff):
+    """返回未达标项的说明列表，空列表表示通过"""
+    agreement = report["agreement"]
+    failures = []
+    if agreement["concordance"] < min_concordance:
+        failures.append(f"risk concordance {agreement['concordance']:.5f} < {min_concordance}")
+    for year in core.SURVIVAL_HORIZONS:
+        difference = agreement[f"survival_{year}y"]["max_abs_diff"]
+        if difference > max_survival_diff:
+            failures.append(f"{year}-year survival differs by up to {difference:.4f} > {max_survival_diff}")
+    return failures
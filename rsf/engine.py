@@ -0,0 +1,320 @@
+# =========================================================
+# ⚙️ 展平数组森林引擎
+# 把 sksurv 随机生存森林的所有树展平为连续的 NumPy 数组，
+# 整批样本 × 全部树一起做向量化遍历，避免逐树的 Python 调度
+# =========================================================
+
+import numpy as np
+
+# 遍历时每块的样本数（块内的节点数组可放进 CPU 缓存）
+APPLY_BLOCK_ROWS = 4096
+
+
+def prepare_features(model, input_data):
+    """按模型训练时的特征顺序整理输入，并转换为 float32 数组（与 sksurv 一致）"""
+    if hasattr(input_data, "columns"):
+        feature_names = getattr(model, "feature_names_in_", None)
+        # 列顺序已一致时跳过 DataFrame 重排（单个患者预测时这是主要开销）
+        if feature_names is not None and list(input_data.columns) != list(feature_names):
+            input_data = input_data[list(feature_names)]
+    
+    X = np.ascontiguousarray(input_data, dtype=np.float32)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.shape[1] != model.n_features_in_:
+        raise ValueError(
+            f"X has {X.shape[1]} features, but the model expects {model.n_features_in_}"
+        )
+    return X
+
+
+class FlatForest:
+    """展平后的随机生存森林
+    
+    节点数组（全森林统一编号，同一父节点的左右子节点编号相邻）：
+        feature, threshold       分裂特征与阈值，x <= threshold 走左子节点
+        left, right              子节点编号，right == left + 1；叶节点的左右子节点都指向自身
+        missing_left             缺失值是否走左子节点
+        leaf_index               节点在叶矩阵中的行号，内部节点为 -1
+        roots                    每棵树根节点的编号
+        node_cover               训练时落入每个节点的（加权）样本数，TreeSHAP 需要；旧模型文件中可能为 None
+    叶矩阵 leaf_values（所有树共享 unique_times_ 时间轴），形状 (n_leaves, 1 + 2 * n_times)：
+        第 0 列                  叶节点风险评分（事件时间点上累积风险之和），即 leaf_risk
+        第 1 .. n_times 列        累积风险，即 leaf_chf
+        其余列                   生存概率，即 leaf_surv
+    
+    属性命名与 sksurv 模型一致（unique_times_、feature_names_in_ 等），
+    可以直接传给 core.predict_forest / predict_survival。
+    """
+    
+    def __init__(self, feature, threshold, left, right, missing_left, leaf_index, roots,
+                 leaf_values, unique_times, is_event_time, n_features,
+                 feature_names=None, max_depth=None, node_cover=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.leaf_index = leaf_index
+        self.roots = roots
+        self.leaf_values = _compute_dtype(leaf_values)
+        self.unique_times_ = unique_times
+        self.is_event_time_ = is_event_time
+        self.n_features_in_ = n_features
+        if feature_names is not None:
+            self.feature_names_in_ = feature_names
+        self.max_depth = int(max_depth) if max_depth is not None else _max_depth(left, right, roots)
+        self.node_cover = node_cover
+    
+    def __setstate__(self, state):
+        # float16 只用于存储（python -m rsf compact），反序列化后转为 float32 计算
+        self.__dict__.update(state)
+        self.leaf_values = _compute_dtype(self.leaf_values)
+        self.__dict__.setdefault("node_cover", None)
+    
+    @property
+    def n_trees(self):
+        return len(self.roots)
+    
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+    
+    @property
+    def n_leaves(self):
+        return self.leaf_values.shape[0]
+    
+    @property
+    def n_times(self):
+        return len(self.unique_times_)
+    
+    @property
+    def leaf_risk(self):
+        return self.leaf_values[:, 0]
+    
+    @property
+    def leaf_chf(self):
+        return self.leaf_values[:, 1:1 + self.n_times]
+    
+    @property
+    def leaf_surv(self):
+        return self.leaf_values[:, 1 + self.n_times:]
+    
+    @property
+    def nbytes(self):
+        """全部数组占用的字节数"""
+        return sum(getattr(self, name).nbytes for name in (
+            "feature", "threshold", "left", "right", "missing_left", "leaf_index",
+            "roots", "leaf_values", "unique_times_", "is_event_time_", "node_cover")
+            if getattr(self, name) is not None)
+    
+    # -----------------------------------------------------
+    # 遍历
+    # -----------------------------------------------------
+    def apply(self, X, trees=None):
+        """返回每个样本在每棵树中的叶节点（叶矩阵行号），形状 (n, n_trees)
+        
+        X 为 prepare_features 得到的 float32 数组；trees 可指定只遍历部分树。
+        """
+        roots = self.roots if trees is None else self.roots[trees]
+        if X.shape[0] <= APPLY_BLOCK_ROWS:
+            return self.leaf_index.take(self._apply_nodes(X, roots))
+        return np.concatenate([
+            self.leaf_index.take(self._apply_nodes(X[start:start + APPLY_BLOCK_ROWS], roots))
+            for start in range(0, X.shape[0], APPLY_BLOCK_ROWS)
+        ])
+    
+    def _apply_nodes(self, X, roots):
+        n_samples, n_features = X.shape
+        X_flat = X.ravel()
+        row_offset = (np.arange(n_samples, dtype=np.intp) * n_features)[:, np.newaxis]
+        node = np.repeat(roots[np.newaxis, :], n_samples, axis=0)
+        
+        # 叶节点自环（阈值为 +inf），固定迭代 max_depth 次即可全部到达叶节点
+        for _ in range(self.max_depth):
+            x = X_flat.take(row_offset + self.feature.take(node))
+            go_right = x > self.threshold.take(node)
+            missing = np.isnan(x)
+            if missing.any():
+                # 叶节点的 feature 只是占位，缺失值规则只用于内部节点，否则会离开自环
+                missing &= self.leaf_index.take(node) < 0
+                go_right = np.where(missing, ~self.missing_left.take(node), go_right)
+            node = self.left.take(node) + go_right
+        return node
+    
+    # -----------------------------------------------------
+    # 聚合
+    # -----------------------------------------------------
+    def value_columns(self, time_index=None):
+        """风险评分、累积风险、生存概率在 leaf_values 中的列号"""
+        times = np.arange(self.n_times) if time_index is None else np.asarray(time_index, dtype=np.intp)
+        return np.concatenate([[0], 1 + times, 1 + self.n_times + times])
+    
+    def aggregate(self, leaves, time_index=None):
+        """把叶节点取值在树之间求平均，返回 (risk_scores, surv, chf)"""
+        from scipy import sparse  # 延迟导入（约 0.3 秒），第一次聚合时才付出
+        
+        if time_index is None:
+            table = self.leaf_values
+        else:
+            table = self.leaf_values[:, self.value_columns(time_index)]
+        
+        n_samples, n_trees = leaves.shape
+        n_times = (table.shape[1] - 1) // 2
+        
+        # 样本 × 叶节点的 0/1 稀疏矩阵乘以叶矩阵，等价于逐棵树累加，
+        # 同一行内按树的顺序求和，与 sksurv 的结果逐位一致，且不产生 (n, n_trees, 列数) 临时数组
+        # 0/1 矩阵与叶矩阵同精度，避免 float32 叶矩阵每次被复制提升为 float64
+        membership = sparse.csr_matrix(
+            (np.ones(leaves.size, dtype=table.dtype), leaves.ravel(), np.arange(0, leaves.size + 1, n_trees)),
+            shape=(n_samples, self.n_leaves))
+        totals = np.asarray(membership @ table)
+        totals /= n_trees
+        return totals[:, 0], totals[:, 1 + n_times:], totals[:, 1:1 + n_times]
+    
+    def predict_arrays(self, X, time_index=None):
+        """对 prepare_features 得到的数组做单次遍历预测，返回 (risk_scores, surv, chf)"""
+        return self.aggregate(self.apply(X), time_index)
+    
+    # -----------------------------------------------------
+    # 与 sksurv 兼容的接口
+    # -----------------------------------------------------
+    def predict(self, X):
+        return self.predict_arrays(prepare_features(self, X))[0]
+    
+    def predict_survival_function(self, X, return_array=False):
+        surv = self.predict_arrays(prepare_features(self, X))[1]
+        return surv if return_array else _to_step_functions(self.unique_times_, surv)
+    
+    def predict_cumulative_hazard_function(self, X, return_array=False):
+        chf = self.predict_arrays(prepare_features(self, X))[2]
+        return chf if return_array else _to_step_functions(self.unique_times_, chf)
+
+
+def _compute_dtype(leaf_values):
+    """叶矩阵的计算精度：float64 / float32 保持不变，更低精度转为 float32"""
+    if leaf_values.dtype in (np.float64, np.float32):
+        return leaf_values
+    return leaf_values.astype(np.float32)
+
+
+def _to_step_functions(times, array):
+    from sksurv.functions import StepFunction
+    
+    return np.array([StepFunction(x=times, y=row) for row in array], dtype=object)
+
+
+def _max_depth(left, right, roots):
+    """从根节点逐层展开，求最大深度"""
+    depth = 0
+    frontier = np.asarray(roots)
+    while True:
+        children = np.concatenate([left[frontier], right[frontier]])
+        children = np.unique(children[~np.isin(children, frontier)])
+        if len(children) == 0:
+            return depth
+        frontier = children
+        depth += 1
+
+# =========================================================
+# 🔧 从 sksurv 模型编译
+# =========================================================
+def compile_forest(model):
+    """把 sksurv RandomSurvivalForest（或已编译的 FlatForest）转换为 FlatForest"""
+    if isinstance(model, FlatForest):
+        return model
+    if getattr(model, "low_memory", False):
+        raise ValueError("Models fitted with low_memory=True do not store leaf curves")
+    
+    is_event_time = np.asarray(model.is_event_time_, dtype=bool)
+    n_nodes_total = sum(tree.tree_.node_count for tree in model.estimators_)
+    n_leaves_total = sum(int((tree.tree_.children_left == -1).sum()) for tree in model.estimators_)
+    n_times = len(model.unique_times_)
+    
+    feature = np.zeros(n_nodes_total, dtype=np.int32)
+    threshold = np.full(n_nodes_total, np.inf, dtype=np.float64)
+    left = np.zeros(n_nodes_total, dtype=np.int32)
+    right = np.zeros(n_nodes_total, dtype=np.int32)
+    missing_left = np.zeros(n_nodes_total, dtype=bool)
+    leaf_index = np.full(n_nodes_total, -1, dtype=np.int32)
+    node_cover = np.zeros(n_nodes_total, dtype=np.float64)
+    leaf_values = np.empty((n_leaves_total, 1 + 2 * n_times), dtype=np.float64)
+    roots = np.empty(len(model.estimators_), dtype=np.int32)
+    node_offset = leaf_offset = 0
+    
+    for i, tree in enumerate(model.estimators_):
+        t = tree.tree_
+        is_leaf = t.children_left == -1
+        missing = getattr(t, "missing_go_to_left", None)
+        
+        # 按层重新编号，使左右子节点编号相邻
+        order = _sibling_order(t.children_left, t.children_right)
+        new_id = np.empty(t.node_count, dtype=np.int32)
+        new_id[order] = node_offset + np.arange(t.node_count, dtype=np.int32)
+        nodes = new_id[order]
+        internal = ~is_leaf[order]
+        
+        feature[nodes[internal]] = t.feature[order][internal]
+        threshold[nodes[internal]] = t.threshold[order][internal]
+        left[nodes] = np.where(internal, new_id[np.where(internal, t.children_left[order], 0)], nodes)
+        right[nodes] = np.where(internal, left[nodes] + 1, nodes)
+        if missing is not None:
+            missing_left[nodes] = np.asarray(missing, dtype=bool)[order]
+        node_cover[nodes] = t.weighted_n_node_samples[order]
+        
+        leaf_nodes = np.flatnonzero(is_leaf)
+        leaf_rows = leaf_offset + np.arange(len(leaf_nodes))
+        leaf_index[new_id[leaf_nodes]] = leaf_rows
+        values = t.value[leaf_nodes]
+        leaf_values[leaf_rows, 0] = values[:, is_event_time, 0].sum(1)
+        leaf_values[leaf_rows, 1:1 + n_times] = values[..., 0]
+        leaf_values[leaf_rows, 1 + n_times:] = values[..., 1]
+        
+        roots[i] = node_offset
+        node_offset += t.node_count
+        leaf_offset += len(leaf_nodes)
+    
+    return FlatForest(
+        feature=feature,
+        threshold=threshold,
+        left=left,
+        right=right,
+        missing_left=missing_left,
+        leaf_index=leaf_index,
+        roots=roots,
+        leaf_values=leaf_values,
+        unique_times=np.asarray(model.unique_times_, dtype=np.float64),
+        is_event_time=is_event_time,
+        n_features=int(model.n_features_in_),
+        feature_names=getattr(model, "feature_names_in_", None),
+        max_depth=max(tree.tree_.max_depth for tree in model.estimators_),
+        node_cover=node_cover,
+    )
+
+
+def _sibling_order(children_left, children_right):
+    """广度优先列出节点，同一父节点的两个子节点相邻"""
+    order = [0]
+    for node in order:
+        if children_left[node] != -1:
+            order.extend((children_left[node], children_right[node]))
+    return np.asarray(order, dtype=np.intp)
+
+# =========================================================
+# ✅ 与 sksurv 结果核对
+# =========================================================
+def compare_with_sksurv(model, forest, input_data):
+    """用 sksurv 原生预测核对展平引擎，返回各输出的最大绝对误差"""
+    X = prepare_features(model, input_data)
+    if hasattr(input_data, "columns") and hasattr(model, "feature_names_in_"):
+        input_data = input_data[list(model.feature_names_in_)]
+    else:
+        input_data = X
+    risk, surv, chf = forest.predict_arrays(X)
+    return {
+        "risk_score": float(np.max(np.abs(risk - model.predict(input_data)))),
+        "survival": float(np.max(np.abs(
+            surv - model.predict_survival_function(input_data, return_array=True)))),
+        "cumulative_hazard": float(np.max(np.abs(
+            chf - model.predict_cumulative_hazard_function(input_data, return_array=True)))),
+    }
@@ -0,0 +1,190 @@
+# =========================================================
+# 🔁 增量重新预测
+# 会话保存上一次输入在每棵树中的路径与叶节点。
+# 输入变化时，先由"特征 → 用到该特征的树"索引找出候选树，
+# 只重新遍历路径上的分裂结果真正改变了的树，而不是把全部树重新走一遍；
+# 叶节点改变后由保存的叶节点向量经 FlatForest.aggregate 重新聚合，与完整预测逐位一致
+# =========================================================
+
+import math
+
+import numpy as np
+
+from rsf.core import step_function
+from rsf.engine import compile_forest, prepare_features
+from rsf.metrics import METRICS
+
+# 需要重新遍历的树少于这个数时逐树标量遍历（单个样本时 NumPy 批量遍历的固定开销较大）
+SCALAR_WALK_TREES = 16
+
+
+class TreeIndex:
+    """特征 → 用到该特征分裂的树，以及逐树标量遍历用的节点列表（只读，各会话共享）"""
+    
+    def __init__(self, forest):
+        self.forest = forest
+        # 各树的节点编号连续：roots[i] 到 roots[i + 1] - 1
+        node_counts = np.diff(np.append(forest.roots, forest.n_nodes))
+        tree_of_node = np.repeat(np.arange(forest.n_trees, dtype=np.int32), node_counts)
+        internal = forest.leaf_index < 0
+        self.trees_by_feature = [
+            np.unique(tree_of_node[internal & (forest.feature == j)])
+            for j in range(forest.n_features_in_)
+        ]
+        
+        # Python 列表的标量下标比 NumPy 数组快一个数量级
+        self._feature = forest.feature.tolist()
+        self._threshold = forest.threshold.tolist()
+        self._left = forest.left.tolist()
+        self._missing_left = forest.missing_left.tolist()
+        self._leaf_index = forest.leaf_index.tolist()
+        self._roots = forest.roots.tolist()
+    
+    def trees_using(self, features):
+        """用到任一给定特征的树（升序）"""
+        if len(features) == 1:
+            return self.trees_by_feature[features[0]]
+        return np.unique(np.concatenate([self.trees_by_feature[j] for j in features]))
+    
+    def walk(self, x, trees):
+        """单个样本（Python float 列表）逐树遍历，规则与 FlatForest.apply 相同
+        
+        返回 (paths, leaf_nodes)：paths 为每棵树从根开始经过的节点，到达叶节点后用叶节点补足 max_depth 层。
+        """
+        feature, threshold, left = self._feature, self._threshold, self._left
+        missing_left, leaf_index, roots = self._missing_left, self._leaf_index, self._roots
+        depth = self.forest.max_depth
+        paths, leaf_nodes = [], []
+        for tree in trees:
+            node = roots[tree]
+            path = []
+            while leaf_index[node] < 0:
+                path.append(node)
+                value = x[feature[node]]
+                if math.isnan(value):
+                    node = left[node] + (not missing_left[node])
+                else:
+                    node = left[node] + (value > threshold[node])
+            path.extend([node] * (depth - len(path)))
+            paths.append(path)
+            leaf_nodes.append(node)
+        return paths, leaf_nodes
+
+
+def walk_paths(forest, X, trees=None):
+    """单个样本在各树中的路径（向量化遍历），返回 (paths, leaf_nodes)，形状 (n_trees, max_depth) 与 (n_trees,)"""
+    roots = forest.roots if trees is None else forest.roots[trees]
+    x = X[0]
+    node = roots.astype(np.intp)
+    paths = np.empty((len(node), forest.max_depth), dtype=np.intp)
+    for level in range(forest.max_depth):
+        paths[:, level] = node
+        value = x.take(forest.feature.take(node))
+        go_right = value > forest.threshold.take(node)
+        missing = np.isnan(value)
+        if missing.any():
+            go_right = np.where(missing, ~forest.missing_left.take(node), go_right)
+        # 叶节点自环：到达叶节点后保持不变
+        node = np.where(forest.leaf_index.take(node) < 0, forest.left.take(node) + go_right, node)
+    return paths, node
+
+
+def _changed_features(x, previous):
+    """两次输入中取值不同的特征（NaN 与 NaN 视为相同）"""
+    different = x != previous
+    different &= ~(np.isnan(x) & np.isnan(previous))
+    return np.flatnonzero(different)
+
+
+class IncrementalPredictor:
+    """单个会话的增量预测器：返回值与 predict_survival 相同，只重新遍历受影响的树
+    
+    leaves                   当前输入在每棵树中的叶节点（叶矩阵行号），形状 (n_trees,)
+    last_trees_checked       上一次预测检查路径的候选树数（用到了变化特征的树）
+    last_trees_walked        上一次预测实际重新遍历的树数
+    
+    叶节点与完整遍历逐一相同；叶节点改变后用 FlatForest.aggregate 重新聚合，
+    求和方式与 predict_survival 相同，结果逐位一致。
+    """
+    
+    def __init__(self, model, index=None):
+        self.forest = compile_forest(model)
+        self.index = index if index is not None else TreeIndex(self.forest)
+        self.leaves = None
+        self.last_trees_checked = 0
+        self.last_trees_walked = 0
+        self._x = None
+        self._paths = None
+        self._totals = None
+    
+    def reset(self):
+        self.leaves = None
+        self._x = None
+        self._paths = None
+        self._totals = None
+    
+    def _decisions(self, x, nodes):
+        """节点在输入 x 下是否走右子节点"""
+        forest = self.forest
+        value = x.take(forest.feature.take(nodes))
+        go_right = value > forest.threshold.take(nodes)
+        missing = np.isnan(value)
+        if missing.any():
+            go_right = np.where(missing, ~forest.missing_left.take(nodes), go_right)
+        return go_right
+    
+    def _aggregate(self):
+        # 与完整预测走同一个聚合函数，保证逐位一致
+        risk_score, surv, chf = self.forest.aggregate(self.leaves[np.newaxis, :])
+        self._totals = risk_score[0], surv[0], chf[0]
+    
+    def update(self, input_data):
+        """更新为新的输入（单个患者），返回实际重新遍历的树数"""
+        forest = self.forest
+        X = prepare_features(forest, input_data)[:1]
+        x, previous = X[0], self._x
+        self._x = x
+        
+        if previous is None:
+            self._paths, leaf_nodes = walk_paths(forest, X)
+            self.leaves = forest.leaf_index.take(leaf_nodes)
+            self._aggregate()
+            self.last_trees_checked = self.last_trees_walked = forest.n_trees
+            METRICS.increment("incremental_trees_walked", forest.n_trees)
+            return forest.n_trees
+        
+        changed = _changed_features(x, previous)
+        candidates = self.index.trees_using(changed) if len(changed) else changed
+        # 候选树中路径上至少有一个内部节点的走向改变了的树
+        nodes = self._paths[candidates]
+        flipped = self._decisions(x, nodes) != self._decisions(previous, nodes)
+        flipped &= forest.leaf_index.take(nodes) < 0
+        trees = candidates[flipped.any(axis=1)]
+        self.last_trees_checked = len(candidates)
+        self.last_trees_walked = len(trees)
+        if len(trees) == 0:
+            return 0
+        
+        old = self.leaves[trees]
+        if len(trees) < SCALAR_WALK_TREES:
+            paths, leaf_nodes = self.index.walk(x.tolist(), trees.tolist())
+        else:
+            paths, leaf_nodes = walk_paths(forest, X, trees)
+        self._paths[trees] = paths
+        new = forest.leaf_index.take(leaf_nodes)
+        self.leaves[trees] = new
+        if (old != new).any():
+            self._aggregate()
+        METRICS.increment("incremental_trees_walked", len(trees))
+        return len(trees)
+    
+    def predict_arrays(self):
+        """当前输入的 (risk_score, surv, chf)，surv 与 chf 的时间轴为 unique_times_"""
+        return self._totals
+    
+    @METRICS.timed("predict_incremental")
+    def predict_survival(self, input_data):
+        """与 core.predict_survival 相同的返回值 (风险评分, 生存函数)"""
+        self.update(input_data)
+        risk_score, surv, _ = self.predict_arrays()
+        return risk_score, step_function(self.forest.unique_times_, surv)
@@ -0,0 +1,310 @@
+# =========================================================
+# 🧑‍🤝‍🧑 多会话并发压测
+# 用法：python -m rsf loadtest --sessions 24 --clicks 5 --baseline benchmarks/loadtest_baseline.json
+#
+# 用 Streamlit 自带的 AppTest 在同一进程中无界面地运行 app.py，每个模拟会话各有自己的
+# session_state，与真实部署一样共享 cache_resource（模型、缓存、渲染器）。
+# 各会话并行：在侧边栏填入 FEATURE_CONFIG 范围内的随机参数并点击预测按钮。
+# 记录页面加载与点击延迟的分位数、吞吐量、每个会话的内存增长与未关闭的 matplotlib 图形；
+# 完全离线运行，结果写为 JSON，并与保存的基线对比
+# =========================================================
+
+import gc
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from rsf import core
+from rsf.bench import environment
+from rsf.metrics import METRICS, process_rss_bytes
+
+LOADTEST_FORMAT_VERSION = 2
+DEFAULT_APP = "app.py"
+DEFAULT_BASELINE = os.path.join("benchmarks", "loadtest_baseline.json")
+# 单次页面运行（加载或点击）的超时时间（秒）
+RUN_TIMEOUT = 300
+
+
+def widget_label(feature_name):
+    """侧边栏中该特征输入控件的标签（与 app.py 的构造方式一致）"""
+    display_name = core.FEATURE_LABEL_MAP.get(feature_name, feature_name)
+    config = core.FEATURE_CONFIG.get(display_name, {})
+    unit = config.get("unit", "")
+    if feature_name.endswith("_Yes") or config.get("type") == "select":
+        return display_name
+    return f"{display_name}" + (f" ({unit})" if unit else "")
+
+
+def set_inputs(at, patient):
+    """把一位患者的取值（特征 → 数值）填入 AppTest 的侧边栏"""
+    number_inputs = {widget.label: widget for widget in at.sidebar.number_input}
+    selectboxes = {widget.label: widget for widget in at.sidebar.selectbox}
+    for feature_name, value in patient.items():
+        label = widget_label(feature_name)
+        if label in selectboxes:
+            selectboxes[label].set_value("Yes" if value == 1 else "No")
+        elif label in number_inputs:
+            number_inputs[label].set_value(float(value))
+        else:
+            raise KeyError(f"No sidebar input labelled {label!r}")
+
+
+def count_figures():
+    """(仍存活的 matplotlib Figure 对象数, pyplot 中未关闭的图形数)；未导入 matplotlib 时都为 0"""
+    if "matplotlib.figure" not in sys.modules:
+        return 0, 0
+    from matplotlib.figure import Figure
+    
+    gc.collect()
+    alive = sum(1 for obj in gc.get_objects() if isinstance(obj, Figure))
+    pyplot = sys.modules.get("matplotlib.pyplot")
+    return alive, len(pyplot.get_fignums()) if pyplot is not None else 0
+
+
+def settled_rss():
+    """回收垃圾并把空闲的堆内存还给系统（glibc malloc_trim）后的进程 RSS，减少分配器缓存带来的噪声"""
+    gc.collect()
+    try:
+        import ctypes
+        
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    return process_rss_bytes()
+
+
+def latency_summary(timings):
+    timings_ms = np.asarray(timings, dtype=np.float64) * 1000
+    if len(timings_ms) == 0:
+        return {"count": 0}
+    return {
+        "count": int(len(timings_ms)),
+        "mean_ms": float(timings_ms.mean()),
+        "p50_ms": float(np.percentile(timings_ms, 50)),
+        "p90_ms": float(np.percentile(timings_ms, 90)),
+        "p99_ms": float(np.percentile(timings_ms, 99)),
+        "max_ms": float(timings_ms.max()),
+    }
+
+@contextmanager
+def shared_script_bytecode():
+    """期间所有 AppTest 运行共用同一份脚本编译结果
+    
+    AppTest 每次运行（包括每次点击）都新建 ScriptCache 重新编译脚本，而 CPython 3.11 的
+    ast.parse 在多个线程中同时运行会出错（AST constructor recursion depth mismatch）。
+    这里只在第一次编译时加锁，之后直接复用，页面加载与点击不再因编译而排队。
+    """
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    
+    original = ScriptCache.get_bytecode
+    compiled = {}
+    lock = threading.Lock()
+    
+    def get_bytecode(self, script_path):
+        with lock:
+            if script_path not in compiled:
+                compiled[script_path] = original(self, script_path)
+            return compiled[script_path]
+    
+    ScriptCache.get_bytecode = get_bytecode
+    try:
+        yield
+    finally:
+        ScriptCache.get_bytecode = original
+
+# =========================================================
+# 🏃 运行
+# =========================================================
+class SimulatedSession:
+    """一个模拟会话：一个 AppTest 实例，依次填入 patients 中的每位患者并点击预测
+    
+    并发运行时须在 shared_script_bytecode() 中进行。
+    """
+    
+    def __init__(self, app_path, patients, timeout=RUN_TIMEOUT):
+        from streamlit.testing.v1 import AppTest
+        
+        # 相对路径按调用 from_file 的文件解析，这里先转为绝对路径（相对当前目录）
+        self.at = AppTest.from_file(os.path.abspath(app_path), default_timeout=timeout)
+        self.patients = patients
+        self.load_time = None
+        self.click_times = []
+        self.errors = []
+    
+    def run(self):
+        started = time.perf_counter()
+        self.at.run()
+        self.load_time = time.perf_counter() - started
+        self._check("page load")
+        
+        for i, patient in enumerate(self.patients):
+            set_inputs(self.at, patient)
+            started = time.perf_counter()
+            self.at.sidebar.button[0].click().run()
+            self.click_times.append(time.perf_counter() - started)
+            self._check(f"click {i + 1}")
+        return self
+    
+    def _check(self, step):
+        if len(self.at.exception):
+            self.errors.append(f"{step}: {self.at.exception[0].message}")
+
+
+def run_load_test(app_path=DEFAULT_APP, sessions=24, clicks=5, concurrency=None, feature_path=None, seed=0,
+                  log=print):
+    """并发运行 sessions 个模拟会话，每个会话点击 clicks 次，返回可写为 JSON 的结果字典
+    
+    concurrency 为同时活跃的会话数（默认全部同时）。先用一个会话预热（模型加载、导入与首次绘图），
+    不计入结果；内存以预热后的进程 RSS 为基线。
+    """
+    import logging
+    
+    # Streamlit 每次运行脚本都会重置日志级别并重复输出弃用提示与 "missing ScriptRunContext" 警告，
+    # 压测期间屏蔽 WARNING 及以下的日志，结束后恢复
+    previous = logging.root.manager.disable
+    logging.disable(logging.WARNING)
+    try:
+        with shared_script_bytecode():
+            return _run_load_test(app_path, sessions, clicks, concurrency or sessions, feature_path, seed, log)
+    finally:
+        logging.disable(previous)
+
+
+def _run_load_test(app_path, sessions, clicks, concurrency, feature_path, seed, log):
+    feature_list = core.load_feature_list(feature_path)
+    
+    warm = SimulatedSession(app_path, core.synthetic_cohort(1, feature_list, seed=seed).to_dict("records")).run()
+    if warm.errors:
+        raise RuntimeError(f"App failed during warm-up: {warm.errors[0]}")
+    del warm
+    METRICS.reset()
+    figures_before = count_figures()
+    rss_before = settled_rss()
+    
+    cohort = core.synthetic_cohort(sessions * clicks, feature_list, seed=seed + 1).to_dict("records")
+    simulated = [SimulatedSession(app_path, cohort[i * clicks:(i + 1) * clicks]) for i in range(sessions)]
+    log(f"running {sessions} sessions x {clicks} clicks, {concurrency} at a time")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="rsf-session") as executor:
+        list(executor.map(SimulatedSession.run, simulated))
+    elapsed = time.perf_counter() - started
+    
+    # 会话仍存活（session_state 保留）时的内存，再释放全部会话看残留
+    rss_sessions = settled_rss()
+    click_times = [t for session in simulated for t in session.click_times]
+    load_times = [session.load_time for session in simulated]
+    errors = [error for session in simulated for error in session.errors]
+    del simulated
+    rss_after = settled_rss()
+    figures_after = count_figures()
+    
+    results = {
+        "page_load": latency_summary(load_times),
+        "click": latency_summary(click_times),
+        "throughput": {"clicks_per_s": len(click_times) / elapsed, "elapsed_s": elapsed},
+        "memory": {
+            "rss_before_bytes": rss_before,
+            "rss_sessions_bytes": rss_sessions,
+            "rss_after_bytes": rss_after,
+            "per_session_bytes": (rss_sessions - rss_before) / sessions,
+            "retained_bytes": rss_after - rss_before,
+        },
+        "figures": {"leaked": figures_after[0] - figures_before[0], "open_pyplot": figures_after[1]},
+        "errors": {"count": len(errors), "first": errors[:5]},
+    }
+    return {
+        "format_version": LOADTEST_FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "app": os.path.basename(app_path),
+        "model": os.path.basename(core.find_model_path() or ""),
+        "config": {"sessions": sessions, "clicks": clicks, "concurrency": concurrency, "seed": seed},
+        "environment": environment(),
+        "results": results,
+        "stages": METRICS.snapshot()["stages"],
+    }
+
+
+def format_report(report):
+    results = report["results"]
+    lines = [f"{'':<12} {'count':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+    for name in ("page_load", "click"):
+        summary = results[name]
+        if summary["count"]:
+            lines.append(f"{name:<12} {summary['count']:>6} {summary['p50_ms']:9.1f} {summary['p90_ms']:9.1f} "
+                         f"{summary['p99_ms']:9.1f} {summary['max_ms']:9.1f}")
+    memory = results["memory"]
+    lines.append(f"throughput {results['throughput']['clicks_per_s']:.2f} clicks/s "
+                 f"over {results['throughput']['elapsed_s']:.1f} s")
+    lines.append(f"memory: RSS {memory['rss_before_bytes'] / 2**20:.1f} -> {memory['rss_sessions_bytes'] / 2**20:.1f} MiB "
+                 f"with sessions open ({memory['per_session_bytes'] / 2**20:.2f} MiB per session), "
+                 f"{memory['retained_bytes'] / 2**20:+.1f} MiB after they close")
+    lines.append(f"matplotlib figures leaked {results['figures']['leaked']}, "
+                 f"open in pyplot {results['figures']['open_pyplot']}")
+    lines.append(f"errors {results['errors']['count']}")
+    lines.extend(f"  {error}" for error in results["errors"]["first"])
+    return "\n".join(lines)
+
+# =========================================================
+# 📊 与基线对比
+# =========================================================
+# (名称, 取值路径, 越大越好)
+COMPARED_METRICS = [
+    ("click p50", ("click", "p50_ms"), False),
+    ("click p99", ("click", "p99_ms"), False),
+    ("page load p50", ("page_load", "p50_ms"), False),
+    ("throughput", ("throughput", "clicks_per_s"), True),
+    ("memory per session", ("memory", "per_session_bytes"), False),
+]
+# 每个会话的内存增长低于该值（字节）时视为噪声
+MEMORY_NOISE_FLOOR = 2**20
+
+
+def compare_reports(current, baseline, tolerance=0.5, memory_tolerance=0.5):
+    """对比延迟、吞吐量与内存，返回 (对比行列表, 是否有回退)
+    
+    延迟超过基线 (1 + tolerance) 倍、吞吐量低于基线 / (1 + tolerance)、每个会话的内存增长超过基线
+    (1 + memory_tolerance) 倍且超过 MEMORY_NOISE_FLOOR，或有图形泄漏、有错误，记为回退。
+    """
+    rows = []
+    regressed = False
+    for name, (section, key), higher_is_better in COMPARED_METRICS:
+        value = current["results"][section].get(key)
+        base = baseline["results"].get(section, {}).get(key)
+        if value is None or base is None:
+            rows.append({"metric": name, "status": "missing"})
+            continue
+        ratio = value / base if base else float("inf")
+        if section == "memory":
+            worse = ratio > 1 + memory_tolerance and value > MEMORY_NOISE_FLOOR
+        elif higher_is_better:
+            worse = ratio < 1 / (1 + tolerance)
+        else:
+            worse = ratio > 1 + tolerance
+        status = "REGRESSION" if worse else "ok"
+        regressed |= worse
+        rows.append({"metric": name, "status": status, "value": value, "baseline": base, "ratio": ratio})
+    for name, value in (("figures leaked", current["results"]["figures"]["leaked"]),
+                        ("errors", current["results"]["errors"]["count"])):
+        status = "REGRESSION" if value > 0 else "ok"
+        regressed |= value > 0
+        rows.append({"metric": name, "status": status, "value": value, "baseline": 0, "ratio": None})
+    return rows, regressed
+
+
+def format_comparison(rows):
+    lines = [f"{'metric':<20} {'value':>14} {'baseline':>14} {'ratio':>7}  status"]
+    for row in rows:
+        if "value" not in row:
+            lines.append(f"{row['metric']:<20} {'':>14} {'':>14} {'':>7}  {row['status']}")
+            continue
+        ratio = "" if row["ratio"] is None else f"{row['ratio']:6.2f}x"
+        # 内存以 MiB 显示
+        scale = 2**20 if row["metric"].startswith("memory") else 1
+        lines.append(f"{row['metric']:<20} {row['value'] / scale:14.2f} {row['baseline'] / scale:14.2f} {ratio:>7}  "
+                     f"{row['status']}")
+    return "\n".join(lines)
@@ -0,0 +1,267 @@
+# =========================================================
+# 📈 运行时指标
+# 各阶段耗时直方图、计数器与即时取值（缓存命中率、进程 RSS），
+# 可导出为 Prometheus 文本格式或按间隔写入滚动 JSON 日志。
+# 每次记录只有一次 perf_counter 与一次加锁，生产环境可以常开
+#
+# 环境变量：
+#   RSF_METRICS=0                  关闭记录
+#   RSF_METRICS_LOG=path           按间隔把快照追加到滚动 JSON 日志
+#   RSF_METRICS_LOG_INTERVAL=60    JSON 日志的写入间隔（秒）
+# =========================================================
+
+import bisect
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 耗时直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def process_rss_bytes():
+    """当前进程的常驻内存（字节）；无法读取 /proc 时退回历史峰值 RSS"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def process_memory(pid="self"):
+    """从 /proc/<pid>/smaps_rollup 读取内存明细（字节），无法读取时返回 None
+    
+    rss       常驻内存
+    pss       按共享进程数分摊后的内存（各进程 PSS 之和即实际占用）
+    shared    与其他进程共享的页（例如 fork 前加载、未被写过的模型数组）
+    private   本进程独占的页
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                parts = rest.split()
+                if len(parts) == 2 and parts[1] == "kB":
+                    fields[name] = int(parts[0]) * 1024
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+class Histogram:
+    """固定分桶的直方图：桶计数、总和、次数与最大值"""
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+    
+    def quantile(self, q):
+        """按桶内线性插值估计分位数"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / bucket_count, self.max)
+            cumulative += bucket_count
+        return self.max
+    
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum_s": self.sum,
+            "mean_ms": self.sum / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.quantile(0.5) * 1000,
+            "p95_ms": self.quantile(0.95) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class MetricsRegistry:
+    """线程安全的指标登记处（Streamlit 各会话、HTTP 服务各请求共享）"""
+    
+    def __init__(self, enabled=True, prefix="rsf"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.started_at = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {"process_resident_memory_bytes": process_rss_bytes}
+        self._lock = threading.Lock()
+        self._logger = None
+        self._log_interval = 60.0
+        self._next_log = 0.0
+    
+    # -----------------------------------------------------
+    # 记录
+    # -----------------------------------------------------
+    def observe(self, stage, seconds):
+        """记录一次阶段耗时（秒）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+        if self._logger is not None:
+            self._maybe_log()
+    
+    def increment(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+    
+    def register_gauge(self, name, fn):
+        """登记即时取值：导出时调用 fn()（例如缓存命中率），同名覆盖"""
+        with self._lock:
+            self._gauges[name] = fn
+    
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+    
+    def timed(self, stage):
+        """函数装饰器：记录每次调用的耗时"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(stage, time.perf_counter() - started)
+            return wrapper
+        return decorator
+    
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+    
+    # -----------------------------------------------------
+    # 导出
+    # -----------------------------------------------------
+    def _gauge_values(self):
+        values = {}
+        for name, fn in list(self._gauges.items()):
+            try:
+                values[name] = float(fn())
+            except Exception:
+                continue
+        return values
+    
+    def snapshot(self):
+        """当前全部指标，可直接写为 JSON"""
+        with self._lock:
+            stages = {stage: h.snapshot() for stage, h in self._histograms.items()}
+            counters = dict(self._counters)
+        return {
+            "timestamp": time.time(),
+            "uptime_s": time.time() - self.started_at,
+            "stages": stages,
+            "counters": counters,
+            "gauges": self._gauge_values(),
+        }
+    
+    def to_prometheus(self):
+        """Prometheus 文本格式（0.0.4）"""
+        name = f"{self.prefix}_stage_latency_seconds"
+        lines = [f"# HELP {name} Latency of each prediction stage.", f"# TYPE {name} histogram"]
+        with self._lock:
+            histograms = [(stage, list(h.counts), h.sum, h.count, h.buckets)
+                          for stage, h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+        
+        for stage, counts, total, count, buckets in histograms:
+            cumulative = 0
+            for upper, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{upper}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total:.9g}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        
+        for counter, value in counters:
+            lines.append(f"# TYPE {self.prefix}_{counter}_total counter")
+            lines.append(f"{self.prefix}_{counter}_total {value}")
+        for gauge, value in sorted(self._gauge_values().items()):
+            lines.append(f"# TYPE {self.prefix}_{gauge} gauge")
+            lines.append(f"{self.prefix}_{gauge} {value:.9g}")
+        return "\n".join(lines) + "\n"
+    
+    # -----------------------------------------------------
+    # 滚动 JSON 日志
+    # -----------------------------------------------------
+    def configure_log(self, path, interval=60.0, max_bytes=10 * 2**20, backup_count=5):
+        """每隔 interval 秒把快照作为一行 JSON 追加到 path，文件超过 max_bytes 时滚动"""
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes,
+                                                       backupCount=backup_count, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger = logging.getLogger(f"rsf.metrics.{os.path.abspath(path)}")
+        logger.handlers[:] = [handler]
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        self._log_interval = float(interval)
+        self._next_log = time.monotonic() + self._log_interval
+        self._logger = logger
+    
+    def write_log(self):
+        if self._logger is not None:
+            self._logger.info(json.dumps(self.snapshot()))
+    
+    def _maybe_log(self):
+        now = time.monotonic()
+        if now < self._next_log:
+            return
+        with self._lock:
+            if now < self._next_log:
+                return
+            self._next_log = now + self._log_interval
+        self.write_log()
+
+
+def _default_registry():
+    registry = MetricsRegistry(enabled=os.environ.get("RSF_METRICS", "1") != "0")
+    log_path = os.environ.get("RSF_METRICS_LOG")
+    if log_path and registry.enabled:
+        registry.configure_log(log_path, interval=float(os.environ.get("RSF_METRICS_LOG_INTERVAL", 60)))
+    return registry
+
+
+# 进程内共享的默认登记处
+METRICS = _default_registry()
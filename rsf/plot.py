@@ -0,0 +1,594 @@
+# =========================================================
+# 🎨 生存曲线绘制（不依赖 Streamlit）
+# plot_survival_curve_professional：原有的逐次重绘版本
+# SurvivalCurveRenderer：坐标轴、刻度、网格与样式只构建一次，每位患者只更新曲线与标注
+# survival_curve_spec：浏览器端矢量图（Vega-Lite），只传输曲线数组
+# matplotlib 在第一次绘图时才导入（约 1 秒，含字体缓存），只用矢量图时不导入
+# =========================================================
+
+import io
+import threading
+import time
+
+import numpy as np
+
+from rsf.core import SURVIVAL_HORIZONS, get_survival_probabilities, get_survival_probability
+from rsf.metrics import METRICS
+
+PLOT_STYLE = {
+    'font.family': 'DejaVu Sans',
+    'font.size': 11,
+    'axes.linewidth': 1.2,
+}
+
+HORIZON_COLORS = ['#10b981', '#3b82f6', '#8b5cf6', '#f59e0b']
+HORIZON_LABELS = ['1-Year', '2-Year', '3-Year', '4-Year']
+
+# 各树分位数带
+BAND_COLOR = '#64748b'
+BAND_ALPHA = 0.25
+
+
+def band_label(bands):
+    low, high = bands['percentiles']
+    return f"Trees' {low:g}th-{high:g}th percentile"
+
+# =========================================================
+# 🎨 绘制专业生存曲线（适合发表）
+# =========================================================
+@METRICS.timed("plot_survival_curve_professional")
+def plot_survival_curve_professional(surv_func, bands=None):
+    """绘制适合论文发表的生存曲线；bands 为 core.survival_bands 的结果时同时绘制各树分位数带"""
+    import matplotlib.pyplot as plt
+    
+    # 设置专业绘图风格
+    plt.rcParams['font.family'] = 'DejaVu Sans'
+    plt.rcParams['font.size'] = 11
+    plt.rcParams['axes.linewidth'] = 1.2
+    
+    fig, ax = plt.subplots(figsize=(10, 6.5), dpi=150)
+    
+    # 白色背景
+    ax.set_facecolor('white')
+    fig.patch.set_facecolor('white')
+    
+    time_points = surv_func.x
+    surv_probs = surv_func.y
+    
+    # 主曲线 - 使用深蓝色，更粗的线条
+    ax.step(time_points, surv_probs, where='post', 
+            color='#1e3a5f', linewidth=2.5, label='Survival Probability')
+    
+    # 淡色填充
+    ax.fill_between(time_points, surv_probs, step='post', 
+                    color='#3b82f6', alpha=0.15)
+    
+    # 各树生存曲线的分位数带
+    if bands is not None:
+        ax.fill_between(bands['lower'].x, bands['lower'].y, bands['upper'].y, step='post',
+                        color=BAND_COLOR, alpha=BAND_ALPHA, linewidth=0, label=band_label(bands))
+        ax.legend(loc='upper right', frameon=False, fontsize=10)
+    
+    # 标记 1、2、3、4 年的点
+    colors = ['#10b981', '#3b82f6', '#8b5cf6', '#f59e0b']
+    years = [1, 2, 3, 4]
+    labels = ['1-Year', '2-Year', '3-Year', '4-Year']
+    
+    for i, (year, color, label) in enumerate(zip(years, colors, labels)):
+        if year <= time_points[-1]:
+            prob = get_survival_probability(surv_func, year)
+            
+            # 绘制点
+            ax.scatter([year], [prob], color=color, s=120, zorder=5, 
+                      edgecolors='white', linewidths=2)
+            
+            # 绘制虚线到坐标轴
+            ax.plot([year, year], [0, prob], color=color, linestyle='--', 
+                   linewidth=1, alpha=0.6)
+            ax.plot([0, year], [prob, prob], color=color, linestyle='--', 
+                   linewidth=1, alpha=0.6)
+            
+            # 标注文字
+            offset_y = 0.06 if i % 2 == 0 else -0.08
+            va = 'bottom' if i % 2 == 0 else 'top'
+            ax.annotate(f'{label}: {prob:.1%}', 
+                       xy=(year, prob),
+                       xytext=(year + 0.15, prob + offset_y),
+                       fontsize=11,
+                       fontweight='bold',
+                       color=color,
+                       va=va,
+                       bbox=dict(boxstyle='round,pad=0.3', facecolor='white', 
+                                edgecolor=color, alpha=0.9))
+    
+    # 设置标题和标签
+    ax.set_title('Predicted Survival Curve', fontsize=16, fontweight='bold', 
+                 color='#1e293b', pad=20)
+    ax.set_xlabel('Time (Years)', fontsize=13, fontweight='600', color='#374151')
+    ax.set_ylabel('Survival Probability', fontsize=13, fontweight='600', color='#374151')
+    
+    # 坐标轴范围
+    ax.set_xlim(0, min(5, max(time_points) * 1.05))
+    ax.set_ylim(0, 1.02)
+    
+    # 刻度设置
+    ax.set_xticks([0, 1, 2, 3, 4, 5])
+    ax.set_yticks([0, 0.2, 0.4, 0.6, 0.8, 1.0])
+    ax.set_yticklabels(['0%', '20%', '40%', '60%', '80%', '100%'])
+    
+    # 网格
+    ax.grid(True, linestyle='-', alpha=0.2, color='#94a3b8')
+    ax.set_axisbelow(True)
+    
+    # 边框
+    for spine in ['top', 'right']:
+        ax.spines[spine].set_visible(False)
+    for spine in ['left', 'bottom']:
+        ax.spines[spine].set_color('#cbd5e1')
+        ax.spines[spine].set_linewidth(1.2)
+    
+    # 刻度颜色
+    ax.tick_params(colors='#4b5563', labelsize=11)
+    
+    plt.tight_layout()
+    return fig
+
+
+# =========================================================
+# 🎨 可复用的生存曲线渲染器
+# =========================================================
+class SurvivalCurveRenderer:
+    """复用同一张图：静态部分只构建一次，每次只更新曲线数据、标记点和标注
+    
+    使用面向对象的 Figure/FigureCanvasAgg，不经过 pyplot 的全局图形管理，
+    图形不会累积；多个 Streamlit 会话共享一个实例，渲染时加锁。
+    """
+    
+    def __init__(self, figsize=(10, 6.5), dpi=150):
+        import matplotlib
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        
+        self._lock = threading.Lock()
+        self._rc_context = matplotlib.rc_context
+        with matplotlib.rc_context(PLOT_STYLE):
+            self.figure = Figure(figsize=figsize, dpi=dpi, facecolor='white')
+            FigureCanvasAgg(self.figure)
+            self.ax = self._create_axes()
+            self._build_static()
+    
+    def _create_axes(self):
+        """曲线所在的坐标轴；子类可改为页面中的一块区域"""
+        return self.figure.add_subplot()
+    
+    def _layout(self):
+        self.figure.tight_layout()
+    
+    def _build_static(self):
+        from matplotlib.patches import Patch
+        
+        ax = self.ax
+        ax.set_facecolor('white')
+        
+        # 主曲线与填充，数据在 update 中设置
+        self.curve, = ax.plot([], [], drawstyle='steps-post', color='#1e3a5f',
+                              linewidth=2.5, label='Survival Probability')
+        self.fill = None
+        self.band = None
+        
+        self.markers = []
+        for year, color, label in zip(SURVIVAL_HORIZONS, HORIZON_COLORS, HORIZON_LABELS):
+            point = ax.scatter([year], [0], color=color, s=120, zorder=5,
+                               edgecolors='white', linewidths=2)
+            vertical, = ax.plot([], [], color=color, linestyle='--', linewidth=1, alpha=0.6)
+            horizontal, = ax.plot([], [], color=color, linestyle='--', linewidth=1, alpha=0.6)
+            annotation = ax.annotate('', xy=(year, 0), xytext=(year, 0),
+                                     fontsize=11, fontweight='bold', color=color,
+                                     bbox=dict(boxstyle='round,pad=0.3', facecolor='white',
+                                               edgecolor=color, alpha=0.9))
+            self.markers.append((point, vertical, horizontal, annotation))
+        
+        ax.set_title('Predicted Survival Curve', fontsize=16, fontweight='bold',
+                     color='#1e293b', pad=20)
+        ax.set_xlabel('Time (Years)', fontsize=13, fontweight='600', color='#374151')
+        ax.set_ylabel('Survival Probability', fontsize=13, fontweight='600', color='#374151')
+        
+        ax.set_ylim(0, 1.02)
+        ax.set_xticks([0, 1, 2, 3, 4, 5])
+        ax.set_yticks([0, 0.2, 0.4, 0.6, 0.8, 1.0])
+        ax.set_yticklabels(['0%', '20%', '40%', '60%', '80%', '100%'])
+        
+        ax.grid(True, linestyle='-', alpha=0.2, color='#94a3b8')
+        ax.set_axisbelow(True)
+        
+        for spine in ['top', 'right']:
+            ax.spines[spine].set_visible(False)
+        for spine in ['left', 'bottom']:
+            ax.spines[spine].set_color('#cbd5e1')
+            ax.spines[spine].set_linewidth(1.2)
+        
+        ax.tick_params(colors='#4b5563', labelsize=11)
+        ax.set_xlim(0, 5)
+        
+        # 分位数带的图例只建一次，有分位数带时才显示
+        band_patch = Patch(facecolor=BAND_COLOR, alpha=BAND_ALPHA, label='')
+        self.legend = ax.legend(handles=[band_patch], loc='upper right', frameon=False, fontsize=10)
+        self.legend.set_visible(False)
+        self._layout()
+    
+    def update(self, surv_func, bands=None):
+        """把图形更新为新患者的生存曲线（bands 见 core.survival_bands）"""
+        time_points = np.asarray(surv_func.x)
+        surv_probs = np.asarray(surv_func.y)
+        
+        self.curve.set_data(time_points, surv_probs)
+        if self.fill is not None:
+            self.fill.remove()
+        self.fill = self.ax.fill_between(time_points, surv_probs, step='post',
+                                         color='#3b82f6', alpha=0.15)
+        
+        if self.band is not None:
+            self.band.remove()
+            self.band = None
+        if bands is not None:
+            self.band = self.ax.fill_between(bands['lower'].x, bands['lower'].y, bands['upper'].y,
+                                             step='post', color=BAND_COLOR, alpha=BAND_ALPHA, linewidth=0)
+            self.legend.get_texts()[0].set_text(band_label(bands))
+        self.legend.set_visible(bands is not None)
+        
+        horizon_probs = get_survival_probabilities(time_points, surv_probs, SURVIVAL_HORIZONS)[0]
+        for i, (year, (point, vertical, horizontal, annotation)) in enumerate(
+                zip(SURVIVAL_HORIZONS, self.markers)):
+            visible = year <= time_points[-1]
+            for artist in (point, vertical, horizontal, annotation):
+                artist.set_visible(visible)
+            if not visible:
+                continue
+            
+            prob = horizon_probs[i]
+            offset_y = 0.06 if i % 2 == 0 else -0.08
+            point.set_offsets([[year, prob]])
+            vertical.set_data([year, year], [0, prob])
+            horizontal.set_data([0, year], [prob, prob])
+            annotation.set_text(f'{HORIZON_LABELS[i]}: {prob:.1%}')
+            annotation.xy = (year, prob)
+            annotation.set_position((year + 0.15, prob + offset_y))
+            annotation.set_verticalalignment('bottom' if i % 2 == 0 else 'top')
+        
+        self.ax.set_xlim(0, min(5, max(time_points) * 1.05))
+        return self.figure
+    
+    @METRICS.timed("render_survival_curve")
+    def render_png(self, surv_func, bands=None, dpi=None):
+        """更新并渲染为 PNG 字节"""
+        with self._lock, self._rc_context(PLOT_STYLE):
+            self.update(surv_func, bands)
+            buffer = io.BytesIO()
+            # 低压缩级别：编码更快，图片稍大
+            self.figure.savefig(buffer, format='png', dpi=dpi or self.figure.dpi, facecolor='white',
+                                pil_kwargs={'compress_level': 1})
+        return buffer.getvalue()
+
+# =========================================================
+# 🌐 浏览器端矢量图
+# =========================================================
+@METRICS.timed("survival_curve_spec")
+def survival_curve_spec(surv_func, bands=None):
+    """生成 Vega-Lite 规格：只包含曲线数组与 1-4 年标记点，由浏览器绘制矢量图"""
+    time_points = np.asarray(surv_func.x, dtype=float)
+    surv_probs = np.asarray(surv_func.y, dtype=float)
+    curve = [{"time": round(float(t), 4), "survival": round(float(s), 5)}
+             for t, s in zip(time_points, surv_probs)]
+    horizon_probs = get_survival_probabilities(time_points, surv_probs, SURVIVAL_HORIZONS)[0]
+    points = [
+        {"time": year, "survival": float(prob), "label": f"{label}: {prob:.1%}", "color": color}
+        for year, prob, color, label in zip(SURVIVAL_HORIZONS, horizon_probs, HORIZON_COLORS, HORIZON_LABELS)
+        if year <= time_points[-1]
+    ]
+    x_max = float(min(5, time_points.max() * 1.05))
+    x_scale = {"domain": [0, x_max], "nice": False}
+    y_axis = {"format": ".0%", "title": "Survival Probability", "values": [0, 0.2, 0.4, 0.6, 0.8, 1.0]}
+    
+    layers = []
+    if bands is not None:
+        band = [{"time": round(float(t), 4), "lower": round(float(lo), 5), "upper": round(float(hi), 5)}
+                for t, lo, hi in zip(bands["lower"].x, bands["lower"].y, bands["upper"].y)]
+        layers.append({
+            "data": {"values": band},
+            "mark": {"type": "area", "interpolate": "step-after", "color": BAND_COLOR, "opacity": BAND_ALPHA},
+            "encoding": {
+                "x": {"field": "time", "type": "quantitative", "scale": x_scale},
+                "y": {"field": "lower", "type": "quantitative", "scale": {"domain": [0, 1.02]}},
+                "y2": {"field": "upper"},
+                "tooltip": [{"field": "lower", "format": ".1%", "title": f"Trees' {bands['percentiles'][0]:g}th pct"},
+                            {"field": "upper", "format": ".1%", "title": f"Trees' {bands['percentiles'][1]:g}th pct"}],
+            },
+        })
+    
+    return {
+        "title": {"text": "Predicted Survival Curve", "fontSize": 16},
+        "height": 420,
+        "layer": layers + [
+            {
+                "data": {"values": curve},
+                "mark": {"type": "area", "interpolate": "step-after", "color": "#3b82f6", "opacity": 0.15},
+                "encoding": {
+                    "x": {"field": "time", "type": "quantitative", "scale": x_scale},
+                    "y": {"field": "survival", "type": "quantitative", "scale": {"domain": [0, 1.02]}},
+                },
+            },
+            {
+                "data": {"values": curve},
+                "mark": {"type": "line", "interpolate": "step-after", "color": "#1e3a5f", "strokeWidth": 2.5},
+                "encoding": {
+                    "x": {"field": "time", "type": "quantitative", "title": "Time (Years)", "scale": x_scale},
+                    "y": {"field": "survival", "type": "quantitative", "axis": y_axis,
+                          "scale": {"domain": [0, 1.02]}},
+                    "tooltip": [{"field": "time", "format": ".2f", "title": "Years"},
+                                {"field": "survival", "format": ".1%", "title": "Survival"}],
+                },
+            },
+            {
+                "data": {"values": points},
+                "mark": {"type": "point", "filled": True, "size": 120, "stroke": "white", "strokeWidth": 2},
+                "encoding": {
+                    "x": {"field": "time", "type": "quantitative"},
+                    "y": {"field": "survival", "type": "quantitative"},
+                    "color": {"field": "color", "type": "nominal", "scale": None},
+                    "tooltip": [{"field": "label", "title": "Survival"}],
+                },
+            },
+            {
+                "data": {"values": points},
+                "mark": {"type": "text", "align": "left", "dx": 10, "dy": -12, "fontWeight": "bold", "fontSize": 12},
+                "encoding": {
+                    "x": {"field": "time", "type": "quantitative"},
+                    "y": {"field": "survival", "type": "quantitative"},
+                    "text": {"field": "label"},
+                    "color": {"field": "color", "type": "nominal", "scale": None},
+                },
+            },
+        ],
+    }
+
+# =========================================================
+# ⏱️ 渲染耗时对比
+# =========================================================
+def measure_render_time(surv_func, repeats=10, renderer=None):
+    """对比原有逐次重绘（st.pyplot 默认 200 dpi、bbox_inches='tight'）与复用渲染器的耗时（毫秒）"""
+    import matplotlib.pyplot as plt
+    
+    renderer = renderer or SurvivalCurveRenderer()
+    renderer.render_png(surv_func)
+    
+    def legacy():
+        fig = plot_survival_curve_professional(surv_func)
+        fig.savefig(io.BytesIO(), format='png', dpi=200, bbox_inches='tight')
+        plt.close(fig)
+    
+    timings = {}
+    for name, fn in [("legacy_figure_ms", legacy),
+                     ("renderer_png_ms", lambda: renderer.render_png(surv_func)),
+                     ("vector_spec_ms", lambda: survival_curve_spec(surv_func))]:
+        fn()
+        started = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        timings[name] = (time.perf_counter() - started) * 1000 / repeats
+    return timings
+
+# =========================================================
+# 🔍 敏感性分析图
+# =========================================================
+def sensitivity_curve_spec(sweep, feature_label, current_value=None):
+    """单特征扫描：1-4 年生存率随特征取值变化的曲线（Vega-Lite）"""
+    values = sweep["values"][0]
+    rows = [
+        {"value": round(float(v), 4), "horizon": HORIZON_LABELS[j], "survival": round(float(sweep["survival"][i, j]), 5)}
+        for i, v in enumerate(values) for j in range(len(sweep["horizons"]))
+    ]
+    layers = [{
+        "data": {"values": rows},
+        "mark": {"type": "line", "interpolate": "step-after", "strokeWidth": 2.5},
+        "encoding": {
+            "x": {"field": "value", "type": "quantitative", "title": feature_label,
+                  "scale": {"domain": [float(values[0]), float(values[-1])], "nice": False}},
+            "y": {"field": "survival", "type": "quantitative", "title": "Survival Probability",
+                  "axis": {"format": ".0%"}, "scale": {"domain": [0, 1]}},
+            "color": {"field": "horizon", "type": "nominal", "title": None,
+                      "scale": {"domain": HORIZON_LABELS, "range": HORIZON_COLORS}},
+            "tooltip": [{"field": "value", "title": feature_label},
+                        {"field": "horizon", "title": "Horizon"},
+                        {"field": "survival", "format": ".1%", "title": "Survival"}],
+        },
+    }]
+    if current_value is not None:
+        layers.append({
+            "data": {"values": [{"value": float(current_value)}]},
+            "mark": {"type": "rule", "strokeDash": [4, 4], "color": "#64748b"},
+            "encoding": {"x": {"field": "value", "type": "quantitative"}},
+        })
+    return {"title": {"text": f"Survival vs {feature_label}", "fontSize": 16}, "height": 380, "layer": layers}
+
+
+def sensitivity_heatmap_spec(sweep, feature_labels, horizon, current_values=None):
+    """双特征扫描：指定年份生存率的热力图（Vega-Lite），每个网格单元画到相邻点的中点"""
+    j = sweep["horizons"].index(horizon)
+    x_values, y_values = sweep["values"]
+    
+    def edges(values):
+        middle = (values[1:] + values[:-1]) / 2
+        return np.concatenate([[values[0]], middle]), np.concatenate([middle, [values[-1]]])
+    
+    x_lo, x_hi = edges(x_values)
+    y_lo, y_hi = edges(y_values)
+    survival = sweep["survival"][..., j]
+    rows = [
+        {"x": round(float(x_values[a]), 4), "y": round(float(y_values[b]), 4),
+         "x_lo": float(x_lo[a]), "x_hi": float(x_hi[a]), "y_lo": float(y_lo[b]), "y_hi": float(y_hi[b]),
+         "survival": round(float(survival[a, b]), 5)}
+        for a in range(len(x_values)) for b in range(len(y_values))
+    ]
+    layers = [{
+        "data": {"values": rows},
+        "mark": {"type": "rect"},
+        "encoding": {
+            "x": {"field": "x_lo", "type": "quantitative", "title": feature_labels[0],
+                  "scale": {"domain": [float(x_values[0]), float(x_values[-1])], "nice": False}},
+            "x2": {"field": "x_hi"},
+            "y": {"field": "y_lo", "type": "quantitative", "title": feature_labels[1],
+                  "scale": {"domain": [float(y_values[0]), float(y_values[-1])], "nice": False}},
+            "y2": {"field": "y_hi"},
+            "color": {"field": "survival", "type": "quantitative", "title": f"{horizon}-Year",
+                      "scale": {"scheme": "redyellowgreen", "domain": [0, 1]}, "legend": {"format": ".0%"}},
+            "tooltip": [{"field": "x", "title": feature_labels[0]}, {"field": "y", "title": feature_labels[1]},
+                        {"field": "survival", "format": ".1%", "title": f"{horizon}-Year survival"}],
+        },
+    }]
+    if current_values is not None:
+        layers.append({
+            "data": {"values": [{"x": float(current_values[0]), "y": float(current_values[1])}]},
+            "mark": {"type": "point", "shape": "cross", "size": 200, "color": "#1e293b", "strokeWidth": 2},
+            "encoding": {"x": {"field": "x", "type": "quantitative"}, "y": {"field": "y", "type": "quantitative"}},
+        })
+    return {"title": {"text": f"{horizon}-Year Survival", "fontSize": 16}, "height": 420, "layer": layers}
+
+# =========================================================
+# ✅ 校准图
+# =========================================================
+def calibration_plot_spec(calibration):
+    """校准图（Vega-Lite）：各年份每组的平均预测生存率与 Kaplan-Meier 观察生存率
+    
+    calibration 为 validation.calibration_table 的结果；竖线为观察值的置信区间，虚线为完美校准。
+    """
+    rows = [
+        {"horizon": f"{row.horizon:g}-Year", "group": int(row.group), "patients": int(row.patients),
+         "predicted": float(row.predicted), "observed": float(row.observed),
+         "low": float(row.observed_low), "high": float(row.observed_high)}
+        for row in calibration.itertuples()
+    ]
+    labels = [label for label in HORIZON_LABELS if any(r["horizon"] == label for r in rows)]
+    colors = [HORIZON_COLORS[HORIZON_LABELS.index(label)] for label in labels]
+    color = {"field": "horizon", "type": "nominal", "title": None, "scale": {"domain": labels, "range": colors}}
+    x = {"field": "predicted", "type": "quantitative", "title": "Predicted Survival",
+         "axis": {"format": ".0%"}, "scale": {"domain": [0, 1]}}
+    y = {"field": "observed", "type": "quantitative", "title": "Observed Survival (Kaplan-Meier)",
+         "axis": {"format": ".0%"}, "scale": {"domain": [0, 1]}}
+    return {
+        "title": {"text": "Calibration", "fontSize": 16},
+        "height": 420,
+        "layer": [
+            {
+                "data": {"values": [{"predicted": 0, "observed": 0}, {"predicted": 1, "observed": 1}]},
+                "mark": {"type": "line", "strokeDash": [4, 4], "color": "#94a3b8"},
+                "encoding": {"x": x, "y": y},
+            },
+            {
+                "data": {"values": rows},
+                "mark": {"type": "rule", "strokeWidth": 1.5, "opacity": 0.6},
+                "encoding": {"x": {"field": "predicted", "type": "quantitative"},
+                             "y": {"field": "low", "type": "quantitative"}, "y2": {"field": "high"}, "color": color},
+            },
+            {
+                "data": {"values": rows},
+                "mark": {"type": "line", "point": {"filled": True, "size": 70}, "strokeWidth": 1.5},
+                "encoding": {
+                    "x": x, "y": y, "color": color,
+                    "tooltip": [{"field": "horizon", "title": "Horizon"}, {"field": "group", "title": "Group"},
+                                {"field": "patients", "title": "Patients"},
+                                {"field": "predicted", "format": ".1%", "title": "Predicted"},
+                                {"field": "observed", "format": ".1%", "title": "Observed"},
+                                {"field": "low", "format": ".1%", "title": "Observed low"},
+                                {"field": "high", "format": ".1%", "title": "Observed high"}],
+                },
+            },
+        ],
+    }
+
+# =========================================================
+# 🧭 TreeSHAP 瀑布图与特征重要性
+# =========================================================
+WATERFALL_UP_COLOR = "#dc2626"
+WATERFALL_DOWN_COLOR = "#16a34a"
+
+
+def shap_waterfall_spec(labels, contributions, base_value, prediction, output_name,
+                        percent=False, higher_is_better=False, max_features=10):
+    """单个患者的瀑布图（Vega-Lite）：从期望值开始逐个加上特征贡献，到达预测值
+    
+    labels 为各特征的显示文本（例如 "Glucose = 6.0"），按 |贡献| 降序排列，
+    超过 max_features 的特征合并为 "Other features"。
+    higher_is_better 为 True 时（生存率）正贡献用绿色，否则（风险评分）用红色。
+    """
+    contributions = np.asarray(contributions, dtype=np.float64)
+    order = np.argsort(-np.abs(contributions), kind="stable")
+    items = [(labels[i], contributions[i]) for i in order[:max_features]]
+    if len(order) > max_features:
+        items.append((f"Other features ({len(order) - max_features})", contributions[order[max_features:]].sum()))
+    
+    value_format = ".1%" if percent else ".2f"
+    good, bad = "Improves outlook", "Worsens outlook"
+    rows = []
+    running = float(base_value)
+    for label, value in items:
+        raises = value >= 0
+        rows.append({"label": label, "start": running, "end": running + value, "value": float(value),
+                     "effect": good if raises == higher_is_better else bad})
+        running += value
+    markers = [{"label": "Expected value", "x": float(base_value)},
+               {"label": "This patient", "x": float(prediction)}]
+    y_order = [markers[0]["label"]] + [row["label"] for row in rows] + [markers[1]["label"]]
+    y_axis = {"field": "label", "type": "nominal", "title": None, "sort": y_order}
+    
+    layers = [
+        {
+            "data": {"values": rows},
+            "mark": {"type": "bar", "height": 18, "cornerRadius": 2},
+            "encoding": {
+                "y": y_axis,
+                "x": {"field": "start", "type": "quantitative", "title": output_name,
+                      "axis": {"format": value_format}, "scale": {"zero": False}},
+                "x2": {"field": "end"},
+                "color": {"field": "effect", "type": "nominal", "title": None,
+                          "scale": {"domain": [bad, good], "range": [WATERFALL_UP_COLOR, WATERFALL_DOWN_COLOR]}},
+                "tooltip": [{"field": "label", "title": "Feature"},
+                            {"field": "value", "format": "+" + value_format, "title": "Contribution"}],
+            },
+        },
+        {
+            "data": {"values": rows},
+            "mark": {"type": "text", "align": "left", "dx": 4, "fontSize": 11, "color": "#334155"},
+            "encoding": {
+                "y": y_axis,
+                "x": {"field": "end", "type": "quantitative"},
+                "text": {"field": "value", "type": "quantitative", "format": "+" + value_format},
+            },
+        },
+        {
+            "data": {"values": markers},
+            "mark": {"type": "point", "shape": "diamond", "size": 120, "filled": True, "color": "#1e3a5f"},
+            "encoding": {
+                "y": y_axis,
+                "x": {"field": "x", "type": "quantitative"},
+                "tooltip": [{"field": "label", "title": ""}, {"field": "x", "format": value_format, "title": output_name}],
+            },
+        },
+    ]
+    return {"height": 28 * len(y_order), "layer": layers}
+
+
+def importance_bar_spec(importance, output_name, percent=False):
+    """队列特征重要性条形图（Vega-Lite），importance 为 {特征显示名: 平均 |SHAP|}"""
+    rows = [{"feature": name, "importance": float(value)} for name, value in importance.items()]
+    return {
+        "data": {"values": rows},
+        "height": 26 * len(rows),
+        "mark": {"type": "bar", "color": "#2563eb", "cornerRadius": 2},
+        "encoding": {
+            "y": {"field": "feature", "type": "nominal", "title": None, "sort": "-x"},
+            "x": {"field": "importance", "type": "quantitative", "title": f"Mean |SHAP| ({output_name})",
+                  "axis": {"format": ".1%" if percent else ".2f"}},
+            "tooltip": [{"field": "feature", "title": "Feature"},
+                        {"field": "importance", "format": ".2%" if percent else ".3f", "title": "Mean |SHAP|"}],
+        },
+    }
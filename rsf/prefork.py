@@ -0,0 +1,178 @@
+# =========================================================
+# 🍴 预派生多进程推理服务
+# 用法：python -m rsf serve --workers 4 --port 8600
+#
+# 主进程只加载一次模型并编译为展平数组，预热后 gc.freeze()，再 fork 出各工作进程。
+# 模型数组在各进程之间写时复制共享：NumPy 数据缓冲区从不被写入，
+# 冻结后的对象不再被垃圾回收遍历，不会因为 GC 标记而弄脏所在的内存页。
+# 所有工作进程在同一个监听 socket 上 accept，由内核把连接分给空闲的进程；
+# 主进程负责监督，工作进程退出时自动重启，收到 SIGUSR1 时打印各进程内存
+# =========================================================
+
+import asyncio
+import gc
+import os
+import select
+import signal
+import socket
+import sys
+import time
+
+from rsf import core
+from rsf.metrics import METRICS, process_memory
+
+# 工作进程连续异常退出时，两次重启之间的最短间隔（秒）
+RESPAWN_DELAY = 1.0
+
+
+def create_listen_socket(host, port, backlog=2048):
+    """在 fork 之前创建并监听的 socket，由所有工作进程共享"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def prepare_for_fork(model, feature_list):
+    """fork 前的准备：预热一次预测（触发延迟导入与缓存），回收垃圾后冻结现有对象"""
+    core.predict_forest(model, core.synthetic_cohort(8, feature_list))
+    gc.collect()
+    gc.freeze()
+
+
+def format_memory_report(report):
+    lines = [f"{'process':<12} {'pid':>8} {'RSS MiB':>9} {'PSS MiB':>9} {'shared MiB':>11} {'private MiB':>12}"]
+    total_pss = 0
+    for name, pid, memory in report:
+        if memory is None:
+            lines.append(f"{name:<12} {pid:>8} {'n/a':>9}")
+            continue
+        total_pss += memory["pss"]
+        lines.append(f"{name:<12} {pid:>8} {memory['rss'] / 2**20:9.1f} {memory['pss'] / 2**20:9.1f} "
+                     f"{memory['shared'] / 2**20:11.1f} {memory['private'] / 2**20:12.1f}")
+    lines.append(f"{'total PSS':<12} {'':>8} {'':>9} {total_pss / 2**20:9.1f}")
+    return "\n".join(lines)
+
+
+class PreforkServer:
+    """主进程：创建监听 socket、派生并监督工作进程"""
+    
+    def __init__(self, model, feature_list, host="127.0.0.1", port=8600, workers=2, **options):
+        self.model = model
+        self.feature_list = feature_list
+        self.host = host
+        self.port = port
+        self.n_workers = workers
+        self.options = options
+        self.sock = None
+        self.workers = {}  # pid -> 工作进程编号
+        self._stopping = False
+        self._ready_read, self._ready_write = os.pipe()
+    
+    # -----------------------------------------------------
+    # 工作进程
+    # -----------------------------------------------------
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = index
+            return pid
+        
+        # 子进程：Ctrl+C 由主进程统一处理，工作进程只响应主进程发来的 SIGTERM
+        code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+            os.close(self._ready_read)
+            METRICS.reset()
+            self._run_worker(index)
+        except BaseException:
+            import traceback
+            
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    
+    def _run_worker(self, index):
+        from rsf.service import InferenceServer
+        
+        server = InferenceServer(self.model, self.feature_list, worker=index, **self.options)
+        
+        def ready(_):
+            os.write(self._ready_write, b"1")
+        
+        asyncio.run(server.serve(sock=self.sock, ready_callback=ready))
+    
+    # -----------------------------------------------------
+    # 主进程
+    # -----------------------------------------------------
+    def start(self):
+        """创建 socket、冻结对象并派生全部工作进程，等待它们开始监听"""
+        self.sock = create_listen_socket(self.host, self.port)
+        prepare_for_fork(self.model, self.feature_list)
+        for index in range(self.n_workers):
+            self._spawn(index)
+        
+        ready = 0
+        deadline = time.monotonic() + 60
+        while ready < self.n_workers and time.monotonic() < deadline:
+            readable, _, _ = select.select([self._ready_read], [], [], 1.0)
+            if readable:
+                ready += len(os.read(self._ready_read, self.n_workers))
+        return ready
+    
+    def memory_report(self):
+        """[(名称, pid, 内存明细)]，主进程在前"""
+        report = [("master", os.getpid(), process_memory())]
+        for pid, index in sorted(self.workers.items(), key=lambda item: item[1]):
+            report.append((f"worker {index}", pid, process_memory(pid)))
+        return report
+    
+    def stop(self, *_):
+        self._stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    def supervise(self):
+        """等待工作进程退出；未在停止过程中时按原编号重启"""
+        last_respawn = {}
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
+            index = self.workers.pop(pid, None)
+            if index is None or self._stopping:
+                continue
+            print(f"worker {index} (pid {pid}) exited with status {status}; restarting", file=sys.stderr, flush=True)
+            wait = RESPAWN_DELAY - (time.monotonic() - last_respawn.get(index, 0.0))
+            if wait > 0:
+                time.sleep(wait)
+            last_respawn[index] = time.monotonic()
+            self._spawn(index)
+        if self.sock is not None:
+            self.sock.close()
+
+
+def serve_prefork(model, feature_list, host="127.0.0.1", port=8600, workers=2, **options):
+    """以预派生多进程方式启动服务直到收到 SIGINT / SIGTERM"""
+    server = PreforkServer(model, feature_list, host=host, port=port, workers=workers, **options)
+    ready = server.start()
+    address = server.sock.getsockname()
+    print(f"serving on {address} with {ready}/{workers} workers (master pid {os.getpid()})", flush=True)
+    print(format_memory_report(server.memory_report()), flush=True)
+    
+    signal.signal(signal.SIGINT, server.stop)
+    signal.signal(signal.SIGTERM, server.stop)
+    signal.signal(signal.SIGUSR1, lambda *_: print(format_memory_report(server.memory_report()), flush=True))
+    server.supervise()
@@ -0,0 +1,147 @@
+# =========================================================
+# ⚡ 渐进式预测
+# 按固定的随机顺序逐批加入树，边累加边估计 1-4 年生存率的不确定性：
+# 达到容差或用完时间预算即停止，返回已用的树数与剩余的不确定性。
+# 随机森林的树可交换，前 k 棵树的平均是全森林平均的无偏估计
+# =========================================================
+
+import time
+
+import numpy as np
+
+from rsf.core import SURVIVAL_HORIZONS, get_horizon_columns, step_function
+from rsf.engine import compile_forest, prepare_features
+
+# 默认停止条件：1-4 年生存率 95% 区间半宽不超过 1 个百分点
+PROGRESSIVE_TOLERANCE = 0.01
+PROGRESSIVE_STEP = 10
+PROGRESSIVE_MIN_TREES = 20
+Z_95 = 1.959964
+
+
+class ProgressiveResult:
+    """一次渐进式预测（或其中间状态）的结果
+    
+    horizon_surv             1-4 年生存率，形状 (n, 4)
+    margin                   1-4 年生存率的 95% 区间半宽（有限总体校正，用满全部树时为 0）
+    n_trees, total_trees     已用 / 全部树数
+    stopped_by               "tolerance"、"budget"、"all_trees"；中间状态为 None
+    risk_scores, surv        已用树的平均风险评分与完整生存曲线，首次访问时才聚合
+    """
+    
+    def __init__(self, forest, leaves, horizon_surv, margin, elapsed_ms, stopped_by=None):
+        self.forest = forest
+        self.leaves = leaves
+        self.horizon_surv = horizon_surv
+        self.margin = margin
+        self.n_trees = leaves.shape[1]
+        self.total_trees = forest.n_trees
+        self.elapsed_ms = elapsed_ms
+        self.stopped_by = stopped_by
+        self._aggregated = None
+    
+    @property
+    def done(self):
+        return self.stopped_by is not None
+    
+    @property
+    def max_margin(self):
+        return float(self.margin.max()) if self.margin.size else 0.0
+    
+    def _aggregate(self):
+        if self._aggregated is None:
+            self._aggregated = self.forest.aggregate(self.leaves)
+        return self._aggregated
+    
+    @property
+    def risk_scores(self):
+        return self._aggregate()[0]
+    
+    @property
+    def surv(self):
+        return self._aggregate()[1]
+    
+    @property
+    def risk_score(self):
+        return self.risk_scores[0]
+    
+    @property
+    def surv_func(self):
+        """第一个样本的生存函数（与 predict_survival 的返回值一致）"""
+        return step_function(self.forest.unique_times_, self.surv[0])
+
+
+def tree_order(n_trees, seed=0):
+    """固定的随机加入顺序"""
+    return np.random.default_rng(seed).permutation(n_trees)
+
+
+def predict_progressive(model, input_data, tolerance=PROGRESSIVE_TOLERANCE, budget_ms=None,
+                        step=PROGRESSIVE_STEP, min_trees=PROGRESSIVE_MIN_TREES, seed=0, callback=None):
+    """渐进式预测：每次加入 step 棵树，满足任一条件时停止
+    
+    - 至少用了 min_trees 棵树，且所有样本 1-4 年生存率的 95% 区间半宽都不超过 tolerance
+    - 已用时间超过 budget_ms（None 表示不限）
+    - 全部树都已加入（此时结果与 predict_forest 一致）
+    
+    每批只累加 1-4 年对应的生存概率列，完整曲线在读取结果时才按已用的树聚合。
+    callback(result) 在每批之后调用，可用于界面逐步刷新。
+    model 为 sksurv 模型时先编译为 FlatForest（较慢，应传入已编译的森林）。
+    """
+    started = time.perf_counter()
+    forest = compile_forest(model)
+    X = prepare_features(forest, input_data)
+    n_samples = X.shape[0]
+    total_trees = forest.n_trees
+    order = tree_order(total_trees, seed)
+    
+    horizon_columns = get_horizon_columns(forest.unique_times_, SURVIVAL_HORIZONS)
+    observed = horizon_columns >= 0
+    horizon_table = forest.leaf_surv[:, horizon_columns[observed]].astype(np.float64)
+    
+    sums = np.zeros((n_samples, int(observed.sum())), dtype=np.float64)
+    squares = np.zeros_like(sums)
+    horizon_surv = np.ones((n_samples, len(SURVIVAL_HORIZONS)), dtype=np.float64)
+    margin = np.zeros((n_samples, len(SURVIVAL_HORIZONS)), dtype=np.float64)
+    leaves = np.empty((n_samples, total_trees), dtype=np.int32)
+    
+    n_used = 0
+    while True:
+        batch = order[n_used:n_used + step]
+        batch_leaves = forest.apply(X, trees=batch)
+        leaves[:, n_used:n_used + len(batch)] = batch_leaves
+        values = horizon_table[batch_leaves]  # (n, 批内树数, 时间点数)
+        sums += values.sum(axis=1)
+        squares += (values ** 2).sum(axis=1)
+        n_used += len(batch)
+        
+        stopped_by = None
+        if n_used == total_trees:
+            # 用满全部树：按原始树顺序聚合，结果与 predict_forest 逐位一致
+            leaves[:, order] = leaves.copy()
+            stopped_by = "all_trees"
+            horizon_surv[:, observed] = sums / n_used
+            margin[:] = 0.0
+        else:
+            horizon_surv[:, observed] = sums / n_used
+            if n_used > 1:
+                variance = np.maximum(squares / n_used - horizon_surv[:, observed] ** 2, 0) * n_used / (n_used - 1)
+                # 从有限的树中无放回抽取：乘以有限总体校正
+                correction = (total_trees - n_used) / (total_trees - 1)
+                margin[:, observed] = Z_95 * np.sqrt(variance / n_used * correction)
+            else:
+                margin[:, observed] = np.inf
+            if n_used >= min_trees and margin.max() <= tolerance:
+                stopped_by = "tolerance"
+            elif budget_ms is not None and (time.perf_counter() - started) * 1000 >= budget_ms:
+                stopped_by = "budget"
+        
+        result = ProgressiveResult(forest, leaves[:, :n_used], horizon_surv.copy(), margin.copy(),
+                                   (time.perf_counter() - started) * 1000, stopped_by)
+        if stopped_by == "all_trees":
+            # 用满全部树时 1-4 年生存率取自完整聚合，避免求和顺序带来的末位差异
+            result.horizon_surv[:, observed] = result.surv[:, horizon_columns[observed]]
+        if callback is not None:
+            callback(result)
+        if stopped_by is not None:
+            return result
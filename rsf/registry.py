@@ -0,0 +1,329 @@
+# =========================================================
+# 🗂️ 模型注册表
+# 在模型目录（RSF_MODEL_DIR，默认 models/）中查找模型文件（.joblib）与模型目录（.flat），
+# 以模型内容与特征列表的 SHA-256 前 12 位作为版本号；<名称>.features.txt 为该模型的特征列表，
+# 没有时依次使用目录中的 selected_features.txt 与 core.load_feature_list() 的默认列表。
+# 模型在第一次使用时才加载，已加载的模型按最近使用顺序保留，总大小超过上限时淘汰最久未用的。
+# 目录内容或 registry.json 改变后自动重新扫描：新版本无需重启即可上线，
+# 已打开的会话在下一次交互时切换到新版本，不会断开。registry.json 指定别名与 A/B 分流：
+#     {"production": "rsf_model", "candidate": "rsf_model_v2", "candidate_share": 0.2}
+# 模型目录不存在时退回 core.MODEL_PATHS 中第一个存在的模型（原有行为）
+# =========================================================
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from rsf import core
+from rsf.artifact import FLAT_SUFFIX, is_flat_artifact, path_size
+from rsf.metrics import METRICS
+
+MODEL_DIR = os.environ.get("RSF_MODEL_DIR", "models")
+# 已加载模型（编译后的数组）的总大小上限
+MODEL_CACHE_BYTES = int(float(os.environ.get("RSF_MODEL_CACHE_MB", 1024)) * 2**20)
+# 两次检查目录是否改变之间的最短间隔（秒）
+POLL_INTERVAL = 5.0
+REGISTRY_FILE = "registry.json"
+FEATURES_SUFFIX = ".features.txt"
+MODEL_SUFFIXES = (FLAT_SUFFIX, ".joblib")
+
+
+def _file_digest(path, digest):
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            digest.update(block)
+
+
+def content_digest(path, feature_path=None):
+    """模型（文件或 .flat 目录内的全部文件，按文件名排序）与特征列表内容的 SHA-256"""
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            digest.update(name.encode("utf-8") + b"\0")
+            _file_digest(os.path.join(path, name), digest)
+    else:
+        _file_digest(path, digest)
+    if feature_path is not None:
+        digest.update(b"\0features\0")
+        _file_digest(feature_path, digest)
+    return digest.hexdigest()
+
+
+def _stat_key(path):
+    """内容是否可能改变的判断依据：大小与修改时间（目录取其中各文件）"""
+    paths = [path] if not os.path.isdir(path) else [os.path.join(path, n) for n in sorted(os.listdir(path))]
+    return tuple((p, os.path.getsize(p), os.stat(p).st_mtime_ns) for p in paths)
+
+
+class ModelVersion:
+    """注册表中的一个模型文件
+    
+    name                 文件名（如 rsf_model.flat）
+    stem                 去掉扩展名的名称（如 rsf_model），registry.json 中可用它指代模型
+    version              内容摘要的前 12 位
+    digest               完整的 SHA-256
+    """
+    
+    def __init__(self, path, feature_path, digest):
+        self.path = path
+        self.feature_path = feature_path
+        self.name = os.path.basename(path.rstrip(os.sep))
+        self.stem = os.path.splitext(self.name)[0]
+        self.digest = digest
+        self.version = digest[:12]
+        self.modified = os.path.getmtime(path)
+    
+    def __repr__(self):
+        return f"ModelVersion({self.name!r}, {self.version!r})"
+
+
+class LoadedModel:
+    """已加载的模型版本：预测引擎、特征列表，以及依附于该版本的派生对象（缓存、索引、解释器等）
+    
+    派生对象通过 resource() 创建，随模型一起被淘汰。
+    """
+    
+    def __init__(self, version, engine, feature_list):
+        self.version = version
+        self.engine = engine
+        self.feature_list = feature_list
+        self.nbytes = getattr(engine, "nbytes", None) or path_size(version.path)
+        self.loaded_at = time.time()
+        self._resources = {}
+        self._lock = threading.Lock()
+    
+    def resource(self, name, factory):
+        """按名称返回派生对象，第一次访问时用 factory() 创建"""
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = factory()
+            return self._resources[name]
+    
+    def cached_resource(self, name):
+        """已创建的派生对象，尚未创建时为 None（不触发创建）"""
+        with self._lock:
+            return self._resources.get(name)
+
+
+def session_bucket(session_key):
+    """会话在 [0, 1) 上的固定位置，决定 A/B 分流"""
+    return int(hashlib.sha256(str(session_key).encode("utf-8")).hexdigest()[:8], 16) / 2**32
+
+
+class ModelRegistry:
+    """模型版本的发现、按需加载、LRU 淘汰与别名解析（线程安全，各会话共享一个实例）
+    
+    compile_model(model) 把加载的模型转换为预测引擎（如 compile_forest），None 表示直接使用。
+    """
+    
+    def __init__(self, directory=MODEL_DIR, max_bytes=MODEL_CACHE_BYTES, compile_model=None,
+                 poll_interval=POLL_INTERVAL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compile_model = compile_model
+        self.poll_interval = poll_interval
+        self.versions = []
+        self.aliases = {}
+        self.candidate_share = 0.0
+        self.errors = {}
+        self._digests = {}  # 路径 → (大小与修改时间, 摘要)
+        self._signature = None
+        self._checked_at = 0.0
+        self._loaded = OrderedDict()  # 版本号 → LoadedModel，最近使用的在后
+        self._loading = {}  # 版本号 → 加载锁，同一版本只加载一次
+        self._lock = threading.RLock()
+        self.refresh(force=True)
+        METRICS.register_gauge("model_registry_versions", lambda: len(self.versions))
+        METRICS.register_gauge("model_registry_loaded", lambda: len(self._loaded))
+        METRICS.register_gauge("model_registry_loaded_bytes", lambda: self.loaded_bytes)
+    
+    # -----------------------------------------------------
+    # 发现
+    # -----------------------------------------------------
+    @property
+    def uses_directory(self):
+        return self.directory is not None and os.path.isdir(self.directory)
+    
+    def _candidates(self):
+        """(模型路径, 特征列表路径) 列表"""
+        if not self.uses_directory:
+            path = core.find_model_path()
+            feature_path = next((p for p in core.FEATURE_LIST_PATHS if os.path.exists(p)), None)
+            return [] if path is None else [(path, feature_path)]
+        
+        shared_features = os.path.join(self.directory, "selected_features.txt")
+        if not os.path.exists(shared_features):
+            shared_features = None
+        candidates = []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            # 以 . 开头的是写入中的临时文件（如 save_flat_forest 的 .tmp- 目录）
+            if name.startswith(".") or not name.endswith(MODEL_SUFFIXES):
+                continue
+            if name.endswith(FLAT_SUFFIX) and not is_flat_artifact(path):
+                continue
+            feature_path = os.path.join(self.directory, os.path.splitext(name)[0] + FEATURES_SUFFIX)
+            candidates.append((path, feature_path if os.path.exists(feature_path) else shared_features))
+        return candidates
+    
+    def _directory_signature(self):
+        if not self.uses_directory:
+            path = core.find_model_path()
+            return ("paths", None if path is None else _stat_key(path))
+        entries = []
+        for name in sorted(os.listdir(self.directory)):
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append((name, stat.st_size, stat.st_mtime_ns))
+        return tuple(entries)
+    
+    def refresh(self, force=False):
+        """目录或 registry.json 改变时重新扫描；返回是否重新扫描了
+        
+        未强制时每 poll_interval 秒最多检查一次，检查本身只读取目录项的大小与修改时间。
+        """
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._checked_at < self.poll_interval:
+                return False
+            self._checked_at = now
+            signature = self._directory_signature()
+            if not force and signature == self._signature:
+                return False
+            
+            versions = []
+            for path, feature_path in self._candidates():
+                try:
+                    key = _stat_key(path) + (() if feature_path is None else _stat_key(feature_path))
+                    cached = self._digests.get(path)
+                    digest = cached[1] if cached and cached[0] == key else content_digest(path, feature_path)
+                    self._digests[path] = (key, digest)
+                    versions.append(ModelVersion(path, feature_path, digest))
+                except OSError:
+                    # 扫描时文件被移走或仍在写入，下次扫描再试
+                    continue
+            # 同名时 .flat 优先于 .joblib（与 core.MODEL_PATHS 的顺序一致）
+            versions.sort(key=lambda v: (v.stem, not v.name.endswith(FLAT_SUFFIX)))
+            self.versions = versions
+            self._read_aliases()
+            self._signature = signature
+            METRICS.increment("model_registry_scans")
+            return True
+    
+    def _read_aliases(self):
+        self.aliases, self.candidate_share = {}, 0.0
+        if not self.uses_directory:
+            return
+        path = os.path.join(self.directory, REGISTRY_FILE)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                config = json.load(f)
+            self.aliases = {key: str(value) for key, value in config.items() if key in ("production", "candidate")}
+            self.candidate_share = min(max(float(config.get("candidate_share", 0.0)), 0.0), 1.0)
+            self.errors.pop(REGISTRY_FILE, None)
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            self.errors[REGISTRY_FILE] = str(e)
+    
+    # -----------------------------------------------------
+    # 别名与分流
+    # -----------------------------------------------------
+    def find(self, key):
+        """按文件名、去扩展名的名称或版本号前缀查找版本，找不到返回 None"""
+        for match in (lambda v: v.name == key, lambda v: v.stem == key,
+                      lambda v: v.version.startswith(key) or v.digest.startswith(key)):
+            found = [v for v in self.versions if match(v)]
+            if found:
+                return found[0]
+        return None
+    
+    @property
+    def production(self):
+        """production 别名指向的版本；未配置或找不到时为最近修改的模型"""
+        version = self.find(self.aliases["production"]) if "production" in self.aliases else None
+        if version is None and self.versions:
+            version = max(self.versions, key=lambda v: v.modified)
+        return version
+    
+    @property
+    def candidate(self):
+        if "candidate" not in self.aliases or self.candidate_share <= 0:
+            return None
+        version = self.find(self.aliases["candidate"])
+        production = self.production
+        return None if production is not None and version is production else version
+    
+    def assign(self, session_key):
+        """会话使用的版本与分组（"production" 或 "candidate"）；同一会话的分组固定"""
+        self.refresh()
+        candidate = self.candidate
+        if candidate is not None and session_bucket(session_key) < self.candidate_share:
+            return candidate, "candidate"
+        return self.production, "production"
+    
+    # -----------------------------------------------------
+    # 加载与淘汰
+    # -----------------------------------------------------
+    @property
+    def loaded_bytes(self):
+        with self._lock:
+            return sum(loaded.nbytes for loaded in self._loaded.values())
+    
+    def loaded(self):
+        """已加载的版本（最近使用的在后）"""
+        with self._lock:
+            return list(self._loaded.values())
+    
+    def load(self, version):
+        """返回已加载的版本，第一次使用时加载并编译；加载后按上限淘汰最久未用的其他版本"""
+        with self._lock:
+            if version.version in self._loaded:
+                self._loaded.move_to_end(version.version)
+                return self._loaded[version.version]
+            lock = self._loading.setdefault(version.version, threading.Lock())
+        
+        # 加载较慢，不持有注册表的锁，其他会话仍可使用已加载的版本
+        with lock:
+            with self._lock:
+                if version.version in self._loaded:
+                    return self._loaded[version.version]
+            with METRICS.timer("model_registry_load"):
+                model = core.load_model(version.path)
+                if self.compile_model is not None:
+                    model = self.compile_model(model)
+                feature_list = core.load_feature_list(version.feature_path)
+            loaded = LoadedModel(version, model, feature_list)
+        
+        with self._lock:
+            self._loaded[version.version] = loaded
+            self._loading.pop(version.version, None)
+            self._evict(keep=version.version)
+        METRICS.increment("model_registry_loads")
+        return loaded
+    
+    def _evict(self, keep):
+        total = sum(loaded.nbytes for loaded in self._loaded.values())
+        for key in list(self._loaded):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._loaded.pop(key).nbytes
+            METRICS.increment("model_registry_evictions")
+    
+    def model_for_session(self, session_key):
+        """会话当前应使用的已加载模型与分组；分配的版本加载失败时退回 production，没有可用模型时返回 (None, None)"""
+        version, arm = self.assign(session_key)
+        if version is None:
+            return None, None
+        try:
+            return self.load(version), arm
+        except Exception as e:
+            self.errors[version.name] = str(e)
+            production = self.production
+            if arm == "candidate" and production is not None:
+                return self.load(production), "production"
+            raise
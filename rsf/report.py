@@ -0,0 +1,370 @@
+# =========================================================
+# 🖨️ 队列批量报告
+# 用法：python -m rsf report cohort.csv reports.zip --format pdf --workers 8
+#
+# 每位患者一页 A4 报告：风险评分、生存曲线、1-4 年生存率表与输入参数表（与界面中的预测结果相同）。
+# 整个队列只做一次向量化预测（score_cohort），页面在进程池中渲染：
+# 每个工作进程只构建一次页面模板（PatientReportRenderer），之后每位患者只更新数据与表格文字。
+# 渲染完成的页面按输入顺序边算边写入 ZIP（每位患者一个 PNG / PDF）或一个多页 PDF，
+# 在途页面数有上限，内存与队列大小无关
+# =========================================================
+
+import io
+import itertools
+import os
+import re
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+
+from rsf import core
+from rsf.metrics import METRICS
+from rsf.plot import HORIZON_LABELS, PLOT_STYLE, SurvivalCurveRenderer
+
+# A4 纵向，英寸
+REPORT_PAGE_SIZE = (8.27, 11.69)
+REPORT_DPI = 150
+REPORT_FORMATS = ("png", "pdf")
+# 每个任务渲染的页数
+REPORT_CHUNK_SIZE = 16
+
+DISCLAIMER = ("This report is for research and clinical reference only. "
+              "Please consult healthcare professionals for medical decisions.")
+
+# =========================================================
+# 📄 页面模板
+# =========================================================
+class PatientReportRenderer(SurvivalCurveRenderer):
+    """单个患者报告页的模板：标题、坐标轴、表格框架与文字只构建一次
+    
+    与患者有关的部分（曲线、标记点、页眉文字、表格中的取值）设为 animated，
+    栅格输出时静态部分只绘制一次并缓存像素，每页在缓存上只重绘这些部分；矢量 PDF 每页完整绘制。
+    输入参数表的行按 feature_list 固定。
+    """
+    
+    def __init__(self, feature_list, dpi=REPORT_DPI, footer=""):
+        self.feature_list = list(feature_list)
+        self.footer = footer
+        self._background = None
+        self._background_xlim = None
+        super().__init__(figsize=REPORT_PAGE_SIZE, dpi=dpi)
+    
+    def _create_axes(self):
+        return self.figure.add_axes([0.11, 0.46, 0.83, 0.38])
+    
+    def _layout(self):
+        # 页面各部分的位置固定，不做 tight_layout
+        pass
+    
+    def _build_static(self):
+        super()._build_static()
+        figure = self.figure
+        
+        figure.text(0.07, 0.955, 'Survival Prediction Report', fontsize=20, fontweight='bold', color='#1e293b')
+        self.patient_text = figure.text(0.07, 0.925, '', fontsize=12, color='#374151')
+        self.risk_text = figure.text(0.93, 0.925, '', fontsize=12, fontweight='bold', color='#1e3a5f', ha='right')
+        figure.add_artist(_rule(figure, 0.912))
+        
+        n_rows = len(self.feature_list)
+        figure.text(0.07, 0.385, 'Survival Probabilities', fontsize=12, fontweight='bold', color='#1e293b')
+        figure.text(0.50, 0.385, 'Input Parameters', fontsize=12, fontweight='bold', color='#1e293b')
+        self.survival_values = _table(figure, [0.07, 0.08, 0.36, 0.295], ['Time Point', 'Survival Probability'],
+                                      HORIZON_LABELS, n_rows, col_widths=(0.45, 0.55))
+        labels = [row["Parameter"] for row in core.input_summary({name: 0.0 for name in self.feature_list})]
+        self.input_values = _table(figure, [0.50, 0.08, 0.43, 0.295], ['Parameter', 'Value'], labels, n_rows)
+        
+        figure.add_artist(_rule(figure, 0.055))
+        figure.text(0.07, 0.035, DISCLAIMER, fontsize=8, color='#6b7280')
+        figure.text(0.07, 0.02, self.footer, fontsize=8, color='#6b7280')
+        
+        for artist in self._patient_artists():
+            artist.set_animated(True)
+    
+    def _patient_artists(self):
+        """每页都要重绘的部分，按 zorder 排列"""
+        artists = [self.curve, self.patient_text, self.risk_text, *self.survival_values, *self.input_values]
+        artists += [artist for marker in self.markers for artist in marker]
+        if self.fill is not None:
+            artists.append(self.fill)
+        return sorted(artists, key=lambda artist: artist.get_zorder())
+    
+    def update_page(self, page):
+        """把页面更新为 page（见 iter_report_pages）中的患者"""
+        curve = page["survival"]
+        self.update(curve)
+        self.fill.set_animated(True)
+        self.patient_text.set_text(f'Patient: {page["patient_id"]}')
+        self.risk_text.set_text(f'Risk Score: {page["risk_score"]:.1f}')
+        
+        horizon_probs = core.get_survival_probabilities(curve.x, curve.values, core.SURVIVAL_HORIZONS)[0]
+        for text, prob in zip(self.survival_values, horizon_probs):
+            text.set_text(f'{prob:.1%}')
+        for text, row in zip(self.input_values, core.input_summary(page["inputs"])):
+            text.set_text(row["Value"])
+        return self.figure
+    
+    def _draw_raster(self):
+        """在静态部分的缓存像素上重绘患者相关的部分；横轴范围变化时重建缓存"""
+        canvas = self.figure.canvas
+        xlim = self.ax.get_xlim()
+        if self._background is None or xlim != self._background_xlim:
+            canvas.draw()
+            self._background = canvas.copy_from_bbox(self.figure.bbox)
+            self._background_xlim = xlim
+        else:
+            canvas.restore_region(self._background)
+        for artist in self._patient_artists():
+            if artist.get_visible():
+                self.figure.draw_artist(artist)
+        return np.asarray(canvas.buffer_rgba())
+    
+    @METRICS.timed("render_report_page")
+    def render(self, page, fmt="png"):
+        """更新并渲染为 PNG 或 PDF（矢量）字节"""
+        with self._lock, self._rc_context(PLOT_STYLE):
+            self.update_page(page)
+            buffer = io.BytesIO()
+            if fmt == 'pdf':
+                self.figure.savefig(buffer, format='pdf', facecolor='white')
+            else:
+                # 低压缩级别：编码更快，图片稍大
+                _rgb_image(self._draw_raster()).save(buffer, format='png', compress_level=1,
+                                                     dpi=(self.figure.dpi, self.figure.dpi))
+        return buffer.getvalue()
+    
+    @METRICS.timed("render_report_page")
+    def render_raster(self, page):
+        """更新并渲染为 (宽, 高, zlib 压缩的 RGB 像素)，供 RasterPdfWriter 写入多页 PDF"""
+        with self._lock, self._rc_context(PLOT_STYLE):
+            self.update_page(page)
+            image = _rgb_image(self._draw_raster())
+            return image.width, image.height, zlib.compress(image.tobytes(), 6)
+
+
+def _rgb_image(rgba):
+    """画布的 RGBA 像素转为 PIL RGB 图像（白色背景，直接丢弃 alpha 通道）"""
+    from PIL import Image
+    
+    height, width = rgba.shape[:2]
+    return Image.frombuffer('RGBA', (width, height), rgba, 'raw', 'RGBA', 0, 1).convert('RGB')
+
+
+def _rule(figure, y):
+    from matplotlib.lines import Line2D
+    
+    return Line2D([0.07, 0.93], [y, y], transform=figure.transFigure, color='#cbd5e1', linewidth=1)
+
+
+def _table(figure, rect, columns, labels, n_rows, col_widths=(0.6, 0.4)):
+    """页面上的两列表格，第一列为固定的标签，返回第二列各行的 Text（取值在 update_page 中更新）
+    
+    行高按两张表中较长的一张（n_rows 行）统一。取值单独绘制，位置与表格单元格中的文字相同。
+    """
+    from matplotlib.table import Cell
+    
+    ax = figure.add_axes(rect)
+    ax.set_axis_off()
+    height = 1.0 / (max(n_rows, len(labels)) + 1)
+    table = ax.table(cellText=[[label, ''] for label in labels], colLabels=columns, colWidths=list(col_widths),
+                     cellLoc='left', bbox=[0, 1 - height * (len(labels) + 1), 1, height * (len(labels) + 1)])
+    table.auto_set_font_size(False)
+    table.set_fontsize(10)
+    for (row, _), cell in table.get_celld().items():
+        cell.set_edgecolor('#e2e8f0')
+        if row == 0:
+            cell.set_facecolor('#1e3a5f')
+            cell.get_text().set_color('white')
+            cell.get_text().set_fontweight('bold')
+        elif row % 2 == 0:
+            cell.set_facecolor('#f8fafc')
+    
+    x = col_widths[0] + Cell.PAD * col_widths[1]
+    return [ax.text(x, 1 - height * (row + 1.5), '', fontsize=10, va='center', ha='left')
+            for row in range(len(labels))]
+
+# =========================================================
+# 📚 多页 PDF
+# =========================================================
+class RasterPdfWriter:
+    """逐页追加写出多页 PDF，每页是一张整页图像（FlateDecode 压缩的 RGB）
+    
+    页面对象写出后即释放，内存中只保留各对象在文件中的偏移量；页树、目录与交叉引用表在 close() 时写出。
+    """
+    
+    # 1 号对象为目录，2 号对象为页树，在 close() 时写出
+    CATALOG, PAGES = 1, 2
+    
+    def __init__(self, path, page_size=REPORT_PAGE_SIZE):
+        self.path = path
+        self.width_pt, self.height_pt = page_size[0] * 72, page_size[1] * 72
+        self._file = open(path, "wb")
+        self._offsets = {}
+        self._next_number = 3
+        self._pages = []
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    
+    def _write_object(self, body, stream=None, number=None):
+        if number is None:
+            number, self._next_number = self._next_number, self._next_number + 1
+        self._offsets[number] = self._file.tell()
+        self._file.write(b"%d 0 obj\n" % number + body)
+        if stream is not None:
+            self._file.write(b"\nstream\n")
+            self._file.write(stream)
+            self._file.write(b"\nendstream")
+        self._file.write(b"\nendobj\n")
+        return number
+    
+    def add_page(self, width, height, pixels):
+        """添加一页：width × height 的 RGB 图像（zlib 压缩），铺满整页"""
+        image = self._write_object(
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+            b"/BitsPerComponent 8 /Filter /FlateDecode /Length %d >>" % (width, height, len(pixels)), pixels)
+        content = b"q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q" % (self.width_pt, self.height_pt)
+        contents = self._write_object(b"<< /Length %d >>" % len(content), content)
+        self._pages.append(self._write_object(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Resources << /XObject << /Im0 %d 0 R >> >> "
+            b"/Contents %d 0 R >>" % (self.PAGES, self.width_pt, self.height_pt, image, contents)))
+    
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % page for page in self._pages)
+        self._write_object(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._pages)), number=self.PAGES)
+        self._write_object(b"<< /Type /Catalog /Pages %d 0 R >>" % self.PAGES, number=self.CATALOG)
+        
+        xref = self._file.tell()
+        self._file.write(b"xref\n0 %d\n0000000000 65535 f \n" % self._next_number)
+        for number in range(1, self._next_number):
+            self._file.write(b"%010d 00000 n \n" % self._offsets[number])
+        self._file.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                         % (self._next_number, self.CATALOG, xref))
+        self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+# =========================================================
+# ⚙️ 工作进程
+# =========================================================
+_worker_state = {}
+
+
+def _init_worker(feature_list, dpi, footer):
+    """每个工作进程只构建一次页面模板"""
+    _worker_state["renderer"] = PatientReportRenderer(feature_list, dpi=dpi, footer=footer)
+
+
+def _render_pages(pages, fmt):
+    """渲染一组页面；fmt 为 png / pdf（文件字节）或 raster（见 render_raster）"""
+    renderer = _worker_state["renderer"]
+    if fmt == "raster":
+        return [renderer.render_raster(page) for page in pages]
+    return [renderer.render(page, fmt) for page in pages]
+
+# =========================================================
+# 🚀 批量生成
+# =========================================================
+def report_file_name(number, patient_id):
+    """ZIP 中的文件名：序号在前保证按输入顺序排列，患者编号中的特殊字符替换为下划线"""
+    return f"{number:06d}_{re.sub(r'[^0-9A-Za-z._-]+', '_', str(patient_id)).strip('_') or 'patient'}"
+
+
+def iter_report_pages(model, cohort_df, feature_list, id_column=None):
+    """校验队列并一次向量化预测全部有效行，返回 (逐页生成器, 问题记录)
+    
+    每页为 {"patient_id", "risk_score", "survival"（单行 SurvivalMatrix）, "inputs"（特征字典）}；
+    没有 id_column 时患者编号为输入文件中的行号。
+    """
+    features, issues = core.validate_cohort(cohort_df, feature_list)
+    results, curves = core.score_cohort(model, features, return_curves=True)
+    ids = cohort_df.loc[features.index, id_column] if id_column else features.index.map(lambda row: f"row {row}")
+    
+    def pages():
+        for i, (patient_id, risk, inputs) in enumerate(
+                zip(ids, results["risk_score"].to_numpy(), features.to_dict("records"))):
+            yield {"patient_id": patient_id, "risk_score": float(risk), "survival": curves[i], "inputs": inputs}
+    
+    return pages(), issues
+
+
+def _batches(pages, size):
+    pages = iter(pages)
+    while batch := list(itertools.islice(pages, size)):
+        yield batch
+
+
+def generate_reports(model, cohort_df, output, feature_list, fmt="png", workers=None, dpi=REPORT_DPI,
+                     id_column=None, chunk_size=REPORT_CHUNK_SIZE, max_pending=None, footer="",
+                     progress_callback=None):
+    """为队列中每位有效患者生成一页报告，返回 (统计, 问题记录)
+    
+    output 以 .pdf 结尾时写出一个多页 PDF（每页为 dpi 分辨率的图像）；
+    否则写出 ZIP，每位患者一个 fmt 格式（png，或矢量的 pdf）的文件。
+    progress_callback(done) 在每组页面写出后调用。
+    """
+    started = time.perf_counter()
+    pages, issues = iter_report_pages(model, cohort_df, feature_list, id_column)
+    predict_seconds = time.perf_counter() - started
+    
+    single_pdf = output.lower().endswith(".pdf")
+    task_format = "raster" if single_pdf else fmt
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    n_pages = 0
+    
+    if single_pdf:
+        sink = RasterPdfWriter(output)
+    else:
+        # PNG 已压缩，直接存储；PDF 再压缩一次
+        sink = zipfile.ZipFile(output, "w", zipfile.ZIP_STORED if fmt == "png" else zipfile.ZIP_DEFLATED)
+    
+    def collect(batch, rendered_pages):
+        nonlocal n_pages
+        for page, rendered in zip(batch, rendered_pages):
+            n_pages += 1
+            if single_pdf:
+                sink.add_page(*rendered)
+            else:
+                sink.writestr(f"{report_file_name(n_pages, page['patient_id'])}.{fmt}", rendered)
+        if progress_callback is not None:
+            progress_callback(n_pages)
+    
+    batches = _batches(pages, chunk_size)
+    initargs = (feature_list, dpi, footer)
+    try:
+        if workers == 1:
+            _init_worker(*initargs)
+            for batch in batches:
+                collect(batch, _render_pages(batch, task_format))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+                # 在途页面组数有上限，最早提交的一组完成就写出
+                pending = deque()
+                for batch in batches:
+                    pending.append((batch, pool.submit(_render_pages, batch, task_format)))
+                    if len(pending) >= max_pending:
+                        batch, future = pending.popleft()
+                        collect(batch, future.result())
+                while pending:
+                    batch, future = pending.popleft()
+                    collect(batch, future.result())
+    finally:
+        sink.close()
+    
+    elapsed = time.perf_counter() - started
+    summary = {"reports": n_pages, "rejected": int(issues["Row"].nunique()), "workers": workers,
+               "format": "multi-page pdf" if single_pdf else fmt, "predict_s": round(predict_seconds, 3),
+               "seconds": round(elapsed, 3), "pages_per_s": round(n_pages / max(elapsed, 1e-9), 2),
+               "bytes": os.path.getsize(output)}
+    return summary, issues
+
+
+def report_footer(model_path):
+    return f"Model: {os.path.basename(model_path)}  |  Generated: {date.today().isoformat()}"
@@ -0,0 +1,115 @@
+# =========================================================
+# 🔍 敏感性分析（what-if 扫描）
+# 固定其余输入，让一个或两个连续特征在 FEATURE_CONFIG 的取值范围内按网格变化，
+# 整张网格作为一次批量预测评分。
+# 森林只在分裂阈值处改变取值：落在同一阈值区间的网格点预测完全相同，
+# 因此每个特征只对不同的区间各取一个代表值评分，再映射回整张网格
+# =========================================================
+
+import numpy as np
+
+from rsf.core import (FEATURE_CONFIG, FEATURE_LABEL_MAP, SURVIVAL_HORIZONS, get_horizon_columns,
+                      predict_forest)
+from rsf.engine import FlatForest, compile_forest, prepare_features
+from rsf.metrics import METRICS
+
+SWEEP_POINTS = 100
+MAX_SWEEP_FEATURES = 2
+
+
+def continuous_features(feature_list):
+    """可以扫描的连续特征（FEATURE_CONFIG 中 type 为 number）"""
+    return [
+        feature_name for feature_name in feature_list
+        if not feature_name.endswith("_Yes")
+        and FEATURE_CONFIG.get(FEATURE_LABEL_MAP.get(feature_name, feature_name), {}).get("type") == "number"
+    ]
+
+
+def sweep_values(feature_name, n_points=SWEEP_POINTS):
+    """在 FEATURE_CONFIG 的 min/max 之间取 n_points 个点并按界面步长取整（去重后可能少于 n_points）"""
+    config = FEATURE_CONFIG[FEATURE_LABEL_MAP.get(feature_name, feature_name)]
+    low, high, step = config["min"], config["max"], config.get("step", 0.1)
+    values = np.round(np.linspace(low, high, n_points) / step) * step
+    return np.unique(np.clip(values, low, high))
+
+
+def split_thresholds(model, feature_index):
+    """某个特征在全森林中用到的分裂阈值（升序、去重）"""
+    thresholds = getattr(model, "thresholds", None)  # BinnedForest 已预先计算
+    if thresholds is not None:
+        return thresholds[feature_index]
+    forest = compile_forest(model)
+    internal = forest.leaf_index < 0
+    return np.unique(forest.threshold[internal & (forest.feature == feature_index)])
+
+
+def representative_values(values, thresholds):
+    """把网格值按阈值区间分组：返回 (每个区间的代表值, 每个网格值对应的代表值编号)
+    
+    与遍历规则一致（x <= threshold 走左子节点），比较在 float32 下进行。
+    """
+    bins = np.searchsorted(thresholds, values.astype(np.float32).astype(np.float64), side="left")
+    _, first, inverse = np.unique(bins, return_index=True, return_inverse=True)
+    return values[first], inverse.ravel()
+
+
+@METRICS.timed("sensitivity_sweep")
+def sensitivity_sweep(model, input_data, features, n_points=SWEEP_POINTS, values=None):
+    """对 1 个或 2 个特征做网格扫描，其余特征保持 input_data（单个患者）的取值
+    
+    values 可为每个特征指定网格，默认 sweep_values(feature, n_points)。
+    返回字典：
+        features             扫描的特征
+        values               每个特征的网格值
+        risk_score           风险评分，形状为网格形状
+        survival             1-4 年生存率，形状为网格形状 + (4,)
+        horizons             SURVIVAL_HORIZONS
+        grid_points          网格点数
+        rows_scored          去重后实际评分的行数
+    """
+    features = list(features)
+    if not 1 <= len(features) <= MAX_SWEEP_FEATURES:
+        raise ValueError(f"Sweep 1 to {MAX_SWEEP_FEATURES} features")
+    if len(set(features)) != len(features):
+        raise ValueError("Sweep features must be different")
+    
+    if not isinstance(model, FlatForest):
+        model = compile_forest(model)
+    feature_names = [str(f) for f in model.feature_names_in_]
+    base = prepare_features(model, input_data)[:1]
+    axes = [np.asarray(v, dtype=np.float64) for v in values] if values is not None \
+        else [sweep_values(f, n_points) for f in features]
+    
+    # 每个特征只保留不同阈值区间的代表值
+    columns, representatives, inverses = [], [], []
+    for feature_name, axis in zip(features, axes):
+        column = feature_names.index(feature_name)
+        rep, inverse = representative_values(axis, split_thresholds(model, column))
+        columns.append(column)
+        representatives.append(rep)
+        inverses.append(inverse)
+    
+    mesh = np.meshgrid(*representatives, indexing="ij")
+    X = np.repeat(base, mesh[0].size, axis=0)
+    for column, grid in zip(columns, mesh):
+        X[:, column] = grid.ravel()
+    
+    horizon_columns = get_horizon_columns(model.unique_times_, SURVIVAL_HORIZONS)
+    observed = horizon_columns >= 0
+    risk, surv, _ = predict_forest(model, X, time_index=horizon_columns[observed])
+    horizon_surv = np.ones((len(X), len(SURVIVAL_HORIZONS)))
+    horizon_surv[:, observed] = surv
+    
+    # 映射回完整网格
+    shape = tuple(len(rep) for rep in representatives)
+    index = np.ix_(*inverses)
+    return {
+        "features": features,
+        "values": axes,
+        "risk_score": risk.reshape(shape)[index],
+        "survival": horizon_surv.reshape(shape + (len(SURVIVAL_HORIZONS),))[index],
+        "horizons": list(SURVIVAL_HORIZONS),
+        "grid_points": int(np.prod([len(axis) for axis in axes])),
+        "rows_scored": int(len(X)),
+    }
@@ -0,0 +1,377 @@
+# =========================================================
+# 🌐 本地异步 HTTP 推理服务
+# 用法：python -m rsf serve --port 8600
+#
+#   POST /predict   {"patients": [{特征: 取值, ...}, ...]} 或单个患者对象
+#                   可选 "include_curve": true 同时返回完整生存曲线
+#   GET  /health    服务状态、批处理统计与本进程内存（预派生模式下为处理该连接的工作进程）
+#   GET  /metrics   Prometheus 文本格式的各阶段耗时、批处理与内存指标
+#
+# 在一个小时间窗内到达的并发请求合并为一次批量森林预测，再把结果分发回各请求
+# =========================================================
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from rsf import core
+from rsf.metrics import METRICS, process_memory
+
+MAX_BODY_BYTES = 16 * 2**20
+MAX_HEADER_LINES = 100
+
+HTTP_STATUS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class QueueFullError(Exception):
+    """等待队列已满"""
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, details=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.details = details
+
+# =========================================================
+# 📦 微批处理
+# =========================================================
+class MicroBatcher:
+    """把时间窗内到达的请求合并为一次向量化预测
+    
+    window_ms        第一个请求到达后最多再等待多久收集后续请求
+    max_batch_rows   单批最多的患者数；较大的请求切分为不超过该行数的片段，分批预测
+    max_queue        排队等待的片段数上限，超过时新请求直接拒绝
+    """
+    
+    def __init__(self, model, window_ms=5.0, max_batch_rows=1024, max_queue=1000):
+        self.model = model
+        self.window = window_ms / 1000.0
+        self.max_batch_rows = max_batch_rows
+        self.max_queue = max_queue
+        self.horizon_columns = core.get_horizon_columns(model.unique_times_, core.SURVIVAL_HORIZONS)
+        self._queue = None
+        self._task = None
+        # 预测在单独线程中串行执行，事件循环在此期间继续收集下一批
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rsf-predict")
+        self.batches = 0
+        self.rows = 0
+        self.requests = 0
+        self.rejected = 0
+    
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=False)
+    
+    @property
+    def queue_depth(self):
+        return 0 if self._queue is None else self._queue.qsize()
+    
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_rows": self.rows / self.batches if self.batches else 0.0,
+            "queue_depth": self.queue_depth,
+        }
+    
+    async def submit(self, features, include_curve=False):
+        """提交一组患者（已校验的特征数组，列顺序与模型一致），返回 (risk_scores, horizon_surv, surv 或 None)"""
+        loop = asyncio.get_running_loop()
+        parts = [features[start:start + self.max_batch_rows]
+                 for start in range(0, len(features), self.max_batch_rows)]
+        # 全部片段都能排队时才接受，避免请求只有一部分进入队列
+        if self.max_queue - self._queue.qsize() < len(parts):
+            self.rejected += 1
+            raise QueueFullError("Prediction queue is full")
+        futures = []
+        for part in parts:
+            future = loop.create_future()
+            self._queue.put_nowait((part, include_curve, future))
+            futures.append(future)
+        self.requests += 1
+        
+        results = await asyncio.gather(*futures)
+        if len(results) == 1:
+            return results[0]
+        risk_scores, horizon_surv, surv = zip(*results)
+        return (np.concatenate(risk_scores), np.concatenate(horizon_surv),
+                np.concatenate(surv) if include_curve else None)
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        carry = None
+        while True:
+            items = [carry if carry is not None else await self._queue.get()]
+            carry = None
+            n_rows = len(items[0][0])
+            deadline = loop.time() + self.window
+            
+            while n_rows < self.max_batch_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if n_rows + len(item[0]) > self.max_batch_rows:
+                    # 放不下的片段留作下一批的第一项，单批行数不超过上限
+                    carry = item
+                    break
+                items.append(item)
+                n_rows += len(item[0])
+            
+            try:
+                results = await loop.run_in_executor(self._executor, self._predict_batch, items)
+            except Exception as e:
+                for _, _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, _, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+    
+    @METRICS.timed("batch_predict")
+    def _predict_batch(self, items):
+        """合并所有请求做一次森林预测，再按请求切分结果"""
+        features = np.concatenate([item[0] for item in items])
+        include_curve = any(item[1] for item in items)
+        observed = self.horizon_columns >= 0
+        
+        if include_curve:
+            risk_scores, surv, _ = core.predict_forest(self.model, features)
+            horizon_surv = core.get_survival_probabilities(
+                self.model.unique_times_, surv, core.SURVIVAL_HORIZONS)
+        else:
+            risk_scores, observed_surv, _ = core.predict_forest(
+                self.model, features, time_index=self.horizon_columns[observed])
+            horizon_surv = np.ones((len(features), len(core.SURVIVAL_HORIZONS)))
+            horizon_surv[:, observed] = observed_surv
+            surv = None
+        
+        self.batches += 1
+        self.rows += len(features)
+        
+        results = []
+        start = 0
+        for item_features, item_curve, _ in items:
+            stop = start + len(item_features)
+            results.append((risk_scores[start:stop], horizon_surv[start:stop],
+                            surv[start:stop] if item_curve else None))
+            start = stop
+        return results
+
+# =========================================================
+# 🌐 HTTP 服务
+# =========================================================
+class InferenceServer:
+    """基于 asyncio 的最小 HTTP/1.1 服务（支持 keep-alive）"""
+    
+    def __init__(self, model, feature_list, window_ms=5.0, max_batch_rows=1024, max_queue=1000,
+                 max_patients_per_request=10000, worker=None):
+        self.model = model
+        self.worker = worker
+        # 按模型的特征顺序组装输入数组
+        feature_names = getattr(model, "feature_names_in_", None)
+        self.feature_list = list(feature_list) if feature_names is None else [str(f) for f in feature_names]
+        self.max_patients_per_request = max_patients_per_request
+        self.batcher = MicroBatcher(model, window_ms=window_ms, max_batch_rows=max_batch_rows,
+                                    max_queue=max_queue)
+        self.started_at = time.time()
+        for name in ("requests", "rejected", "batches", "rows", "queue_depth"):
+            METRICS.register_gauge(f"batcher_{name}", lambda name=name: self.batcher.stats()[name])
+        METRICS.register_gauge("process_proportional_memory_bytes", lambda: (process_memory() or {}).get("pss", 0))
+        METRICS.register_gauge("process_private_memory_bytes", lambda: (process_memory() or {}).get("private", 0))
+    
+    async def serve(self, host="127.0.0.1", port=8600, sock=None, ready_callback=None):
+        self.batcher.start()
+        if sock is not None:
+            server = await asyncio.start_server(self._handle_connection, sock=sock)
+        else:
+            server = await asyncio.start_server(self._handle_connection, host, port)
+        if ready_callback is not None:
+            ready_callback(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+    
+    # -----------------------------------------------------
+    # 路由
+    # -----------------------------------------------------
+    async def handle_request(self, method, path, body):
+        """返回 (状态码, JSON 对象)；/metrics 返回文本"""
+        path = path.split("?", 1)[0]
+        if path == "/health":
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            return 200, {"status": "ok", "uptime_s": round(time.time() - self.started_at, 1),
+                         "pid": os.getpid(), "worker": self.worker, "memory": process_memory(),
+                         "batching": self.batcher.stats()}
+        if path == "/metrics":
+            if method != "GET":
+                raise HTTPError(405, "Use GET")
+            return 200, METRICS.to_prometheus()
+        if path == "/predict":
+            if method != "POST":
+                raise HTTPError(405, "Use POST")
+            with METRICS.timer("http_predict"):
+                return 200, await self._predict(body)
+        raise HTTPError(404, f"No route for {path}")
+    
+    async def _predict(self, body):
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError:
+            raise HTTPError(400, "Body is not valid JSON")
+        
+        include_curve = False
+        if isinstance(payload, dict) and "patients" in payload:
+            include_curve = payload.get("include_curve", False)
+            if not isinstance(include_curve, bool):
+                raise HTTPError(400, "include_curve must be true or false")
+            patients = payload["patients"]
+        elif isinstance(payload, dict):
+            patients = [payload]
+        else:
+            patients = payload
+        if not isinstance(patients, list) or not patients or not all(isinstance(p, dict) for p in patients):
+            raise HTTPError(400, "Expected a patient object or {\"patients\": [...]}")
+        if len(patients) > self.max_patients_per_request:
+            raise HTTPError(413, f"At most {self.max_patients_per_request} patients per request")
+        
+        features, issues = core.validate_records(patients, self.feature_list)
+        if issues:
+            raise HTTPError(400, "Invalid patient values", issues)
+        
+        try:
+            risk_scores, horizon_surv, surv = await self.batcher.submit(features, include_curve)
+        except QueueFullError as e:
+            raise HTTPError(503, str(e))
+        
+        predictions = []
+        for i in range(len(risk_scores)):
+            prediction = {
+                "risk_score": float(risk_scores[i]),
+                "survival": {f"{year}y": float(horizon_surv[i, j])
+                             for j, year in enumerate(core.SURVIVAL_HORIZONS)},
+            }
+            if surv is not None:
+                prediction["curve"] = surv[i].tolist()
+            predictions.append(prediction)
+        
+        response = {"predictions": predictions}
+        if include_curve:
+            response["times"] = np.asarray(self.model.unique_times_).tolist()
+        return response
+    
+    # -----------------------------------------------------
+    # HTTP 协议
+    # -----------------------------------------------------
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._write_response(writer, 400, {"error": "Malformed request line"}, False)
+                    break
+                
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                
+                keep_alive = (version == "HTTP/1.1" and headers.get("connection", "").lower() != "close") \
+                    or headers.get("connection", "").lower() == "keep-alive"
+                
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._write_response(writer, 400, {"error": "Invalid Content-Length"}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._write_response(writer, 413, {"error": "Request body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                
+                try:
+                    status, payload = await self.handle_request(method.upper(), path, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": e.message}
+                    if e.details is not None:
+                        payload["details"] = e.details
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                
+                await self._write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _write_response(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+        head = (
+            f"HTTP/1.1 {status} {HTTP_STATUS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+def run_server(model, feature_list, host="127.0.0.1", port=8600, **options):
+    """启动服务直到进程被终止"""
+    server = InferenceServer(model, feature_list, **options)
+    
+    def announce(srv):
+        addresses = ", ".join(str(s.getsockname()) for s in srv.sockets)
+        print(f"serving on {addresses}", flush=True)
+    
+    try:
+        asyncio.run(server.serve(host, port, ready_callback=announce))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,153 @@
+# =========================================================
+# 🚀 启动与预热
+# sksurv、matplotlib、scipy.sparse、joblib 都在第一次使用时才导入，模块导入只需约 0.5 秒。
+# warm_up 在服务标记为就绪之前把这些一次性开销（导入、字体缓存、首次分配）
+# 集中付清：显式导入、一次假预测、一次绘图，使第一位用户的第一次点击不再变慢。
+# 每个阶段的耗时记入 StartupReport，同时以 startup_<阶段> 记入 METRICS
+# =========================================================
+
+import importlib
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from rsf import core
+from rsf.metrics import METRICS
+
+# 延迟导入的重量级依赖：阶段名 → 模块
+DEFERRED_IMPORTS = {
+    "import_scipy_sparse": "scipy.sparse",
+}
+# 生成生存曲线对象（StepFunction）时才需要
+CURVE_IMPORTS = {
+    "import_sksurv": "sksurv.functions",
+}
+RENDER_IMPORTS = {
+    "import_matplotlib": "matplotlib.backends.backend_agg",
+}
+
+
+def process_age():
+    """进程启动至今的秒数（读 /proc，精度为时钟滴答；非 Linux 返回 None）"""
+    try:
+        with open("/proc/self/stat") as f:
+            # 第 22 个字段为启动时刻（开机后的时钟滴答数）；进程名可能含空格，从 ")" 之后开始数
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+
+
+class StartupReport:
+    """启动各阶段的耗时（毫秒，按发生顺序）
+    
+    started_age          创建报告时进程已运行的秒数（解释器启动与模块导入）
+    ready_age            mark_ready() 时进程已运行的秒数
+    """
+    
+    def __init__(self):
+        self.phases = {}
+        self.started_age = process_age()
+        self.ready_age = None
+    
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed * 1000
+            METRICS.observe(f"startup_{name}", elapsed)
+    
+    def mark_ready(self):
+        self.ready_age = process_age()
+        return self
+    
+    @property
+    def total_ms(self):
+        return sum(self.phases.values())
+    
+    def as_dict(self):
+        return {
+            "phases_ms": {name: round(ms, 1) for name, ms in self.phases.items()},
+            "total_ms": round(self.total_ms, 1),
+            "process_age_at_start_s": None if self.started_age is None else round(self.started_age, 2),
+            "ready_after_s": None if self.ready_age is None else round(self.ready_age, 2),
+        }
+    
+    def format(self):
+        lines = []
+        if self.started_age is not None:
+            lines.append(f"{'interpreter + imports':<24} {self.started_age * 1000:9.1f} ms")
+        lines.extend(f"{name:<24} {ms:9.1f} ms" for name, ms in self.phases.items())
+        if self.ready_age is not None:
+            lines.append(f"{'ready after':<24} {self.ready_age * 1000:9.1f} ms")
+        return "\n".join(lines)
+
+
+def _timed_imports(report, imports):
+    """逐个导入尚未导入的模块并计时（已导入的不记录）"""
+    for name, module in imports.items():
+        if module not in sys.modules:
+            with report.phase(name):
+                importlib.import_module(module)
+
+
+def warm_up(model, feature_list=None, renderer=None, curves=True, report=None):
+    """服务就绪前的预热：导入延迟的依赖，做一次假预测；给出 renderer 时再绘制一次生存曲线
+    
+    假预测使用 core.synthetic_cohort 的 1 行数据。curves=True 时走与界面相同的 predict_survival；
+    curves=False 时只走数组路径 predict_forest（HTTP 服务），不导入 sksurv。
+    返回 StartupReport（传入 report 时在其上追加阶段）。
+    """
+    report = report or StartupReport()
+    curves = curves or renderer is not None
+    _timed_imports(report, DEFERRED_IMPORTS)
+    if curves:
+        _timed_imports(report, CURVE_IMPORTS)
+    if renderer is not None:
+        _timed_imports(report, RENDER_IMPORTS)
+    
+    X = core.synthetic_cohort(1, feature_list)
+    with report.phase("warmup_predict"):
+        if curves:
+            _, surv_func = core.predict_survival(model, X)
+        else:
+            core.predict_forest(model, X)
+    if renderer is not None:
+        with report.phase("warmup_render"):
+            renderer.render_png(surv_func)
+    return report
+
+
+def load_and_warm_up(model_path=None, feature_path=None, compile_model=None, curves=True, render=False):
+    """加载模型与特征列表、可选编译、预热，逐阶段计时
+    
+    compile_model(model) 把加载的模型转换为预测引擎（如 compile_forest），None 表示直接使用；
+    curves 与 render 见 warm_up。
+    返回 (引擎, 特征列表, StartupReport)；找不到模型时引擎为 None。
+    """
+    report = StartupReport()
+    with report.phase("load_model"):
+        model = core.load_model(model_path)
+    if model is None:
+        return None, None, report
+    with report.phase("load_feature_list"):
+        feature_list = core.load_feature_list(feature_path)
+    if compile_model is not None:
+        with report.phase("compile"):
+            model = compile_model(model)
+    
+    renderer = None
+    if render:
+        from rsf.plot import SurvivalCurveRenderer
+        
+        _timed_imports(report, RENDER_IMPORTS)
+        with report.phase("build_renderer"):
+            renderer = SurvivalCurveRenderer()
+    warm_up(model, feature_list, renderer=renderer, curves=curves, report=report)
+    return model, feature_list, report.mark_ready()
@@ -0,0 +1,257 @@
+# =========================================================
+# 🪶 蒸馏代理模型
+# 用法：python -m rsf distill --samples 200000 --max-depth 14 --min-leaf 20
+#
+# 在 FEATURE_CONFIG 的取值范围内随机抽样，以完整森林自身的预测为标签，
+# 拟合一棵浅的多输出回归树（目标为风险评分与 1-4 年生存率），
+# 每个叶节点的取值为落入该叶节点的样本在森林上的平均风险评分 / 累积风险 / 生存曲线。
+# 结果就是只有一棵树的 FlatForest：生存曲线单调、可直接用现有的引擎、绘图与 .flat 格式，
+# 单个患者预测只需一次约 14 层的遍历。
+# 森林不可用或超出延迟预算时，界面改用代理模型并明确标注为近似结果
+# =========================================================
+
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from rsf import core
+from rsf.artifact import is_flat_artifact, load_flat_forest, read_flat_metadata
+from rsf.engine import FlatForest, _sibling_order, compile_forest, prepare_features
+from rsf.metrics import METRICS
+
+SURROGATE_PATHS = [
+    "rsf_surrogate.flat",
+]
+DISTILL_SAMPLES = 200000
+DISTILL_MAX_DEPTH = 14
+DISTILL_MIN_LEAF = 20
+# 完整森林单次预测的延迟预算（秒）；0 表示不因延迟切换到代理模型
+LATENCY_BUDGET = float(os.environ.get("RSF_LATENCY_BUDGET_MS", "500")) / 1000
+
+
+# =========================================================
+# 🧪 蒸馏
+# =========================================================
+def _chunks(n_rows, chunk_size=core.BATCH_CHUNK_SIZE):
+    return (slice(start, start + chunk_size) for start in range(0, n_rows, chunk_size))
+
+
+def distill_forest(model, n_samples=DISTILL_SAMPLES, max_depth=DISTILL_MAX_DEPTH, min_samples_leaf=DISTILL_MIN_LEAF,
+                   dtype="float32", seed=0, feature_list=None):
+    """把 sksurv 模型或 FlatForest 蒸馏为单棵树的 FlatForest，返回 (代理模型, 统计)
+    
+    分两遍预测样本：第一遍只取风险评分与 1-4 年生存率作为拟合目标（各列标准化），
+    第二遍分块取完整曲线按叶节点求平均，不需要同时保存全部样本的整条曲线。
+    """
+    from scipy import sparse
+    from sklearn.tree import DecisionTreeRegressor
+    
+    forest = compile_forest(model)
+    if feature_list is None:
+        feature_list = [str(f) for f in getattr(forest, "feature_names_in_", core.load_feature_list())]
+    X = core.synthetic_cohort(n_samples, feature_list, seed=seed).to_numpy(dtype=np.float32)
+    
+    horizon_columns = core.get_horizon_columns(forest.unique_times_, core.SURVIVAL_HORIZONS)
+    observed = horizon_columns[horizon_columns >= 0]
+    started = time.perf_counter()
+    targets = np.empty((n_samples, 1 + len(observed)), dtype=np.float64)
+    for rows in _chunks(n_samples):
+        risk, surv, _ = forest.predict_arrays(X[rows], time_index=observed)
+        targets[rows, 0] = risk
+        targets[rows, 1:] = surv
+    scale = targets.std(axis=0)
+    targets /= np.where(scale > 0, scale, 1.0)
+    label_seconds = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    tree = DecisionTreeRegressor(max_depth=max_depth, min_samples_leaf=min_samples_leaf, random_state=seed)
+    tree.fit(X, targets)
+    fit_seconds = time.perf_counter() - started
+    
+    # 各叶节点上森林输出（风险评分、累积风险、生存概率，即 leaf_values 的全部列）的平均值
+    t = tree.tree_
+    sums = np.zeros((t.node_count, forest.leaf_values.shape[1]), dtype=np.float64)
+    for rows in _chunks(n_samples):
+        risk, surv, chf = forest.predict_arrays(X[rows])
+        nodes = tree.apply(X[rows])
+        membership = sparse.csr_matrix((np.ones(len(nodes)), (nodes, np.arange(len(nodes)))),
+                                       shape=(t.node_count, len(nodes)))
+        sums += membership @ np.column_stack([risk, chf, surv])
+    counts = np.bincount(tree.apply(X), minlength=t.node_count)
+    node_values = sums / np.maximum(counts, 1)[:, np.newaxis]
+    
+    surrogate = _flatten_tree(t, node_values.astype(dtype), forest)
+    summary = {"samples": int(n_samples), "max_depth": int(surrogate.max_depth), "min_samples_leaf": int(min_samples_leaf),
+               "nodes": int(surrogate.n_nodes), "leaves": int(surrogate.n_leaves), "dtype": dtype, "seed": int(seed),
+               "label_s": round(label_seconds, 2), "fit_s": round(fit_seconds, 2)}
+    return surrogate, summary
+
+
+def _flatten_tree(t, node_values, forest):
+    """把 sklearn 回归树（tree_）与各节点取值组装为单棵树的 FlatForest，时间轴与原森林相同"""
+    is_leaf = t.children_left == -1
+    order = _sibling_order(t.children_left, t.children_right)
+    new_id = np.empty(t.node_count, dtype=np.int32)
+    new_id[order] = np.arange(t.node_count, dtype=np.int32)
+    internal = ~is_leaf[order]
+    
+    feature = np.zeros(t.node_count, dtype=np.int32)
+    threshold = np.full(t.node_count, np.inf, dtype=np.float64)
+    feature[internal] = t.feature[order][internal]
+    threshold[internal] = t.threshold[order][internal]
+    nodes = np.arange(t.node_count, dtype=np.int32)
+    left = np.where(internal, new_id[np.where(internal, t.children_left[order], 0)], nodes).astype(np.int32)
+    right = np.where(internal, left + 1, nodes).astype(np.int32)
+    missing = getattr(t, "missing_go_to_left", None)
+    missing_left = (np.zeros(t.node_count, dtype=bool) if missing is None
+                    else np.asarray(missing, dtype=bool)[order])
+    
+    leaf_nodes = order[is_leaf[order]]
+    leaf_index = np.full(t.node_count, -1, dtype=np.int32)
+    leaf_index[new_id[leaf_nodes]] = np.arange(len(leaf_nodes), dtype=np.int32)
+    
+    return FlatForest(
+        feature=feature,
+        threshold=threshold,
+        left=left,
+        right=right,
+        missing_left=missing_left,
+        leaf_index=leaf_index,
+        roots=np.zeros(1, dtype=np.int32),
+        leaf_values=np.ascontiguousarray(node_values[leaf_nodes]),
+        unique_times=forest.unique_times_,
+        is_event_time=forest.is_event_time_,
+        n_features=forest.n_features_in_,
+        feature_names=getattr(forest, "feature_names_in_", None),
+        max_depth=t.max_depth,
+        node_cover=t.weighted_n_node_samples[order].astype(np.float64),
+    )
+
+
+def leaf_rows(surrogate, X):
+    """单棵树的预测：每个样本所在叶节点的整行 leaf_values（风险评分、累积风险、生存概率），不做树间聚合"""
+    return surrogate.leaf_values[surrogate.apply(X)[:, 0]]
+
+
+def _latency(predict, X, repeats=200):
+    """(单个患者预测耗时的中位数, 整批预测时每位患者的耗时)，单位为秒"""
+    timings = []
+    for i in range(repeats):
+        row = X[i % len(X):i % len(X) + 1]
+        started = time.perf_counter()
+        predict(row)
+        timings.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    predict(X)
+    return float(np.median(timings)), (time.perf_counter() - started) / len(X)
+
+
+def agreement_report(forest, surrogate, X):
+    """在独立的参考队列上对比森林与代理模型：1-4 年生存率差异、风险排序一致性与预测耗时"""
+    from rsf.compact import compare_predictions
+    
+    agreement = compare_predictions(forest, surrogate, X)
+    surv_forest = forest.predict_arrays(X)[1]
+    surv_surrogate = leaf_rows(surrogate, X)[:, 1 + surrogate.n_times:]
+    horizons_forest = core.get_survival_probabilities(forest.unique_times_, surv_forest, core.SURVIVAL_HORIZONS)
+    horizons_surrogate = core.get_survival_probabilities(surrogate.unique_times_, surv_surrogate,
+                                                         core.SURVIVAL_HORIZONS)
+    difference = np.abs(horizons_forest - horizons_surrogate)
+    for j, year in enumerate(core.SURVIVAL_HORIZONS):
+        agreement[f"survival_{year}y"]["p95_abs_diff"] = float(np.quantile(difference[:, j], 0.95))
+    agreement["mean_abs_diff"] = float(difference.mean())
+    
+    forest_single, forest_batch = _latency(forest.predict_arrays, X)
+    surrogate_single, surrogate_batch = _latency(lambda rows: leaf_rows(surrogate, rows), X)
+    return {
+        "reference_rows": int(len(X)),
+        "agreement": agreement,
+        "latency": {"forest_single_s": forest_single, "surrogate_single_s": surrogate_single,
+                    "forest_per_patient_s": forest_batch, "surrogate_per_patient_s": surrogate_batch},
+    }
+
+# =========================================================
+# 📦 加载与预测
+# =========================================================
+class SurrogateModel:
+    """加载后的代理模型
+    
+    engine               单棵树的 FlatForest
+    metadata             distill 写入的统计与对比结果（见 distill_forest、agreement_report）
+    """
+    
+    def __init__(self, engine, metadata=None, path=None):
+        self.engine = engine
+        self.metadata = metadata or {}
+        self.path = path
+    
+    @property
+    def feature_names(self):
+        return [str(f) for f in getattr(self.engine, "feature_names_in_", [])]
+    
+    @property
+    def mean_abs_diff(self):
+        """与完整森林在 1-4 年生存率上的平均绝对差，未知时为 None"""
+        return self.metadata.get("agreement", {}).get("mean_abs_diff")
+    
+    @METRICS.timed("surrogate_predict")
+    def predict_survival(self, input_data):
+        """单个患者：(风险评分, 单行 SurvivalMatrix)；单棵树只需取一个叶节点行，不做聚合"""
+        from rsf.survival import SurvivalMatrix
+        
+        forest = self.engine
+        X = prepare_features(forest, input_data)
+        row = leaf_rows(forest, X)[0]
+        METRICS.increment("surrogate_predictions")
+        return float(row[0]), SurvivalMatrix(forest.unique_times_, row[1 + forest.n_times:])
+
+
+def find_surrogate_path():
+    for path in SURROGATE_PATHS:
+        if is_flat_artifact(path):
+            return path
+    return None
+
+
+def load_surrogate(path=None):
+    """加载代理模型；未指定路径时依次查找 SURROGATE_PATHS，找不到返回 None"""
+    path = path or find_surrogate_path()
+    if path is None:
+        return None
+    return SurrogateModel(load_flat_forest(path), read_flat_metadata(path), path)
+
+# =========================================================
+# ⏱️ 延迟预算
+# =========================================================
+class LatencyGuard:
+    """按完整森林最近的预测耗时判断是否超出预算
+    
+    最近 window 次耗时的中位数超过 budget 时 should_use_surrogate() 返回 True；
+    超出期间每 probe_every 次仍让一次请求走完整森林，负载下降后自动恢复。线程安全，各会话共享。
+    """
+    
+    def __init__(self, budget=LATENCY_BUDGET, window=20, probe_every=10):
+        self.budget = budget
+        self.probe_every = probe_every
+        self._recent = deque(maxlen=window)
+        self._skipped = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def over_budget(self):
+        with self._lock:
+            return self.budget > 0 and bool(self._recent) and float(np.median(self._recent)) > self.budget
+    
+    def record(self, seconds):
+        with self._lock:
+            self._recent.append(seconds)
+    
+    def should_use_surrogate(self):
+        if not self.over_budget:
+            return False
+        with self._lock:
+            self._skipped += 1
+            return self._skipped % self.probe_every != 0
@@ -0,0 +1,260 @@
+# =========================================================
+# 📈 生存曲线矩阵
+# 一组患者的生存曲线：共享一条时间轴，生存概率存为连续的 float32 (患者 × 时间) 数组，
+# 而不是每位患者一个 StepFunction 对象。按多个时间点、多位患者一次向量化查询；
+# 按行切片返回视图，不复制数据；可写出 / 读回 Parquet（每个时间点一列）与 NPZ
+# =========================================================
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+from rsf.core import SURVIVAL_HORIZONS, get_survival_probabilities, predict_forest, step_function
+
+# Parquet 文件元数据中保存精确时间轴的键（列名中的时间只保留 6 位有效数字）
+PARQUET_TIMES_KEY = b"rsf.survival_times"
+INDEX_COLUMN = "row"
+# 写出 NPZ 时从临时文件拷贝的块大小
+NPZ_COPY_BYTES = 16 << 20
+
+
+def time_column_name(t):
+    return f"S({t:.6g})"
+
+
+class SurvivalMatrix:
+    """共享时间轴的生存曲线集合
+    
+    times                时间轴，形状 (n_times,)，float64，升序
+    values               生存概率，形状 (n, n_times)，C 连续，默认 float32
+    index                各行的编号（如队列中的行号），可为 None
+    
+    单行的矩阵也可以当作生存函数使用：x 为时间轴，y 为这一行的生存概率，
+    可直接传给 get_survival_probability 与 plot 中的绘图函数。
+    """
+    
+    def __init__(self, times, values, index=None, dtype=np.float32):
+        self.times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values)
+        if values.ndim == 1:
+            values = values[np.newaxis]
+        # 已是 C 连续的 dtype 时不复制（切片得到的行视图保持共享）
+        self.values = np.ascontiguousarray(values, dtype=dtype)
+        if self.values.shape[1] != len(self.times):
+            raise ValueError(f"values have {self.values.shape[1]} time points, times has {len(self.times)}")
+        self.index = None if index is None else np.asarray(index)
+    
+    @classmethod
+    def from_curve(cls, surv_func):
+        """由单个生存函数（StepFunction 或任何有 x、y 属性的对象）构造单行矩阵
+        
+        保留曲线原有的精度（不转为 float32），查询结果与 get_survival_probability 相同。
+        """
+        y = np.asarray(surv_func.y)
+        return cls(surv_func.x, y, dtype=y.dtype if y.dtype.kind == "f" else np.float64)
+    
+    def __len__(self):
+        return self.values.shape[0]
+    
+    @property
+    def shape(self):
+        return self.values.shape
+    
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.times.nbytes
+    
+    def __getitem__(self, key):
+        """按行选取：整数与切片返回共享数据的视图，整数数组与布尔数组返回副本"""
+        if isinstance(key, (int, np.integer)):
+            key = slice(key, key + 1 or None)
+        index = None if self.index is None else self.index[key]
+        return SurvivalMatrix(self.times, self.values[key], index, dtype=self.values.dtype)
+    
+    def __repr__(self):
+        return f"SurvivalMatrix({len(self)} patients x {len(self.times)} times)"
+    
+    # -----------------------------------------------------
+    # 单条曲线接口
+    # -----------------------------------------------------
+    @property
+    def x(self):
+        return self.times
+    
+    @property
+    def y(self):
+        if len(self) != 1:
+            raise ValueError("y is only defined for a single curve; select a row first")
+        return self.values[0]
+    
+    def step_function(self, row=0):
+        """第 row 位患者的 sksurv StepFunction"""
+        return step_function(self.times, self.values[row])
+    
+    # -----------------------------------------------------
+    # 查询
+    # -----------------------------------------------------
+    def at(self, horizons):
+        """全部患者在各时间点的生存概率，形状 (n, len(horizons))，float64
+        
+        与 get_survival_probability 的规则一致：早于或等于第一个时间点为 1，之后取左侧阶梯值。
+        """
+        return get_survival_probabilities(self.times, self.values, np.atleast_1d(horizons))
+    
+    def horizon_frame(self, horizons=SURVIVAL_HORIZONS):
+        """各时间点的生存概率表，列名为 survival_{年}y"""
+        import pandas as pd
+        
+        probabilities = self.at(horizons)
+        return pd.DataFrame({f"survival_{year:g}y": probabilities[:, j] for j, year in enumerate(horizons)},
+                            index=self.index)
+    
+    # -----------------------------------------------------
+    # 文件读写
+    # -----------------------------------------------------
+    def to_arrow(self):
+        """pyarrow.Table：index 为 row 列（有时），之后每个时间点一列，精确时间轴保存在元数据中"""
+        import pyarrow as pa
+        
+        columns, names = [], []
+        if self.index is not None:
+            columns.append(pa.array(self.index))
+            names.append(INDEX_COLUMN)
+        columns.extend(pa.array(self.values[:, j]) for j in range(len(self.times)))
+        names.extend(time_column_name(t) for t in self.times)
+        table = pa.Table.from_arrays(columns, names=names)
+        return table.replace_schema_metadata({PARQUET_TIMES_KEY: json.dumps(self.times.tolist()).encode()})
+    
+    @classmethod
+    def from_arrow(cls, table):
+        metadata = table.schema.metadata or {}
+        if PARQUET_TIMES_KEY not in metadata:
+            raise ValueError("Not a survival matrix table: survival times metadata is missing")
+        times = json.loads(metadata[PARQUET_TIMES_KEY])
+        index = table.column(INDEX_COLUMN).to_numpy() if INDEX_COLUMN in table.column_names else None
+        names = [time_column_name(t) for t in times]
+        values = np.empty((table.num_rows, len(times)), dtype=np.float32)
+        for j, name in enumerate(names):
+            values[:, j] = table.column(name).to_numpy()
+        return cls(times, values, index)
+    
+    def to_parquet(self, path):
+        import pyarrow.parquet as pq
+        
+        pq.write_table(self.to_arrow(), path)
+        return path
+    
+    @classmethod
+    def from_parquet(cls, path):
+        import pyarrow.parquet as pq
+        
+        return cls.from_arrow(pq.read_table(path))
+    
+    def to_npz(self, path, compressed=False):
+        arrays = {"times": self.times, "values": self.values}
+        if self.index is not None:
+            # 字符串编号存为定长 Unicode，读取时不需要 pickle
+            arrays["index"] = self.index.astype(str) if self.index.dtype == object else self.index
+        (np.savez_compressed if compressed else np.savez)(path, **arrays)
+        return path
+    
+    @classmethod
+    def from_npz(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["times"], data["values"], data["index"] if "index" in data.files else None)
+    
+    def save(self, path):
+        """按扩展名写出：.parquet / .pq 或 .npz"""
+        if path.lower().endswith((".parquet", ".pq")):
+            return self.to_parquet(path)
+        if path.lower().endswith(".npz"):
+            return self.to_npz(path)
+        raise ValueError(f"Unsupported survival matrix file: {path} (use .parquet or .npz)")
+    
+    @classmethod
+    def load(cls, path):
+        if path.lower().endswith((".parquet", ".pq")):
+            return cls.from_parquet(path)
+        if path.lower().endswith(".npz"):
+            return cls.from_npz(path)
+        raise ValueError(f"Unsupported survival matrix file: {path} (use .parquet or .npz)")
+
+
+class SurvivalMatrixWriter:
+    """按块追加写出生存曲线矩阵，内存中只保留当前块
+    
+    Parquet 每块写成一个行组。NPZ 不支持追加：生存概率按块写入输出目录下的临时文件，
+    close() 时补上 .npy 文件头，与时间轴、编号一起逐段拷贝进 ZIP（与 np.savez 的格式相同）；
+    只有各行编号（每行一个值）保留在内存中。
+    给出 times 时，没有写入任何行也会写出一个空矩阵。
+    """
+    
+    def __init__(self, path, times=None):
+        self.path = path
+        self.times = times
+        self.is_parquet = path.lower().endswith((".parquet", ".pq"))
+        if not self.is_parquet and not path.lower().endswith(".npz"):
+            raise ValueError(f"Unsupported survival matrix file: {path} (use .parquet or .npz)")
+        self._parquet_writer = None
+        self._values_file = None
+        self._rows = 0
+        self._index = []
+    
+    def write(self, matrix):
+        if self.is_parquet:
+            import pyarrow.parquet as pq
+            
+            table = matrix.to_arrow()
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+            return
+        
+        if self._values_file is None:
+            import tempfile
+            
+            self._values_file = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.path)))
+            self.times = matrix.times
+        self._values_file.write(np.ascontiguousarray(matrix.values, dtype=np.float32).tobytes())
+        self._rows += len(matrix)
+        self._index.append(matrix.index)
+    
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        elif self._values_file is not None:
+            try:
+                self._write_npz()
+            finally:
+                self._values_file.close()
+        elif self.times is not None:
+            SurvivalMatrix(self.times, np.empty((0, len(self.times)), dtype=np.float32), []).save(self.path)
+    
+    def _write_npz(self):
+        import zipfile
+        
+        arrays = [("times", np.asarray(self.times, dtype=np.float64))]
+        if self._index[0] is not None:
+            # 与 SurvivalMatrix.to_npz 相同：字符串编号存为定长 Unicode
+            index = np.concatenate(self._index)
+            arrays.append(("index", index.astype(str) if index.dtype == object else index))
+        header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)), "fortran_order": False,
+                  "shape": (self._rows, len(self.times))}
+        self._values_file.seek(0)
+        with zipfile.ZipFile(self.path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, array in arrays:
+                with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+                    np.lib.format.write_array(member, array, allow_pickle=False)
+            with archive.open("values.npy", "w", force_zip64=True) as member:
+                np.lib.format.write_array_header_1_0(member, header)
+                shutil.copyfileobj(self._values_file, member, NPZ_COPY_BYTES)
+
+
+def predict_survival_matrix(model, input_data, index=None):
+    """批量预测：返回 (风险评分, SurvivalMatrix)，时间轴为 model.unique_times_"""
+    risk_scores, surv, _ = predict_forest(model, input_data)
+    if index is None and hasattr(input_data, "index"):
+        index = np.asarray(input_data.index)
+    return risk_scores, SurvivalMatrix(model.unique_times_, surv, index)
@@ -0,0 +1,399 @@
+# =========================================================
+# ✅ 外部验证
+# 用法：python -m rsf validate cohort.csv --time-column time --event-column event --bootstrap 1000 --workers 8
+#
+# 在带随访时间与结局的队列上评估模型：Harrell C、Uno C、时间依赖 AUC、Brier 评分（1-4 年）与积分 Brier 评分，
+# 以及按预测生存率分组的校准。队列只预测一次，所有指标与 bootstrap 重复都复用同一个预测矩阵。
+# 一次 bootstrap 重复就是各患者被抽中的次数（权重），一批重复组成 (重复 × 患者) 的权重矩阵，
+# 各指标按权重计算并对整批重复向量化：C 指数用值为向量的树状数组（Fenwick 树），
+# AUC 用累积和，Brier 评分用矩阵乘法；各批重复在进程池中计算。
+# 权重全为 1 时与 sksurv.metrics 中的 concordance_index_censored / concordance_index_ipcw /
+# cumulative_dynamic_auc / brier_score / integrated_brier_score 一致（删失分布由验证队列自身估计）
+# =========================================================
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from rsf import core
+
+VALIDATION_BOOTSTRAP = 1000
+# 每个任务计算的 bootstrap 重复数
+BOOTSTRAP_CHUNK_SIZE = 50
+CONFIDENCE_LEVEL = 0.95
+IBS_GRID_POINTS = 100
+CALIBRATION_GROUPS = 10
+# 风险评分相差不超过该值视为并列（同 sksurv 的 tied_tol）
+TIED_TOL = 1e-8
+
+METRIC_LABELS = {
+    "harrell_c": "Harrell's C",
+    "uno_c": "Uno's C",
+    "auc": "Time-dependent AUC",
+    "brier": "Brier score",
+    "ibs": "Integrated Brier score",
+}
+# 按年份计算的指标；其余指标每次重复只有一个值
+HORIZON_METRICS = ("uno_c", "auc", "brier")
+
+
+def _dense_ranks(values, tied_tol=TIED_TOL):
+    """从 1 开始的秩，与前一个取值相差不超过 tied_tol 的取相同的秩"""
+    order = np.argsort(values, kind="stable")
+    starts = np.r_[True, np.diff(values[order]) > tied_tol]
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = np.cumsum(starts)
+    return ranks
+
+
+def _fenwick_paths(n_ranks):
+    """树状数组中每个秩（0..n_ranks）的更新路径与前缀和路径
+    
+    补齐为等长：更新路径的补位指向只写不读的 n_ranks + 1 行，前缀和路径的补位指向始终为 0 的第 0 行。
+    """
+    depth = int(n_ranks).bit_length() + 1
+    update = np.full((n_ranks + 1, depth), n_ranks + 1, dtype=np.int64)
+    prefix = np.zeros((n_ranks + 1, depth), dtype=np.int64)
+    up = np.arange(n_ranks + 1)
+    down = np.arange(n_ranks + 1)
+    for level in range(depth):
+        active = (up >= 1) & (up <= n_ranks)
+        update[active, level] = up[active]
+        up = np.where(active, up + (up & -up), up)
+        prefix[:, level] = down
+        down = down - (down & -down)
+    return update, prefix
+
+
+def kaplan_meier_at(time, event, t):
+    """Kaplan-Meier 生存率在时间 t 的估计及 Greenwood 方差，返回 (生存率, 方差)"""
+    times, inverse = np.unique(time, return_inverse=True)
+    deaths = np.bincount(inverse, weights=event.astype(np.float64), minlength=len(times))
+    at_risk = np.cumsum(np.bincount(inverse, minlength=len(times))[::-1])[::-1].astype(np.float64)
+    keep = times <= t
+    deaths, at_risk = deaths[keep], at_risk[keep]
+    survival = float(np.prod(1.0 - deaths / at_risk))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(deaths > 0, deaths / (at_risk * (at_risk - deaths)), 0.0)
+    return survival, survival ** 2 * float(terms.sum())
+
+# =========================================================
+# 📐 验证队列
+# =========================================================
+class ValidationSet:
+    """验证队列的随访数据与模型预测，构建一次后供点估计与所有 bootstrap 重复共用
+    
+    time, event          随访时间（年）与是否发生结局，形状 (n,)
+    risk                 风险评分，形状 (n,)
+    horizons             报告的年份；早于最短随访或不早于最长随访的年份无法评估，结果为 NaN
+    horizon_surv         各年份的预测生存概率，形状 (n, len(horizons))
+    grid                 积分 Brier 评分的时间网格：从最短随访到可评估的最后一个年份
+    
+    block_metrics(weights) 计算一批重复的全部指标，weights 为 (重复 × 患者) 的抽样次数。
+    """
+    
+    def __init__(self, time, event, risk, surv_times, surv_values, horizons=core.SURVIVAL_HORIZONS,
+                 grid_points=IBS_GRID_POINTS):
+        self.time = np.asarray(time, dtype=np.float64)
+        self.event = np.asarray(event, dtype=bool)
+        self.risk = np.asarray(risk, dtype=np.float64)
+        self.horizons = list(horizons)
+        self.n = len(self.time)
+        
+        t_min, t_max = self.time.min(), self.time.max()
+        self.valid_horizons = np.array([t_min <= h < t_max for h in self.horizons])
+        valid = np.asarray(self.horizons)[self.valid_horizons]
+        self.grid = np.linspace(t_min, valid.max(), grid_points) if len(valid) and valid.max() > t_min else None
+        
+        # 预测矩阵：可评估的年份在前，之后是积分网格
+        self.points = np.concatenate([valid, self.grid if self.grid is not None else []])
+        self.point_surv = (core.get_survival_probabilities(surv_times, surv_values, self.points) if len(self.points)
+                           else np.empty((self.n, 0)))
+        self.horizon_surv = np.full((self.n, len(self.horizons)), np.nan)
+        self.horizon_surv[:, self.valid_horizons] = self.point_surv[:, :len(valid)]
+        
+        # 按 (时间, 结局) 排序：同一时间点删失在前
+        self.order = np.lexsort((self.event, self.time))
+        sorted_time = self.time[self.order]
+        self.group_starts = np.flatnonzero(np.r_[True, np.diff(sorted_time) != 0])
+        self.unique_times = sorted_time[self.group_starts]
+        self.time_index = np.searchsorted(self.unique_times, self.time)
+        self.point_index = np.searchsorted(self.unique_times, self.points, side="right") - 1
+        
+        self.risk_rank = _dense_ranks(self.risk)
+        self.n_ranks = int(self.risk_rank.max())
+        self.fenwick_update, self.fenwick_prefix = _fenwick_paths(self.n_ranks)
+        self.event_rows = np.flatnonzero(self.event)
+        self._schedule = self._concordance_schedule()
+    
+    def summary(self):
+        return {"patients": int(self.n), "events": int(self.event.sum()),
+                "median_follow_up": float(np.median(self.time)), "max_follow_up": float(self.time.max()),
+                "horizons": self.horizons, "evaluated_horizons": [h for h, ok in zip(self.horizons, self.valid_horizons)
+                                                                  if ok]}
+    
+    # -----------------------------------------------------
+    # 删失分布
+    # -----------------------------------------------------
+    def censoring_survival(self, weights):
+        """各重复的删失分布 Kaplan-Meier 估计 G(t)，形状 (重复数, 不同时间点数)
+        
+        与 sksurv 的 CensoringDistributionEstimator 相同：同一时间点上结局先于删失。
+        """
+        sorted_weights = weights[:, self.order]
+        totals = np.add.reduceat(sorted_weights, self.group_starts, axis=1)
+        deaths = np.add.reduceat(sorted_weights * self.event[self.order], self.group_starts, axis=1)
+        censored = totals - deaths
+        at_risk = np.cumsum(totals[:, ::-1], axis=1)[:, ::-1] - deaths
+        ratio = np.divide(censored, at_risk, out=np.zeros_like(censored), where=censored > 0)
+        return np.cumprod(1.0 - ratio, axis=1)
+    
+    # -----------------------------------------------------
+    # C 指数
+    # -----------------------------------------------------
+    def _concordance_schedule(self):
+        """按时间从晚到早处理各时间点：(此前应加入树状数组的患者, 此时间点的结局患者)
+        
+        与结局患者 i 可比的是随访时间更长的患者，以及同一时间点删失的患者；
+        没有结局的时间点只需加入树状数组，与下一个有结局的时间点合并为一步。
+        """
+        schedule = []
+        pending = []
+        bounds = np.r_[self.group_starts, self.n]
+        for k in range(len(self.group_starts) - 1, -1, -1):
+            rows = self.order[bounds[k]:bounds[k + 1]]
+            events = rows[self.event[rows]]
+            pending.append(rows[~self.event[rows]])
+            if len(events):
+                schedule.append((np.concatenate(pending), events))
+                pending = [events]
+        return schedule
+    
+    def _concordance_counts(self, weights):
+        """对每个结局患者 i 与每个重复：可比患者中风险更低 / 并列的权重和，以及可比患者的权重和
+        
+        返回三个 (结局患者数, 重复数) 数组，行顺序同 event_rows。
+        """
+        columns = np.ascontiguousarray(weights.T)
+        n_replicates = weights.shape[0]
+        tree = np.zeros((self.n_ranks + 2, n_replicates))
+        inserted = np.zeros(n_replicates)
+        position = np.empty(self.n, dtype=np.int64)
+        position[self.event_rows] = np.arange(len(self.event_rows))
+        lower = np.empty((len(self.event_rows), n_replicates))
+        tied = np.empty_like(lower)
+        comparable = np.empty_like(lower)
+        depth = self.fenwick_update.shape[1]
+        
+        for insert, events in self._schedule:
+            if len(insert):
+                values = columns[insert]
+                np.add.at(tree, self.fenwick_update[self.risk_rank[insert]].ravel(), np.repeat(values, depth, axis=0))
+                inserted += values.sum(axis=0)
+            ranks = self.risk_rank[events]
+            below = tree[self.fenwick_prefix[ranks - 1]].sum(axis=1)
+            rows = position[events]
+            lower[rows] = below
+            tied[rows] = tree[self.fenwick_prefix[ranks]].sum(axis=1) - below
+            comparable[rows] = inserted
+        return lower, tied, comparable
+    
+    # -----------------------------------------------------
+    # 全部指标
+    # -----------------------------------------------------
+    def block_metrics(self, weights):
+        """一批重复的全部指标：harrell_c、ibs 形状 (重复数,)，uno_c、auc、brier 形状 (重复数, 年份数)"""
+        weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+        n_replicates = weights.shape[0]
+        G = self.censoring_survival(weights)
+        with np.errstate(divide="ignore"):
+            inverse_G = np.where(G > 0, 1.0 / G, 0.0)
+        inverse_G_patient = inverse_G[:, self.time_index]
+        
+        # Harrell C 与 Uno C
+        lower, tied, comparable = self._concordance_counts(weights)
+        event_weights = weights[:, self.event_rows].T
+        concordant = lower + 0.5 * tied
+        with np.errstate(divide="ignore", invalid="ignore"):
+            harrell = (event_weights * concordant).sum(axis=0) / (event_weights * comparable).sum(axis=0)
+        uno = np.full((n_replicates, len(self.horizons)), np.nan)
+        auc = np.full_like(uno, np.nan)
+        brier = np.full_like(uno, np.nan)
+        ipcw_sq = event_weights * inverse_G_patient[:, self.event_rows].T ** 2
+        event_time = self.time[self.event_rows]
+        
+        valid = np.flatnonzero(self.valid_horizons)
+        for j in valid:
+            h = self.horizons[j]
+            before = (event_time < h)[:, np.newaxis]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                uno[:, j] = (ipcw_sq * concordant * before).sum(axis=0) / (ipcw_sq * comparable * before).sum(axis=0)
+        
+        # 时间依赖 AUC：病例为 h 前发生结局者（按 1/G(t_i) 加权），对照为随访超过 h 者，标志物为 1 - S(h)
+        for p, j in enumerate(valid):
+            auc[:, j] = self._auc(weights, inverse_G_patient, p, self.horizons[j])
+        
+        # Brier 评分：两项都是 (重复 × 患者) 与 (患者 × 时间点) 的矩阵乘积
+        surv = self.point_surv
+        case = (self.time[:, np.newaxis] <= self.points) & self.event[:, np.newaxis]
+        control = self.time[:, np.newaxis] > self.points
+        scores = ((weights * inverse_G_patient) @ np.where(case, surv ** 2, 0.0)
+                  + (weights @ np.where(control, (1.0 - surv) ** 2, 0.0)) * inverse_G[:, self.point_index])
+        scores /= weights.sum(axis=1, keepdims=True)
+        brier[:, valid] = scores[:, :len(valid)]
+        if self.grid is not None:
+            # 梯形积分（np.trapezoid 需要 numpy 2）
+            curve = scores[:, len(valid):]
+            ibs = ((curve[:, 1:] + curve[:, :-1]) / 2 * np.diff(self.grid)).sum(axis=1) / (self.grid[-1] - self.grid[0])
+        else:
+            ibs = np.full(n_replicates, np.nan)
+        return {"harrell_c": harrell, "uno_c": uno, "auc": auc, "brier": brier, "ibs": ibs}
+    
+    def _auc(self, weights, inverse_G_patient, point, h):
+        marker_rank = _dense_ranks(1.0 - self.point_surv[:, point])
+        cases = np.flatnonzero((self.time <= h) & self.event)
+        controls = np.flatnonzero(self.time > h)
+        controls = controls[np.argsort(marker_rank[controls], kind="stable")]
+        control_ranks = marker_rank[controls]
+        starts = np.flatnonzero(np.r_[True, np.diff(control_ranks) != 0])
+        
+        histogram = np.zeros((weights.shape[0], int(marker_rank.max()) + 1))
+        histogram[:, control_ranks[starts]] = np.add.reduceat(weights[:, controls], starts, axis=1)
+        below = np.cumsum(histogram, axis=1)
+        case_ranks = marker_rank[cases]
+        case_weights = weights[:, cases] * inverse_G_patient[:, cases]
+        concordant = below[:, case_ranks - 1] + 0.5 * histogram[:, case_ranks]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (case_weights * concordant).sum(axis=1) / (case_weights.sum(axis=1) * below[:, -1])
+
+# =========================================================
+# 📂 读取验证队列
+# =========================================================
+def validation_set_from_cohort(model, cohort_df, feature_list, time_column, event_column,
+                               horizons=core.SURVIVAL_HORIZONS):
+    """校验特征与随访列并一次批量预测全部有效行，返回 (ValidationSet, 问题记录)
+    
+    随访时间为年，必须为非负数；结局接受 1/0 或 Yes/No。缺少随访列时抛出 ValueError。
+    """
+    missing = [c for c in (time_column, event_column) if c not in cohort_df.columns]
+    if missing:
+        raise ValueError(f"Missing follow-up columns: {', '.join(missing)}")
+    
+    features, issues = core.validate_cohort(cohort_df, feature_list)
+    time = pd.to_numeric(cohort_df[time_column], errors='coerce')
+    event = cohort_df[event_column].astype(str).str.strip().str.lower().map(core.BINARY_VALUES)
+    follow_up_issues = []
+    for column, bad, reason in [(time_column, time.isna() | (time < 0), "expected a follow-up time >= 0 (years)"),
+                                (event_column, event.isna(), "expected Yes/No or 1/0")]:
+        for row in cohort_df.index[bad.to_numpy()]:
+            follow_up_issues.append({"Row": row, "Column": column, "Value": cohort_df.at[row, column],
+                                     "Problem": reason})
+    if follow_up_issues:
+        issues = pd.concat([issues, pd.DataFrame(follow_up_issues)], ignore_index=True)
+    
+    follow_up_ok = time.notna() & (time >= 0) & event.notna()
+    rows = features.index[follow_up_ok.loc[features.index].to_numpy()]
+    if len(rows) < 2 or not event.loc[rows].any():
+        raise ValueError("Validation needs at least two valid rows and one event")
+    results, curves = core.score_cohort(model, features.loc[rows], return_curves=True)
+    validation = ValidationSet(time.loc[rows].to_numpy(), event.loc[rows].to_numpy() == 1.0,
+                               results["risk_score"].to_numpy(), curves.times, curves.values, horizons)
+    return validation, issues
+
+# =========================================================
+# 🔁 Bootstrap
+# =========================================================
+_worker_state = {}
+
+
+def _init_worker(validation):
+    """每个工作进程只接收一次验证队列与预测矩阵"""
+    _worker_state["validation"] = validation
+
+
+def bootstrap_weights(rng, n_replicates, n):
+    """n_replicates 次有放回抽样中各患者被抽中的次数，形状 (n_replicates, n)"""
+    draws = rng.integers(0, n, size=(n_replicates, n)) + (np.arange(n_replicates) * n)[:, np.newaxis]
+    return np.bincount(draws.ravel(), minlength=n_replicates * n).reshape(n_replicates, n).astype(np.float64)
+
+
+def _bootstrap_chunk(seed, n_replicates, validation=None):
+    # 进程池中取初始化时收到的验证队列；单进程时直接传入，不写全局状态（Streamlit 各会话在线程中并发运行）
+    if validation is None:
+        validation = _worker_state["validation"]
+    return validation.block_metrics(bootstrap_weights(np.random.default_rng(seed), n_replicates, validation.n))
+
+
+def bootstrap(validation, n_replicates=VALIDATION_BOOTSTRAP, workers=None, seed=0, chunk_size=BOOTSTRAP_CHUNK_SIZE,
+              progress_callback=None):
+    """在进程池中计算 n_replicates 次 bootstrap 重复的全部指标，返回与 block_metrics 相同结构的字典
+    
+    每批重复的随机数种子由 seed 派生，结果与工作进程数无关。progress_callback(done, total) 在每批完成后调用。
+    workers=1 时在当前进程中逐批计算，不启动进程池（app 中使用）。
+    """
+    sizes = [min(chunk_size, n_replicates - start) for start in range(0, n_replicates, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    workers = workers or os.cpu_count() or 1
+    blocks = []
+    
+    def collect(block):
+        blocks.append(block)
+        if progress_callback is not None:
+            progress_callback(sum(len(b["harrell_c"]) for b in blocks), n_replicates)
+    
+    if workers == 1:
+        for chunk_seed, size in zip(seeds, sizes):
+            collect(_bootstrap_chunk(chunk_seed, size, validation))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(validation,)) as pool:
+            for future in [pool.submit(_bootstrap_chunk, chunk_seed, size) for chunk_seed, size in zip(seeds, sizes)]:
+                collect(future.result())
+    return {name: np.concatenate([block[name] for block in blocks]) for name in METRIC_LABELS}
+
+
+# =========================================================
+# 📋 结果汇总
+# =========================================================
+def metrics_table(validation, replicates=None, level=CONFIDENCE_LEVEL):
+    """各指标的点估计与 bootstrap 百分位置信区间（没有重复时区间为 NaN）"""
+    estimate = validation.block_metrics(np.ones((1, validation.n)))
+    alpha = (1.0 - level) / 2
+    rows = []
+    for name, label in METRIC_LABELS.items():
+        horizons = validation.horizons if name in HORIZON_METRICS else [None]
+        for j, horizon in enumerate(horizons):
+            column = (slice(None), j) if horizon is not None else (slice(None),)
+            low = high = np.nan
+            if replicates is not None:
+                values = replicates[name][column]
+                values = values[np.isfinite(values)]
+                if len(values):
+                    low, high = np.quantile(values, [alpha, 1.0 - alpha])
+            rows.append({"metric": label, "horizon": horizon, "estimate": float(estimate[name][column][0]),
+                         "ci_low": float(low), "ci_high": float(high)})
+    return pd.DataFrame(rows, columns=["metric", "horizon", "estimate", "ci_low", "ci_high"])
+
+
+def calibration_table(validation, groups=CALIBRATION_GROUPS, level=CONFIDENCE_LEVEL):
+    """按各年份预测生存率分为 groups 组：组内平均预测生存率与 Kaplan-Meier 观察生存率（Greenwood 置信区间）"""
+    from scipy.stats import norm
+    
+    z = norm.ppf(0.5 + level / 2)
+    rows = []
+    for j, horizon in enumerate(validation.horizons):
+        if not validation.valid_horizons[j]:
+            continue
+        predicted = validation.horizon_surv[:, j]
+        for group, members in enumerate(np.array_split(np.argsort(predicted, kind="stable"), groups)):
+            if len(members) == 0:
+                continue
+            observed, variance = kaplan_meier_at(validation.time[members], validation.event[members], horizon)
+            half_width = z * np.sqrt(variance)
+            rows.append({"horizon": horizon, "group": group + 1, "patients": len(members),
+                         "predicted": float(predicted[members].mean()), "observed": observed,
+                         "observed_low": max(0.0, observed - half_width),
+                         "observed_high": min(1.0, observed + half_width)})
+    return pd.DataFrame(rows, columns=["horizon", "group", "patients", "predicted", "observed",
+                                       "observed_low", "observed_high"])
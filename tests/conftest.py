@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rsf import core
+
+
+@pytest.fixture(scope="session")
+def model():
+    model = core.load_model()
+    if model is None:
+        pytest.skip("model file not found")
+    return model
+
+
+@pytest.fixture(scope="session")
+def cohort_with_missing():
+    """随机队列，约 20% 的取值替换为 NaN"""
+    cohort = core.synthetic_cohort(500, seed=0)
+    values = cohort.to_numpy(dtype=np.float64).copy()
+    values[np.random.default_rng(0).random(values.shape) < 0.2] = np.nan
+    return pd.DataFrame(values, columns=cohort.columns)
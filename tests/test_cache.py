@@ -0,0 +1,59 @@
+import numpy as np
+
+from rsf import core
+from rsf.cache import PredictionCache
+from rsf.engine import compile_forest, prepare_features
+from rsf.incremental import IncrementalPredictor
+
+
+def _jittered(cohort, seed=0):
+    """在网格点上加上手动键入式的两位小数偏移"""
+    values = cohort.to_numpy(dtype=np.float64).copy()
+    values += np.round(np.random.default_rng(seed).uniform(-0.04, 0.04, values.shape), 2)
+    return cohort.__class__(values, columns=cohort.columns)
+
+
+def test_cached_predictions_match_fresh_predictions(model):
+    forest = compile_forest(model)
+    cache = PredictionCache(forest, model_digest="test")
+    cohort = core.synthetic_cohort(300, seed=0)
+    inputs = [cohort, _jittered(cohort)]
+    for _ in range(2):
+        for data in inputs:
+            risk, surv = cache.predict_arrays(data)
+            expected_risk, expected_surv, _ = core.predict_forest(forest, data)
+            np.testing.assert_array_equal(risk, expected_risk)
+            np.testing.assert_array_equal(surv, expected_surv)
+    assert cache.hits > 0
+    assert len(cache) <= len(cohort)
+
+
+def test_model_digest_is_part_of_the_key(model):
+    forest = compile_forest(model)
+    cohort = core.synthetic_cohort(5, seed=0)
+    first = PredictionCache(forest, model_digest="a")
+    second = PredictionCache(forest, model_digest="b")
+    first.predict_arrays(cohort)
+    second.predict_arrays(cohort)
+    assert not set(first._entries) & set(second._entries)
+
+
+def test_band_queries_share_the_cache(model):
+    forest = compile_forest(model)
+    cache = PredictionCache(forest, model_digest="test")
+    predictor = IncrementalPredictor(forest)
+    cohort = core.synthetic_cohort(20, seed=0)
+    for _ in range(2):
+        for i in range(len(cohort)):
+            row = cohort.iloc[i:i + 1]
+            risk_score, surv, leaves = cache.predict_with_leaves(row, predictor=predictor)
+            expected_leaves = forest.apply(prepare_features(forest, row))[0]
+            expected_risk, expected_surv = core.predict_survival(forest, row)
+            np.testing.assert_array_equal(leaves, expected_leaves)
+            assert risk_score == expected_risk
+            np.testing.assert_array_equal(surv.y, expected_surv.y)
+    assert cache.hits == len(cohort)
+    
+    # 带分位数带的查询写入的缓存项也供普通查询命中
+    risk_scores, _ = cache.predict_arrays(cohort)
+    assert cache.hits == 2 * len(cohort)
@@ -0,0 +1,19 @@
+import os
+
+from rsf import cli, core
+
+
+def test_check_engine_does_not_compare_flat_model_with_itself(model, tmp_path, capsys):
+    flat_path = str(tmp_path / "rsf_model.flat")
+    assert cli.main(["export", "--output", flat_path]) == 0
+    assert cli.main(["check-engine", "--model", flat_path, "--rows", "50"]) == 2
+    assert "FlatForest" in capsys.readouterr().err
+
+
+def test_reference_model_skips_flat_directory(model, tmp_path, monkeypatch):
+    model_path = os.path.abspath(core.find_model_path(include_flat=False))
+    flat_path = str(tmp_path / "rsf_model.flat")
+    cli.main(["export", "--model", model_path, "--output", flat_path])
+    monkeypatch.setattr(core, "MODEL_PATHS", [flat_path, model_path])
+    assert core.find_model_path() == flat_path
+    assert core.find_model_path(include_flat=False) == model_path
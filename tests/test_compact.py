@@ -0,0 +1,22 @@
+import os
+
+import numpy as np
+
+from rsf import compact, core
+from rsf.artifact import path_size, save_flat_forest
+from rsf.engine import compile_forest
+
+
+def test_report_uses_total_size_of_flat_directory(model, tmp_path):
+    forest = compile_forest(model)
+    flat_path = str(tmp_path / "rsf_model.flat")
+    save_flat_forest(forest, flat_path)
+    compact_path = str(tmp_path / "compact.joblib")
+    compacted, summary = compact.compact_forest(forest)
+    compact.save_compact(compacted, compact_path)
+    
+    X = core.synthetic_cohort(200, seed=1).to_numpy(dtype=np.float32)
+    report = compact.compaction_report(forest, compacted, X, flat_path, compact_path, summary)
+    files = [os.path.join(flat_path, name) for name in os.listdir(flat_path)]
+    assert report["size"]["original_bytes"] == sum(os.path.getsize(f) for f in files) > forest.nbytes // 2
+    assert path_size(compact_path) == os.path.getsize(compact_path)
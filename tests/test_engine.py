@@ -0,0 +1,30 @@
+import numpy as np
+
+from rsf import core
+from rsf.binned import build_binned_forest
+from rsf.engine import compare_with_sksurv, compile_forest, prepare_features
+
+
+def test_missing_values_reach_leaves(model, cohort_with_missing):
+    forest = compile_forest(model)
+    leaves = forest.apply(prepare_features(forest, cohort_with_missing))
+    assert (leaves >= 0).all()
+
+
+def test_missing_values_match_sksurv(model, cohort_with_missing):
+    differences = compare_with_sksurv(model, compile_forest(model), cohort_with_missing)
+    assert max(differences.values()) < 1e-10
+
+
+def test_single_missing_row_matches_sksurv(model, cohort_with_missing):
+    row = cohort_with_missing.iloc[:1].copy()
+    row.iloc[0, :] = np.nan
+    differences = compare_with_sksurv(model, compile_forest(model), row)
+    assert max(differences.values()) < 1e-10
+
+
+def test_binned_missing_values_match_sksurv(model, cohort_with_missing):
+    cohort = cohort_with_missing.copy()
+    cohort.iloc[1::2] = core.synthetic_cohort(len(cohort), seed=1).iloc[1::2].to_numpy()
+    differences = compare_with_sksurv(model, build_binned_forest(model), cohort)
+    assert max(differences.values()) < 1e-10
@@ -0,0 +1,21 @@
+import numpy as np
+
+from rsf import core
+from rsf.engine import compile_forest
+from rsf.incremental import IncrementalPredictor
+
+
+def test_incremental_matches_full_prediction(model):
+    forest = compile_forest(model)
+    predictor = IncrementalPredictor(forest)
+    cohort = core.synthetic_cohort(200, seed=0)
+    rng = np.random.default_rng(0)
+    row = cohort.iloc[:1].copy()
+    for _ in range(300):
+        # 每次只改动一两个特征，模拟界面上的逐项调整
+        for column in rng.choice(cohort.columns, size=rng.integers(1, 3), replace=False):
+            row[column] = cohort[column].iloc[rng.integers(len(cohort))]
+        risk_score, surv = predictor.predict_survival(row)
+        expected_risk, expected_surv = core.predict_survival(forest, row)
+        assert risk_score == expected_risk
+        np.testing.assert_array_equal(surv.y, expected_surv.y)
@@ -0,0 +1,89 @@
+import gc
+import json
+import os
+import shutil
+import weakref
+
+import pytest
+
+from rsf import core
+from rsf.artifact import save_flat_forest
+from rsf.cache import PredictionCache, combined_stats
+from rsf.engine import compile_forest
+from rsf.registry import REGISTRY_FILE, ModelRegistry
+
+
+@pytest.fixture(scope="module")
+def forest(model):
+    return compile_forest(model)
+
+
+def _add_version(directory, forest, name):
+    # meta.json 中的附加信息不同，各版本的内容摘要也不同
+    save_flat_forest(forest, os.path.join(directory, f"{name}.flat"), metadata={"name": name})
+
+
+def _set_aliases(directory, **aliases):
+    with open(os.path.join(directory, REGISTRY_FILE), "w", encoding="utf-8") as f:
+        json.dump(aliases, f)
+
+
+@pytest.fixture
+def model_dir(tmp_path, forest):
+    shutil.copy(core.FEATURE_LIST_PATHS[0], tmp_path / "selected_features.txt")
+    for name in ("a", "b", "c"):
+        _add_version(str(tmp_path), forest, name)
+    return str(tmp_path)
+
+
+def test_hot_swap_follows_production_alias(model_dir, forest):
+    _set_aliases(model_dir, production="a")
+    registry = ModelRegistry(model_dir, poll_interval=0.0)
+    loaded, arm = registry.model_for_session("session")
+    assert (loaded.version.stem, arm) == ("a", "production")
+    
+    # 改写别名后，同一会话在下一次请求时切换到新版本，不需要重启
+    _set_aliases(model_dir, production="b")
+    loaded, _ = registry.model_for_session("session")
+    assert loaded.version.stem == "b"
+    
+    # 新放入目录的模型在下一次扫描时出现
+    _add_version(model_dir, forest, "d")
+    _set_aliases(model_dir, production="d")
+    loaded, _ = registry.model_for_session("session")
+    assert loaded.version.stem == "d"
+    assert len(registry.versions) == 4
+
+
+def test_candidate_share_splits_sessions(model_dir):
+    _set_aliases(model_dir, production="a", candidate="b", candidate_share=0.5)
+    registry = ModelRegistry(model_dir, poll_interval=0.0)
+    arms = {registry.assign(f"session-{i}")[1] for i in range(50)}
+    assert arms == {"production", "candidate"}
+    assert registry.assign("session-1") == registry.assign("session-1")
+
+
+def test_lru_eviction_releases_versions_and_their_caches(model_dir, forest):
+    registry = ModelRegistry(model_dir, max_bytes=int(2.5 * forest.nbytes), poll_interval=0.0)
+    versions = {v.stem: v for v in registry.versions}
+    
+    first = registry.load(versions["a"])
+    first.resource("prediction_cache", lambda: PredictionCache(first.engine, first.version.digest))
+    first_ref = weakref.ref(first)
+    engine_ref = weakref.ref(first.engine)
+    registry.load(versions["b"])
+    registry.load(versions["a"])  # a 变为最近使用
+    registry.load(versions["c"])  # 超出上限，淘汰最久未用的 b
+    assert [loaded.version.stem for loaded in registry.loaded()] == ["a", "c"]
+    assert registry.loaded_bytes <= registry.max_bytes
+    
+    caches = [loaded.cached_resource("prediction_cache") for loaded in registry.loaded()]
+    assert combined_stats([cache for cache in caches if cache is not None])["entries"] == 0
+    del caches
+    
+    registry.load(versions["b"])
+    registry.load(versions["c"])  # 淘汰 a
+    del first
+    gc.collect()
+    assert first_ref() is None
+    assert engine_ref() is None
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import numpy as np
+
+from rsf import core
+from rsf.engine import compile_forest
+from rsf.service import InferenceServer, MicroBatcher
+
+
+def _exchange(model, requests):
+    """启动服务，在同一连接上依次发送原始请求，返回每个请求的 (状态码, 响应体)"""
+    async def run():
+        server = InferenceServer(compile_forest(model), core.load_feature_list())
+        ready = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(server.serve(port=0, ready_callback=ready.set_result))
+        srv = await ready
+        responses = []
+        try:
+            for request in requests:
+                reader, writer = await asyncio.open_connection(*srv.sockets[0].getsockname()[:2])
+                writer.write(request)
+                await writer.drain()
+                status = int((await reader.readline()).split()[1])
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers["content-length"]))
+                responses.append((status, json.loads(body)))
+                writer.close()
+        finally:
+            task.cancel()
+        return responses
+    
+    return asyncio.run(run())
+
+
+def _post(payload, content_length=None):
+    body = json.dumps(payload).encode("utf-8")
+    length = len(body) if content_length is None else content_length
+    return (f"POST /predict HTTP/1.1\r\nContent-Length: {length}\r\nConnection: close\r\n\r\n"
+            .encode("latin-1") + body)
+
+
+def _patient():
+    return core.synthetic_cohort(1, seed=0).iloc[0].to_dict()
+
+
+def test_invalid_content_length_is_rejected(model):
+    responses = _exchange(model, [_post(_patient(), "abc"), _post(_patient(), -5)])
+    assert [status for status, _ in responses] == [400, 400]
+
+
+def test_include_curve_must_be_boolean(model):
+    responses = _exchange(model, [
+        _post({"patients": [_patient()], "include_curve": "false"}),
+        _post({"patients": [_patient()], "include_curve": False}),
+        _post({"patients": [_patient()], "include_curve": True}),
+    ])
+    assert [status for status, _ in responses] == [400, 200, 200]
+    assert "curve" not in responses[1][1]["predictions"][0]
+    assert "curve" in responses[2][1]["predictions"][0]
+
+
+def test_batches_never_exceed_max_batch_rows(model):
+    forest = compile_forest(model)
+    features = core.synthetic_cohort(45, seed=0).to_numpy(dtype=np.float32)
+    batcher = MicroBatcher(forest, window_ms=20.0, max_batch_rows=8)
+    batch_rows = []
+    predict_batch = batcher._predict_batch
+    
+    def record(items):
+        batch_rows.append(sum(len(item[0]) for item in items))
+        return predict_batch(items)
+    
+    batcher._predict_batch = record
+    
+    async def run():
+        batcher.start()
+        try:
+            return await asyncio.gather(batcher.submit(features[:20], include_curve=True),
+                                        batcher.submit(features[20:23]),
+                                        batcher.submit(features[23:]))
+        finally:
+            await batcher.stop()
+    
+    results = asyncio.run(run())
+    assert max(batch_rows) <= 8
+    assert sum(batch_rows) == len(features)
+    risk_scores, surv, _ = core.predict_forest(forest, features)
+    np.testing.assert_allclose(np.concatenate([r[0] for r in results]), risk_scores, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(results[0][2], surv[:20], rtol=0, atol=1e-12)
+    assert results[1][2] is None
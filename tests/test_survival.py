@@ -0,0 +1,45 @@
+import numpy as np
+
+from rsf.core import step_function
+from rsf.survival import SurvivalMatrix, SurvivalMatrixWriter
+
+
+def _blocks(n_blocks=3, rows=40, n_times=25, seed=0):
+    rng = np.random.default_rng(seed)
+    times = np.sort(rng.uniform(0, 5, n_times))
+    for b in range(n_blocks):
+        values = np.sort(rng.random((rows, n_times)), axis=1)[:, ::-1]
+        yield SurvivalMatrix(times, values, [f"p{b}-{i}" for i in range(rows)])
+
+
+def test_chunked_npz_matches_single_write(tmp_path):
+    blocks = list(_blocks())
+    writer = SurvivalMatrixWriter(str(tmp_path / "curves.npz"))
+    for block in blocks:
+        writer.write(block)
+    writer.close()
+    
+    loaded = SurvivalMatrix.load(str(tmp_path / "curves.npz"))
+    np.testing.assert_array_equal(loaded.times, blocks[0].times)
+    np.testing.assert_array_equal(loaded.values, np.concatenate([b.values for b in blocks]))
+    assert list(loaded.index) == [i for b in blocks for i in b.index]
+
+
+def test_chunked_npz_without_index(tmp_path):
+    blocks = [SurvivalMatrix(b.times, b.values) for b in _blocks()]
+    writer = SurvivalMatrixWriter(str(tmp_path / "curves.npz"))
+    for block in blocks:
+        writer.write(block)
+    writer.close()
+    
+    loaded = SurvivalMatrix.load(str(tmp_path / "curves.npz"))
+    assert loaded.index is None
+    assert loaded.shape == (120, 25)
+
+
+def test_from_curve_keeps_float64():
+    y = np.array([1.0, 0.9, 0.81234567891, 0.5])
+    curve = SurvivalMatrix.from_curve(step_function(np.arange(4.0), y))
+    assert curve.values.dtype == np.float64
+    np.testing.assert_array_equal(curve.y, y)
+    assert curve[0].values.dtype == np.float64
@@ -0,0 +1,43 @@
+import threading
+
+import numpy as np
+
+from rsf import core
+from rsf.engine import compile_forest
+from rsf.validation import bootstrap, validation_set_from_cohort
+
+
+def _validation_set(model, seed):
+    cohort = core.synthetic_cohort(300, seed=seed)
+    rng = np.random.default_rng(seed)
+    cohort["time"] = np.round(rng.exponential(3.0, len(cohort)), 2) + 0.01
+    cohort["event"] = rng.integers(0, 2, len(cohort))
+    validation, _ = validation_set_from_cohort(compile_forest(model), cohort, core.load_feature_list(),
+                                               "time", "event")
+    return validation
+
+
+def test_bootstrap_does_not_depend_on_workers(model):
+    validation = _validation_set(model, 0)
+    single = bootstrap(validation, 40, workers=1, chunk_size=10)
+    pooled = bootstrap(validation, 40, workers=2, chunk_size=10)
+    for name in single:
+        np.testing.assert_array_equal(single[name], pooled[name])
+
+
+def test_concurrent_in_process_bootstraps_are_independent(model):
+    validations = [_validation_set(model, seed) for seed in (1, 2)]
+    expected = [bootstrap(v, 30, workers=1, chunk_size=5) for v in validations]
+    results = [None, None]
+    
+    def run(i):
+        results[i] = bootstrap(validations[i], 30, workers=1, chunk_size=5)
+    
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for result, reference in zip(results, expected):
+        for name in reference:
+            np.testing.assert_array_equal(result[name], reference[name])